@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Caché de adjuntos para el sistema de correos Tavolo Casa
+Cada archivo se lee y se codifica en base64 una sola vez por campaña
+"""
+
+import base64
+import logging
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional, Tuple
+
+if TYPE_CHECKING:
+    from email.mime.base import MIMEBase
+
+
+# base64.encodebytes parte la entrada en líneas de 57 bytes (76 caracteres
+# codificados); los bloques múltiplos de 57 se codifican por separado y se
+# concatenan sin alterar el resultado
+_ENCODE_CHUNK = 57 * 16 * 1024
+
+
+def _read_encoded(file_path: str, size: int, mmap_threshold: int) -> str:
+    """
+    Lee el archivo y lo devuelve en base64 con líneas de 76
+
+    Los archivos grandes se codifican por bloques desde un mmap, así que en
+    memoria solo coinciden el bloque en curso y el texto codificado.
+    """
+    with open(file_path, 'rb') as f:
+        if not size or size < mmap_threshold:
+            return base64.encodebytes(f.read()).decode('ascii')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return ''.join(base64.encodebytes(mapped[start:start + _ENCODE_CHUNK]).decode('ascii')
+                           for start in range(0, len(mapped), _ENCODE_CHUNK))
+
+
+def build_attachment_part(file_path: str, mmap_threshold: int = 8 * 1024 * 1024) -> "MIMEBase":
+    """
+    Construye la parte MIME de un adjunto
+
+    Produce las mismas cabeceras y el mismo cuerpo que MIMEBase +
+    encoders.encode_base64, pero leyendo el archivo una sola vez.
+    """
+    from email.mime.base import MIMEBase
+
+    size = os.path.getsize(file_path)
+    part = MIMEBase('application', 'octet-stream')
+    part.set_payload(_read_encoded(file_path, size, mmap_threshold))
+    part['Content-Transfer-Encoding'] = 'base64'
+    part.add_header(
+        'Content-Disposition',
+        f'attachment; filename= {os.path.basename(file_path)}'
+    )
+    return part
+
+
+class AttachmentCache:
+    """
+    Caché LRU de partes MIME de adjuntos ya codificadas
+
+    Las entradas se invalidan si el archivo cambia en disco (mtime o tamaño) y
+    la memoria total se limita a max_bytes de contenido codificado.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024,
+                 mmap_threshold: int = 8 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: Tamaño máximo total de los adjuntos codificados en caché
+            mmap_threshold: Tamaño a partir del cual se lee con mmap
+        """
+        self.max_bytes = max_bytes
+        self.mmap_threshold = mmap_threshold
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int], MIMEBase, int]]" = OrderedDict()
+        self._used = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: dict) -> "AttachmentCache":
+        """Crea la caché con los límites de email_settings"""
+        return cls(
+            max_bytes=int(settings.get('attachment_cache_mb', 64) * 1024 * 1024),
+            mmap_threshold=int(settings.get('attachment_mmap_threshold_mb', 8) * 1024 * 1024),
+        )
+
+    def get_part(self, file_path: str) -> Optional["MIMEBase"]:
+        """
+        Devuelve la parte MIME del adjunto, codificándolo solo si hace falta
+
+        Returns:
+            La parte MIME, o None si el archivo no existe
+        """
+        key = os.path.abspath(file_path)
+        try:
+            stat = os.stat(key)
+        except FileNotFoundError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        # Se codifica fuera del lock para no bloquear a otros hilos
+        part = build_attachment_part(file_path, self.mmap_threshold)
+        cost = len(part.get_payload())
+
+        with self._lock:
+            self.misses += 1
+            self._discard(key)
+            if cost > self.max_bytes:
+                logging.warning(f"Adjunto {file_path} supera el límite de la caché, no se guarda")
+                return part
+            self._entries[key] = (signature, part, cost)
+            self._used += cost
+            while self._used > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+        return part
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._used = 0
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._used -= entry[2]
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga de la lista de contactos
+Compara leer el CSV con csv.DictReader (un dict por fila) e indexarlo en
+SQLite en cada campaña con importarlo una vez al almacén columnar y leerlo
+con mmap. Cada caso se ejecuta en un proceso aparte para medir su memoria
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+FIRST_NAMES = ['Ana', 'Luis', 'María', 'José', 'Carmen', 'Javier', 'Lucía', 'Pablo', 'Elena', 'Diego']
+LAST_NAMES = ['García', 'López', 'Martínez', 'Sánchez', 'Pérez', 'Gómez', 'Ruiz', 'Díaz', '']
+DOMAINS = ['gmail.com', 'hotmail.com', 'outlook.com', 'yahoo.es', 'tavolocasa.com', 'empresa.es']
+
+CASES = [
+    ('csv', "load_email_list (csv.DictReader, un dict por fila)"),
+    ('index', "campaña: RecipientIndex.build + recorrido"),
+    ('import', "importación al almacén (una vez por versión del CSV)"),
+    ('store', "almacén ya importado: lista de registros con __slots__"),
+    ('store-iter', "campaña: almacén ya importado + recorrido"),
+]
+
+
+def write_list(path: str, rows: int, duplicates: float = 0.02):
+    """Lista sintética con nombres y empresas repetidos y un porcentaje de duplicados"""
+    rng = random.Random(42)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['email', 'nombre', 'apellido', 'empresa'])
+        for i in range(rows):
+            n = rng.randrange(i) if i and rng.random() < duplicates else i
+            writer.writerow([f'cliente{n}@{DOMAINS[n % len(DOMAINS)]}', rng.choice(FIRST_NAMES),
+                             rng.choice(LAST_NAMES), f'Empresa {n % 5000}'])
+
+
+def touch(contacts) -> int:
+    """Recorre los contactos leyendo los campos que usa la personalización"""
+    total = 0
+    for contact in contacts:
+        total += len(contact['email']) + len(contact.get('nombre', '')) + len(contact.get('empresa', ''))
+    return total
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_case(case: str, csv_file: str, settings: dict) -> dict:
+    """Ejecuta un caso en este proceso (lo llama el proceso hijo)"""
+    from contact_store import ContactStore
+    from email_sender import TavoloCasaEmailSender
+    from recipient_index import RecipientIndex
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if case == 'csv':
+        contacts = list(TavoloCasaEmailSender.iter_email_list(None, csv_file))
+        count = len(contacts)
+    elif case == 'index':
+        with RecipientIndex.build(csv_file) as index:
+            count = len(index)
+            touch(index.iter_contacts())
+    elif case == 'import':
+        with ContactStore.build(csv_file, ContactStore.path_for(csv_file, settings)) as store:
+            count = len(store)
+    elif case == 'store':
+        with ContactStore.for_csv(csv_file, settings) as store:
+            contacts = list(store)
+            count = len(contacts)
+    else:
+        with ContactStore.for_csv(csv_file, settings) as store:
+            count = len(store)
+            touch(store.iter_contacts())
+    seconds = time.perf_counter() - start
+    return {'case': case, 'seconds': seconds, 'contacts': count,
+            'rss_mb': peak_rss_mb() - baseline}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga de la lista: CSV frente a almacén columnar")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--child', nargs=3, metavar=('CASO', 'CSV', 'DIRECTORIO'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        import logging
+        logging.disable(logging.INFO)
+        case, csv_file, store_dir = args.child
+        print(json.dumps(run_case(case, csv_file, {'contact_store_dir': store_dir})))
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_file = os.path.join(workdir, 'lista_correos.csv')
+        start = time.perf_counter()
+        write_list(csv_file, args.rows)
+        print(f"Lista sintética: {args.rows:,} filas, {os.path.getsize(csv_file) / 1e6:.1f} MB "
+              f"({time.perf_counter() - start:.1f} s)")
+
+        results = {}
+        for case, label in CASES:
+            output = subprocess.run(
+                [sys.executable, __file__, '--child', case, csv_file, workdir],
+                check=True, capture_output=True, text=True).stdout
+            results[case] = json.loads(output.strip().splitlines()[-1])
+            result = results[case]
+            print(f"  {label:<55}{result['seconds']:>7.2f} s  {result['rss_mb']:>7.0f} MB  "
+                  f"({result['contacts']:,} contactos)")
+
+        store_file = next(Path(workdir).glob('*.contactos'))
+        print(f"  Archivo del almacén: {store_file.stat().st_size / 1e6:.1f} MB (mapeado, compartido "
+              f"entre procesos)")
+        print(f"  Carga de la lista:   x{results['csv']['seconds'] / results['store']['seconds']:.1f} "
+              f"más rápida, {results['csv']['rss_mb'] / max(results['store']['rss_mb'], 1):.1f}x menos memoria")
+        print(f"  Preparación de una campaña: "
+              f"x{results['index']['seconds'] / results['store-iter']['seconds']:.1f} más rápida")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Benchmark de construcción de mensajes
+Compara create_message() + as_string() con el esqueleto pre-serializado,
+comprueba que ambos producen exactamente los mismos bytes y mide el coste
+de añadir la alternativa de texto plano y las imágenes incrustadas
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from email_sender import TavoloCasaEmailSender  # noqa: E402
+from html_text import html_to_text  # noqa: E402
+from inline_images import InlineImageStore  # noqa: E402
+from message_builder import MessageSkeleton, to_wire  # noqa: E402
+
+SUBJECT = "🛏️ Descubre el mejor descanso con Tavolo Casa - Ofertas especiales"
+CONFIG = {
+    "sender_email": "info@tavolocasa.com",
+    "sender_name": "Tavolo Casa",
+    "sender_password": "",
+    "smtp_server": "127.0.0.1",
+    "smtp_port": 25,
+    "email_settings": {},
+}
+
+
+def make_sender(workdir):
+    config_file = os.path.join(workdir, 'config.json')
+    with open(config_file, 'w', encoding='utf-8') as f:
+        json.dump(CONFIG, f)
+    return TavoloCasaEmailSender(config_file)
+
+
+def check_identical(sender, template, attachments, text_template=None, images=()):
+    """Verifica byte a byte la ruta rápida contra la ruta MIME completa"""
+    skeleton = MessageSkeleton.build(sender.create_message, SUBJECT, attachments,
+                                     plain_text=text_template is not None, inline_images=images)
+    samples = [
+        {'email': 'ana@example.com', 'nombre': 'Ana', 'apellido': 'López', 'empresa': 'ACME'},
+        {'email': 'x' * 120 + '@example.com', 'nombre': 'José Ñandú 🛏️', 'apellido': '', 'empresa': ''},
+        {'email': 'b@example.com', 'nombre': '.\r\nlínea', 'apellido': '', 'empresa': ''},
+    ]
+    for contact in samples:
+        html = sender.personalize_email(template, contact)
+        text = text_template.render(contact) if text_template is not None else None
+        message = sender.create_message(contact['email'], SUBJECT, html, attachments, text,
+                                        list(images) or None)
+        multiparts = [part for part in message.walk() if part.is_multipart()]
+        for part, boundary in zip(multiparts, skeleton.boundaries):
+            part.set_boundary(boundary)
+        if to_wire(message.as_string()) != skeleton.render(contact['email'], html, text):
+            raise SystemExit(f"❌ La ruta rápida difiere para {contact['email']}")
+
+
+def measure(build, contacts, template, sender):
+    rendered = [(c['email'], sender.personalize_email(template, c)) for c in contacts]
+    start = time.perf_counter()
+    for email, html in rendered:
+        build(email, html)
+    return len(rendered) / (time.perf_counter() - start)
+
+
+def per_message(build, contacts):
+    """Microsegundos por mensaje (personalización incluida)"""
+    start = time.perf_counter()
+    for contact in contacts:
+        build(contact)
+    return (time.perf_counter() - start) / len(contacts) * 1e6
+
+
+def plain_text_overhead(sender, source, contacts):
+    """Coste añadido por la alternativa text/plain sobre la ruta rápida"""
+    template = sender.compile_template(source)
+    start = time.perf_counter()
+    text_template = sender.compile_template(html_to_text(source))
+    conversion = time.perf_counter() - start
+    check_identical(sender, template, [], text_template)
+
+    html_only = MessageSkeleton.build(sender.create_message, SUBJECT)
+    with_text = MessageSkeleton.build(sender.create_message, SUBJECT, plain_text=True)
+
+    def html_message(contact):
+        return html_only.render(contact['email'], template.render(contact))
+
+    def compiled_text(contact):
+        return with_text.render(contact['email'], template.render(contact), text_template.render(contact))
+
+    def converted_per_contact(contact):
+        html = template.render(contact)
+        return with_text.render(contact['email'], html, html_to_text(html))
+
+    base = per_message(html_message, contacts)
+    compiled = per_message(compiled_text, contacts)
+    converted = per_message(converted_per_contact, contacts[:max(1, len(contacts) // 10)])
+    print("[texto plano] bytes idénticos ✅")
+    print(f"  conversión HTML→texto (una vez por plantilla): {conversion * 1000:.2f} ms")
+    print(f"  {'solo HTML:':<34}{base:>8.1f} µs/mensaje")
+    print(f"  {'HTML + texto compilado:':<34}{compiled:>8.1f} µs/mensaje  "
+          f"(+{compiled - base:.1f} µs, +{(compiled / base - 1) * 100:.0f}%)")
+    print(f"  {'HTML + html_to_text por contacto:':<34}{converted:>8.1f} µs/mensaje")
+
+
+def inline_images_overhead(sender, workdir, contacts, image_kb):
+    """Imágenes cid: codificadas una vez frente a leerlas y codificarlas por destinatario"""
+    from email.mime.image import MIMEImage
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    image_file = os.path.join(workdir, 'producto.jpg')
+    with open(image_file, 'wb') as f:
+        f.write(b'\xff\xd8\xff\xe0' + os.urandom(image_kb * 1024))
+    source = '<p>Hola {{NOMBRE}}</p><img src="producto.jpg" alt="Producto">'
+
+    store = InlineImageStore(max_width=0, quality=0)
+    start = time.perf_counter()
+    html, images = store.embed(source, workdir)
+    embedding = time.perf_counter() - start
+    template = sender.compile_template(html)
+    check_identical(sender, template, [], images=images)
+    skeleton = MessageSkeleton.build(sender.create_message, SUBJECT, inline_images=images)
+
+    def cached(contact):
+        return skeleton.render(contact['email'], template.render(contact))
+
+    def naive(contact):
+        message = sender.create_message(contact['email'], SUBJECT, '')
+        related = MIMEMultipart('related')
+        related.attach(MIMEText(template.render(contact), 'html', 'utf-8'))
+        with open(image_file, 'rb') as f:
+            image = MIMEImage(f.read(), 'jpeg')
+        image['Content-ID'] = f'<{images[0].cid}>'
+        related.attach(image)
+        message.set_payload([related])
+        return to_wire(message.as_string())
+
+    after = per_message(cached, contacts)
+    before = per_message(naive, contacts[:max(1, len(contacts) // 10)])
+    print(f"[imagen incrustada de {image_kb} KB] bytes idénticos ✅")
+    print(f"  lectura y codificación (una vez por plantilla): {embedding * 1000:.2f} ms")
+    print(f"  {'imagen codificada por destinatario:':<37}{before:>8.1f} µs/mensaje")
+    print(f"  {'imagen en el esqueleto:':<37}{after:>8.1f} µs/mensaje  (x{before / after:.1f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mensajes construidos por segundo")
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--attachment-kb', type=int, default=512,
+                        help="Tamaño del adjunto sintético (0 = sin adjunto)")
+    parser.add_argument('--image-kb', type=int, default=64,
+                        help="Tamaño de la imagen incrustada sintética (0 = sin imagen)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        sender = make_sender(workdir)
+        template = sender.compile_template(
+            (ROOT / "plantilla_correo.html").read_text(encoding='utf-8'))
+        contacts = [
+            {'email': f'cliente{i}@example.com', 'nombre': f'Nombre{i}',
+             'apellido': 'Apellido', 'empresa': 'Empresa'}
+            for i in range(args.messages)
+        ]
+
+        scenarios = [('sin adjuntos', [])]
+        if args.attachment_kb:
+            attachment = os.path.join(workdir, 'catalogo.pdf')
+            with open(attachment, 'wb') as f:
+                f.write(os.urandom(args.attachment_kb * 1024))
+            scenarios.append((f'adjunto de {args.attachment_kb} KB', [attachment]))
+
+        for name, attachments in scenarios:
+            check_identical(sender, template, attachments)
+            skeleton = MessageSkeleton.build(sender.create_message, SUBJECT, attachments)
+
+            def slow(email, html):
+                return to_wire(sender.create_message(email, SUBJECT, html, attachments).as_string())
+
+            count = max(1, args.messages // 10) if attachments else args.messages
+            before = measure(slow, contacts[:count], template, sender)
+            after = measure(skeleton.render, contacts, template, sender)
+            print(f"[{name}] bytes idénticos ✅")
+            print(f"  create_message + as_string: {before:>10,.0f} mensajes/s")
+            print(f"  esqueleto pre-serializado:  {after:>10,.0f} mensajes/s  (x{after / before:.1f})")
+
+        plain_text_overhead(sender, (ROOT / "plantilla_correo.html").read_text(encoding='utf-8'), contacts)
+        if args.image_kb:
+            inline_images_overhead(sender, workdir, contacts, args.image_kb)
+
+
+if __name__ == "__main__":
+    main()
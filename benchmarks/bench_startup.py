@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark de arranque de los puntos de entrada
+Mide el tiempo total de cada comando habitual y, con -X importtime, cuánto
+cuesta importar cada módulo antes de enviar nada
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CONTACTS = 5
+
+
+def write_campaign(workdir: str):
+    """Configuración y lista mínimas para una simulación (no conecta con ningún servidor)"""
+    config = {
+        'sender_email': 'ventas@tavolocasa.com',
+        'sender_name': 'Tavolo Casa',
+        'sender_password': '',
+        'smtp_server': '127.0.0.1',
+        'smtp_port': 2525,
+        'email_settings': {'metrics_file': '', 'suppression_db': ''},
+    }
+    with open(os.path.join(workdir, 'config.json'), 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    with open(os.path.join(workdir, 'lista.csv'), 'w', encoding='utf-8') as f:
+        f.write('email,nombre,apellido,empresa\n')
+        for i in range(CONTACTS):
+            f.write(f'cliente{i}@example.com,Nombre{i},Apellido,Empresa\n')
+
+
+def commands(workdir: str):
+    sender = str(ROOT / 'email_sender.py')
+    return [
+        ('import email_sender', ['-c', 'import email_sender']),
+        ('email_sender.py --help', [sender, '--help']),
+        ('setup.py (importar)', ['-c', 'import setup']),
+        ('envío puntual (importar)', ['-c', 'import email_sender, smtp_pool; '
+                                            'email_sender.TavoloCasaEmailSender().create_message('
+                                            '"a@example.com", "Asunto", "<p>Hola</p>")']),
+        (f'--dry-run de {CONTACTS} contactos', [sender, '--csv', 'lista.csv', '--template',
+                                                 str(ROOT / 'plantilla_correo.html'), '--dry-run']),
+    ]
+
+
+def parse_importtime(stderr: str):
+    """(microsegundos de importación totales, [(acumulado, módulo)] de primer nivel)"""
+    top_level = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):
+            top_level.append((int(cumulative), name.strip()))
+    return sum(us for us, _ in top_level), sorted(top_level, reverse=True)
+
+
+def run(argv, workdir: str, importtime: bool = False):
+    env = {**os.environ, 'PYTHONPATH': str(ROOT), 'PYTHONDONTWRITEBYTECODE': '1'}
+    flags = ['-X', 'importtime'] if importtime else []
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *flags, *argv], cwd=workdir, env=env,
+                            capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode not in (0, 2):
+        raise RuntimeError(f"{' '.join(argv)} terminó con código {result.returncode}:\n{result.stderr}")
+    return elapsed, result.stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de arranque de los puntos de entrada")
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--top', type=int, default=5, help="Módulos más caros a mostrar por comando")
+    parser.add_argument('--output', default=None, help="Guardar los resultados en JSON")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        write_campaign(workdir)
+        for name, argv in commands(workdir):
+            run(argv, workdir)  # calentar la caché de bytecode y del sistema de archivos
+            times = [run(argv, workdir)[0] for _ in range(args.repeat)]
+            import_us, modules = parse_importtime(run(argv, workdir, importtime=True)[1])
+            results.append({
+                'command': name,
+                'wall_ms_median': round(statistics.median(times) * 1000, 1),
+                'wall_ms_min': round(min(times) * 1000, 1),
+                'import_ms': round(import_us / 1000, 1),
+                'top_imports': [{'module': module, 'ms': round(us / 1000, 1)}
+                                for us, module in modules[:args.top]],
+            })
+
+    for result in results:
+        print(f"{result['command']:<28} mediana {result['wall_ms_median']:>7.1f} ms  "
+              f"mín {result['wall_ms_min']:>7.1f} ms  importaciones {result['import_ms']:>6.1f} ms")
+        print("    " + ", ".join(f"{item['module']} {item['ms']:.1f}" for item in result['top_imports']))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
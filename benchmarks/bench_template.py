@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark del renderizado de plantillas
+Compara personalize_email original (str.replace) con la plantilla compilada
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from template_engine import CompiledTemplate, campaign_variables  # noqa: E402
+
+TEMPLATE_FILE = Path(__file__).resolve().parent.parent / "plantilla_correo.html"
+
+
+def legacy_personalize(template, contact):
+    """Implementación original: seis str.replace sobre todo el HTML por contacto"""
+    variables = {
+        '{{NOMBRE}}': contact.get('nombre', 'Estimado/a cliente'),
+        '{{APELLIDO}}': contact.get('apellido', ''),
+        '{{EMPRESA}}': contact.get('empresa', ''),
+        '{{NOMBRE_COMPLETO}}': f"{contact.get('nombre', '')} {contact.get('apellido', '')}".strip(),
+        '{{FECHA}}': datetime.now().strftime('%d de %B de %Y'),
+        '{{AÑO}}': str(datetime.now().year)
+    }
+    personalized = template
+    for placeholder, value in variables.items():
+        personalized = personalized.replace(placeholder, value)
+    return personalized
+
+
+def measure(render, contacts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for contact in contacts:
+            render(contact)
+    elapsed = time.perf_counter() - start
+    return len(contacts) * repeat / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Renders/s de la plantilla de correo")
+    parser.add_argument('--template', default=str(TEMPLATE_FILE))
+    parser.add_argument('--contacts', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    template = Path(args.template).read_text(encoding='utf-8')
+    contacts = [
+        {'email': f'cliente{i}@example.com', 'nombre': f'Nombre{i}',
+         'apellido': f'Apellido{i}', 'empresa': f'Empresa {i % 50}'}
+        for i in range(args.contacts)
+    ]
+
+    compiled = CompiledTemplate.compile(template, args.template).bind(campaign_variables())
+    for contact in contacts[:10]:
+        assert compiled.render(contact) == legacy_personalize(template, contact)
+
+    before = measure(lambda c: legacy_personalize(template, c), contacts, args.repeat)
+    after = measure(compiled.render, contacts, args.repeat)
+
+    print(f"Plantilla: {args.template} ({len(template)} caracteres)")
+    print(f"str.replace (original): {before:>12,.0f} renders/s")
+    print(f"Plantilla compilada:    {after:>12,.0f} renders/s")
+    print(f"Mejora: x{after / before:.1f}")
+
+
+if __name__ == "__main__":
+    main()
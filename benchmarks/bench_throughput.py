@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Benchmark de rendimiento del envío masivo contra un sumidero SMTP local
+Genera listas sintéticas (1k/10k/100k contactos), ejecuta send_bulk_emails
+y guarda los resultados en JSON para comparar ejecuciones
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SUBJECT = "🛏️ Descubre el mejor descanso con Tavolo Casa - Ofertas especiales"
+DOMAINS = ('gmail.com', 'outlook.com', 'hotmail.com', 'yahoo.es', 'tavolocasa.com')
+
+
+def write_synthetic_csv(path: str, size: int):
+    """Lista de contactos sintética con el formato de lista_correos.csv"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['email', 'nombre', 'apellido', 'empresa'])
+        for i in range(size):
+            writer.writerow([f"cliente{i}@{DOMAINS[i % len(DOMAINS)]}", f"Nombre{i}",
+                             f"Apellido{i % 997}", f"Empresa {i % 50}"])
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageTimer:
+    """Tiempo de CPU por etapa, medido con thread_time en el hilo que ejecuta cada etapa"""
+
+    def __init__(self):
+        self.cpu = {'load': 0.0, 'personalize': 0.0, 'build': 0.0, 'send': 0.0}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.cpu[stage] += seconds
+
+    def instrument(self, sender):
+        """Envuelve los métodos de cada etapa en la instancia del enviador"""
+        timer = self
+        timed_contacts = sender._timed_contacts
+        render_parts = sender.templates.render_parts
+        build_for_contact = sender._build_for_contact
+        send_batch = sender._send_batch
+
+        def cpu_contacts(contacts):
+            iterator = timed_contacts(contacts)
+            while True:
+                start = time.thread_time()
+                contact = next(iterator, None)
+                timer.add('load', time.thread_time() - start)
+                if contact is None:
+                    return
+                yield contact
+
+        def cpu_render_parts(*args, **kwargs):
+            start = time.thread_time()
+            try:
+                return render_parts(*args, **kwargs)
+            finally:
+                timer.add('personalize', time.thread_time() - start)
+
+        def cpu_build(contact, run):
+            start = time.thread_time()
+            try:
+                return build_for_contact(contact, run)
+            finally:
+                timer.add('build', time.thread_time() - start)
+
+        def cpu_send_batch(batch, run):
+            start = time.thread_time()
+            try:
+                return send_batch(batch, run)
+            finally:
+                timer.add('send', time.thread_time() - start)
+
+        sender._timed_contacts = cpu_contacts
+        sender.templates.render_parts = cpu_render_parts
+        sender._build_for_contact = cpu_build
+        sender._send_batch = cpu_send_batch
+
+    def report(self):
+        cpu = dict(self.cpu)
+        # Cada etapa incluye las que se ejecutan dentro de ella: se descuentan
+        cpu['send'] = max(0.0, cpu['send'] - cpu['build'])
+        cpu['build'] = max(0.0, cpu['build'] - cpu['personalize'])
+        return {stage: round(seconds, 4) for stage, seconds in cpu.items()}
+
+
+def run_one(args) -> dict:
+    """Ejecuta una campaña completa en este proceso y devuelve sus métricas"""
+    from email_sender import TavoloCasaEmailSender
+    from smtp_sink import SMTPSink
+
+    workdir = tempfile.mkdtemp(prefix='tavolo-bench-')
+    os.chdir(workdir)
+    csv_file = os.path.join(workdir, 'lista.csv')
+    write_synthetic_csv(csv_file, args.size)
+
+    with SMTPSink(latency=args.latency_ms / 1000, error_rate=args.error_rate,
+                  disconnect_rate=args.disconnect_rate,
+                  pipelining=not args.no_pipelining, seed=42) as sink:
+        config = {
+            "sender_email": "info@tavolocasa.com",
+            "sender_name": "Tavolo Casa",
+            "sender_password": "benchmark",
+            "smtp_server": "127.0.0.1",
+            "smtp_port": sink.port,
+            "smtp_starttls": False,
+            "email_settings": {
+                "concurrency": args.concurrency,
+                "batch_size": args.batch_size,
+                "max_retries": 3,
+                "retry_base_delay": 0.05,
+                "retry_max_delay": 1,
+                "rate_limits": {},
+                # Cuantiles exactos de cada transacción SMTP
+                "metrics_exact_stages": ["data"],
+            },
+        }
+        with open('config.json', 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+
+        sender = TavoloCasaEmailSender('config.json')
+        timer = StageTimer()
+        timer.instrument(sender)
+
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+            summary = sender.send_bulk_emails(csv_file, str(ROOT / 'plantilla_correo.html'),
+                                              SUBJECT, delay_seconds=0)
+        wall = time.perf_counter() - wall_start
+        cpu_total = time.process_time() - cpu_start
+        sink_stats = sink.stats()
+
+    # Histogramas por etapa de la propia campaña (metrics.MetricsRegistry)
+    stages = sender.metrics.to_dict()['stages']
+    data = stages.get('data', {})
+    return {
+        'size': args.size,
+        'wall_seconds': round(wall, 3),
+        'messages_per_second': round(summary['sent'] / wall, 2) if wall else 0.0,
+        # Latencia de cada transacción SMTP (cuantiles exactos sobre todas las muestras)
+        'latency_ms': {q: round(data.get(q, 0.0) * 1000, 3) for q in ('p50', 'p95', 'p99')},
+        'cpu_seconds': {'total': round(cpu_total, 3), 'stages': timer.report()},
+        'stage_seconds': {stage: snapshot['sum'] for stage, snapshot in stages.items()},
+        'peak_rss_bytes': peak_rss_bytes(),
+        'summary': summary,
+        'sink': sink_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de envío contra un SMTP local")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--disconnect-rate', type=float, default=0)
+    parser.add_argument('--no-pipelining', action='store_true')
+    parser.add_argument('--output', default=None,
+                        help="Archivo JSON de resultados (por defecto bench_results_<fecha>.json)")
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--run-one', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_one(args)))
+        return
+
+    params = {k: v for k, v in vars(args).items() if k not in ('sizes', 'output', 'size', 'run_one')}
+    passthrough = [
+        '--concurrency', str(args.concurrency), '--batch-size', str(args.batch_size),
+        '--latency-ms', str(args.latency_ms), '--error-rate', str(args.error_rate),
+        '--disconnect-rate', str(args.disconnect_rate),
+    ] + (['--no-pipelining'] if args.no_pipelining else [])
+
+    runs = []
+    for size in args.sizes:
+        print(f"⏱️  {size:,} contactos...", flush=True)
+        # Cada tamaño en su propio proceso para que el pico de memoria sea independiente
+        result = subprocess.run(
+            [sys.executable, __file__, '--run-one', '--size', str(size)] + passthrough,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True)
+        run = json.loads(result.stdout.strip().splitlines()[-1])
+        runs.append(run)
+        rss = run['peak_rss_bytes']
+        print(f"   {run['messages_per_second']:>10,.1f} correos/s | "
+              f"p50 {run['latency_ms']['p50']:.2f} ms p95 {run['latency_ms']['p95']:.2f} ms "
+              f"p99 {run['latency_ms']['p99']:.2f} ms | "
+              f"RSS {rss / 1048576:.0f} MB | CPU {run['cpu_seconds']['stages']}"
+              if rss is not None else f"   {run['messages_per_second']:>10,.1f} correos/s")
+
+    output = args.output or f"bench_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'timestamp': datetime.now().isoformat(timespec='seconds'),
+                   'params': params, 'runs': runs}, f, indent=2, ensure_ascii=False)
+    print(f"💾 Resultados guardados en {output}")
+
+
+if __name__ == "__main__":
+    main()
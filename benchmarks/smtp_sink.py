@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Servidor SMTP local de pruebas (sumidero) para medir el envío sin red real
+Basado en asyncio; acepta todo y puede inyectar latencia, errores 4xx y cortes
+"""
+
+import argparse
+import asyncio
+import base64
+import random
+import threading
+import time
+from collections import Counter
+from typing import List, Optional
+
+
+class SMTPSink:
+    """
+    Servidor SMTP mínimo que descarta los mensajes recibidos
+
+    Anuncia PIPELINING, SIZE, 8BITMIME, SMTPUTF8 y AUTH PLAIN/LOGIN (acepta
+    cualquier credencial). No ofrece STARTTLS: los clientes deben configurarse
+    con "smtp_starttls": false.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 error_rate: float = 0.0, disconnect_rate: float = 0.0,
+                 pipelining: bool = True, seed: Optional[int] = None):
+        """
+        Args:
+            host: Dirección de escucha
+            port: Puerto (0 = elegir uno libre)
+            latency: Retraso en segundos de cada respuesta (simula la ida y vuelta de red)
+            error_rate: Probabilidad de responder 451 al final de DATA
+            disconnect_rate: Probabilidad de cortar la conexión al final de DATA
+            pipelining: Anunciar la extensión PIPELINING
+            seed: Semilla para que los fallos inyectados sean reproducibles
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        self.disconnect_rate = disconnect_rate
+        self.pipelining = pipelining
+        self.random = random.Random(seed)
+
+        self.connections = 0
+        self.messages = 0
+        self.bytes_received = 0
+        self.errors_injected = 0
+        self.disconnects_injected = 0
+        # Mensajes aceptados por destinatario (para detectar envíos duplicados)
+        self.recipients: Counter = Counter()
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    def start(self) -> int:
+        """Arranca el servidor en un hilo propio y devuelve el puerto"""
+        self._thread = threading.Thread(target=self._run, name='smtp-sink', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self.port
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def stats(self) -> dict:
+        return {
+            'connections': self.connections,
+            'messages': self.messages,
+            'bytes_received': self.bytes_received,
+            'errors_injected': self.errors_injected,
+            'disconnects_injected': self.disconnects_injected,
+        }
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            self._loop.run_until_complete(self._server.wait_closed())
+            self._loop.close()
+
+    async def _reply(self, writer: asyncio.StreamWriter, received: float, *lines: str):
+        # La respuesta sale "latency" segundos después de recibir el comando,
+        # así los comandos encadenados con PIPELINING no acumulan esperas
+        if self.latency:
+            delay = received + self.latency - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        writer.write(''.join(f"{line}\r\n" for line in lines).encode('ascii'))
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        envelope: List[str] = []
+        try:
+            await self._reply(writer, time.monotonic(), "220 sink.local ESMTP SMTPSink")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                received = time.monotonic()
+                command, _, argument = line.decode('utf-8', 'replace').strip().partition(' ')
+                command = command.upper()
+
+                if command == 'EHLO':
+                    extensions = ["250-sink.local"]
+                    if self.pipelining:
+                        extensions.append("250-PIPELINING")
+                    extensions += ["250-SIZE 52428800", "250-8BITMIME",
+                                   "250-AUTH PLAIN LOGIN", "250 SMTPUTF8"]
+                    await self._reply(writer, received, *extensions)
+                elif command == 'HELO':
+                    await self._reply(writer, received, "250 sink.local")
+                elif command == 'AUTH':
+                    await self._auth(reader, writer, received, argument)
+                elif command in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                    if command == 'RCPT':
+                        envelope.append(argument.partition(':')[2].split(' ')[0].strip('<>').lower())
+                    elif command != 'NOOP':
+                        envelope.clear()
+                    await self._reply(writer, received, "250 2.0.0 OK")
+                elif command == 'DATA':
+                    await self._reply(writer, received, "354 End data with <CR><LF>.<CR><LF>")
+                    accepted = await self._data(reader, writer, envelope)
+                    envelope.clear()
+                    if not accepted:
+                        break
+                elif command == 'QUIT':
+                    await self._reply(writer, received, "221 2.0.0 Bye")
+                    break
+                else:
+                    await self._reply(writer, received, "502 5.5.2 Command not implemented")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _auth(self, reader, writer, received: float, argument: str):
+        mechanism, _, initial = argument.partition(' ')
+        mechanism = mechanism.upper()
+        if mechanism == 'PLAIN' and not initial:
+            await self._reply(writer, received, "334 ")
+            await reader.readline()
+        elif mechanism == 'LOGIN':
+            await self._reply(writer, received, "334 " + base64.b64encode(b"Username:").decode())
+            await reader.readline()
+            await self._reply(writer, time.monotonic(), "334 " + base64.b64encode(b"Password:").decode())
+            await reader.readline()
+        await self._reply(writer, time.monotonic(), "235 2.7.0 Authentication successful")
+
+    async def _data(self, reader, writer, envelope: List[str]) -> bool:
+        """Lee el contenido hasta <CRLF>.<CRLF>; devuelve False si se corta la conexión"""
+        size = 0
+        while True:
+            line = await reader.readline()
+            if not line:
+                return False
+            if line == b'.\r\n':
+                break
+            size += len(line)
+        received = time.monotonic()
+
+        roll = self.random.random()
+        if roll < self.disconnect_rate:
+            self.disconnects_injected += 1
+            return False
+        if roll < self.disconnect_rate + self.error_rate:
+            self.errors_injected += 1
+            await self._reply(writer, received, "451 4.3.0 Error temporal simulado")
+            return True
+
+        self.messages += 1
+        self.recipients.update(envelope)
+        self.bytes_received += size
+        await self._reply(writer, received, "250 2.0.0 Mensaje aceptado")
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor SMTP local de pruebas")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--disconnect-rate', type=float, default=0)
+    parser.add_argument('--no-pipelining', action='store_true')
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.host, args.port, latency=args.latency_ms / 1000,
+                    error_rate=args.error_rate, disconnect_rate=args.disconnect_rate,
+                    pipelining=not args.no_pipelining)
+    port = sink.start()
+    print(f"📭 Sumidero SMTP escuchando en {args.host}:{port} (Ctrl+C para salir)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"   {sink.stats()}")
+    except KeyboardInterrupt:
+        sink.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+"""
+Procesado de rebotes para el sistema de correos Tavolo Casa
+Lee los avisos de no entrega (DSN/NDR) y las quejas (ARF) de un buzón local
+mbox o Maildir y actualiza la lista de supresión
+"""
+
+import email.utils
+import hashlib
+import logging
+import mailbox
+import os
+import re
+import sqlite3
+import threading
+import time
+from email.feedparser import BytesFeedParser
+from email.message import Message
+from email.parser import HeaderParser
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from recipient_index import normalize_email
+from suppression import REASON_BOUNCE, REASON_COMPLAINT, SuppressionList
+
+KIND_HARD = 'hard'
+KIND_SOFT = 'soft'
+KIND_COMPLAINT = 'complaint'
+
+# Bytes que se leen de cada mensaje: el informe va antes del mensaje devuelto,
+# así que los adjuntos devueltos no se llegan a cargar en memoria
+MAX_MESSAGE_BYTES = 256 * 1024
+
+# Mensajes procesados por transacción
+COMMIT_EVERY = 200
+
+# Sin dígitos ni puntos alrededor, para no confundirlos con direcciones IP
+_ENHANCED_STATUS = re.compile(r'(?<![\d.])([245])\.(\d{1,3})\.(\d{1,3})(?!\.?\d)')
+# Código de respuesta SMTP: al principio de la línea o tras el prefijo con que
+# los MTA citan la respuesta del servidor ("smtp; 550", "said: 550", "[1.2.3.4]: 550");
+# en cualquier otra parte del texto un número de tres cifras no es un código
+_SMTP_CODE = re.compile(r'^(?:.*?(?:said:|\]:|;))?\s*([45])([0-5])(\d)(?=[\s-]|$)', re.MULTILINE)
+_ADDRESS_IN_TEXT = re.compile(r'<?([^\s<>"\'(),;:]+@[^\s<>"\'(),;:]+\.[a-z]{2,})>?', re.IGNORECASE)
+_HEADER_END = re.compile(rb'\r?\n\r?\n')
+
+# Remitentes y asuntos de los avisos de no entrega que no siguen el formato DSN
+_BOUNCE_SENDER = re.compile(r'mailer-daemon|postmaster|mail delivery', re.IGNORECASE)
+_BOUNCE_SUBJECT = re.compile(
+    r'undeliver|delivery status notification|delivery failure|failure notice|returned mail|'
+    r'mail delivery failed|no se (pudo|puede) entregar|error de entrega', re.IGNORECASE)
+
+
+class Bounce(NamedTuple):
+    """Resultado de entrega de un destinatario según un aviso de rebote"""
+    email: str
+    kind: str        # KIND_HARD, KIND_SOFT o KIND_COMPLAINT
+    status: str      # código de estado (5.1.1, 550...) o '' si no se conoce
+    diagnostic: str
+
+
+def classify(status: str, action: str = '') -> Optional[str]:
+    """
+    Tipo de rebote según el campo Action y el código de estado
+
+    Los 5.x.x son rebotes duros salvo el buzón lleno (5.2.2) y los rechazos
+    por política o spam (5.7.x), que no indican que la dirección no exista.
+    Un aviso de retraso (Action: delayed) no es un fallo: el servidor sigue
+    intentando la entrega.
+
+    Args:
+        status: Código de estado (5.1.1, 550...) o '' si no se conoce
+        action: Campo Action del DSN ('' en los avisos que no son DSN)
+
+    Returns:
+        KIND_HARD, KIND_SOFT o None si no es un fallo (delivered, delayed...)
+    """
+    action = action.strip().lower()
+    if action in ('delivered', 'relayed', 'expanded', 'delayed'):
+        return None
+    enhanced = _ENHANCED_STATUS.search(status)
+    if enhanced:
+        code_class, subject, detail = enhanced.groups()
+        if code_class == '2':
+            return None
+        if code_class == '4' or (subject, detail) == ('2', '2') or subject == '7':
+            return KIND_SOFT
+        return KIND_HARD
+    match = _SMTP_CODE.search(status)
+    if match:
+        code = ''.join(match.groups())
+        # 552: buzón lleno
+        return KIND_HARD if code.startswith('5') and code != '552' else KIND_SOFT
+    # Sin código: un DSN con Action failed es definitivo; en un aviso que no es
+    # DSN no se sabe, así que cuenta como blando
+    return KIND_HARD if action == 'failed' else KIND_SOFT
+
+
+def _recipient(value: Optional[str]) -> Optional[str]:
+    """Dirección de un campo Final-Recipient / Original-Recipient ("rfc822; a@b.com")"""
+    if not value:
+        return None
+    return normalize_email(value.rpartition(';')[2].strip().strip('<>'))
+
+
+def _status_of(status: str, diagnostic: str) -> str:
+    for text in (status, diagnostic):
+        match = _ENHANCED_STATUS.search(text)
+        if match:
+            return match.group(0)
+        match = _SMTP_CODE.search(text)
+        if match:
+            return ''.join(match.groups())
+    return ''
+
+
+def _one_line(value: Optional[str]) -> str:
+    return ' '.join(str(value or '').split())[:500]
+
+
+def _delivery_status(part: Message) -> List[Bounce]:
+    bounces = []
+    blocks = part.get_payload()
+    if isinstance(blocks, str):  # informe mal formado: se interpreta como un solo bloque
+        blocks = [HeaderParser().parsestr(blocks.strip().replace('\n\n', '\n'))]
+    for block in blocks:
+        address = _recipient(block.get('Final-Recipient')) or _recipient(block.get('Original-Recipient'))
+        if address is None:
+            continue
+        diagnostic = _one_line(block.get('Diagnostic-Code'))
+        status = _status_of(str(block.get('Status', '')), diagnostic)
+        kind = classify(status, str(block.get('Action', 'failed')))
+        if kind is not None:
+            bounces.append(Bounce(address, kind, status, diagnostic))
+    return bounces
+
+
+def _complaint(message: Message) -> List[Bounce]:
+    feedback_type = ''
+    address = None
+    for part in message.walk():
+        content_type = part.get_content_type()
+        if content_type == 'message/feedback-report':
+            payload = part.get_payload()
+            report = payload[0] if isinstance(payload, list) and payload else None
+            if isinstance(payload, str):
+                report = HeaderParser().parsestr(payload.strip())
+            if report is not None:
+                feedback_type = str(report.get('Feedback-Type', ''))
+                address = address or _recipient(report.get('Original-Rcpt-To'))
+        elif content_type in ('message/rfc822', 'text/rfc822-headers') and address is None:
+            payload = part.get_payload()
+            original = payload[0] if isinstance(payload, list) and payload else None
+            if isinstance(payload, str):
+                original = HeaderParser().parsestr(payload)
+            if original is not None:
+                address = _recipient(email.utils.parseaddr(str(original.get('To', '')))[1])
+    if address is None:
+        return []
+    return [Bounce(address, KIND_COMPLAINT, '', _one_line(feedback_type or 'abuse'))]
+
+
+def _first_text(message: Message, limit: int = 64 * 1024) -> str:
+    for part in message.walk():
+        if part.get_content_type() == 'text/plain':
+            payload = part.get_payload(decode=True)
+            if payload:
+                charset = part.get_content_charset() or 'utf-8'
+                try:
+                    return payload[:limit].decode(charset, 'replace')
+                except LookupError:
+                    return payload[:limit].decode('utf-8', 'replace')
+    return ''
+
+
+def _non_delivery_report(message: Message, ignore: Tuple[str, ...]) -> List[Bounce]:
+    """
+    Avisos de no entrega que no siguen el formato DSN (Exim, qmail, Exchange antiguos)
+
+    Las direcciones se toman de X-Failed-Recipients o de las líneas del texto
+    que contienen un código de error o, como en qmail, del párrafo en que aparece.
+    """
+    if not (_BOUNCE_SENDER.search(str(message.get('From', '')))
+            or _BOUNCE_SUBJECT.search(str(message.get('Subject', '')))):
+        return []
+    text = _first_text(message)
+    failed = [normalize_email(address) for address in str(message.get('X-Failed-Recipients', '')).split(',')]
+    found: Dict[str, Tuple[str, str]] = {}
+    previous: List[str] = []
+    for line in text.splitlines():
+        addresses = [normalize_email(match) for match in _ADDRESS_IN_TEXT.findall(line)]
+        addresses = [address for address in addresses if address and address not in ignore]
+        status = _status_of(line, '')
+        if status:
+            for address in addresses or previous:
+                found.setdefault(address, (status, _one_line(line)))
+        if addresses:
+            previous = addresses
+        elif not line.strip():
+            previous = []
+    for address in failed:
+        if address and address not in found:
+            found[address] = (_status_of(text, ''), '')
+    bounces = []
+    for address, (status, diagnostic) in found.items():
+        kind = classify(status)
+        if kind is not None:
+            bounces.append(Bounce(address, kind, status, diagnostic))
+    return bounces
+
+
+def parse_bounces(message: Message, ignore: Iterable[str] = ()) -> List[Bounce]:
+    """
+    Destinatarios que rebotaron según un mensaje del buzón de rebotes
+
+    Args:
+        message: Aviso de no entrega (multipart/report), queja ARF u otro mensaje
+        ignore: Direcciones que no deben tomarse por destinatarios (el remitente)
+
+    Returns:
+        Rebotes encontrados (vacío si el mensaje no es un aviso de rebote)
+    """
+    if message.get_content_type() == 'multipart/report':
+        report_type = str(message.get_param('report-type', '')).lower()
+        if report_type == 'feedback-report':
+            return _complaint(message)
+        for part in message.walk():
+            if part.get_content_type() == 'message/delivery-status':
+                return _delivery_status(part)
+    return _non_delivery_report(message, tuple(address.lower() for address in ignore))
+
+
+def open_mailbox(path: str, format: Optional[str] = None) -> mailbox.Mailbox:
+    """Abre un buzón mbox o Maildir (por defecto, Maildir si path es un directorio)"""
+    if format is None:
+        format = 'maildir' if os.path.isdir(path) else 'mbox'
+    if format == 'maildir':
+        return mailbox.Maildir(path, factory=None, create=False)
+    if format == 'mbox':
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"No se encuentra el buzón {path}")
+        return mailbox.mbox(path, factory=None, create=False)
+    raise ValueError(f"Formato de buzón no soportado: {format}")
+
+
+def read_message(box: mailbox.Mailbox, key: str,
+                 limit: int = MAX_MESSAGE_BYTES) -> Tuple[Message, bytes]:
+    """
+    Lee como mucho limit bytes de un mensaje del buzón
+
+    Returns:
+        (mensaje, bytes de la cabecera)
+    """
+    with box.get_file(key) as f:
+        data = f.read(limit)
+    end = _HEADER_END.search(data)
+    parser = BytesFeedParser()
+    parser.feed(data)
+    return parser.close(), data[:end.end()] if end else data
+
+
+class BounceReport(NamedTuple):
+    messages: int
+    skipped: int       # ya procesados en una ejecución anterior
+    hard: int
+    soft: int
+    complaints: int
+    suppressed: int    # direcciones añadidas a la lista de supresión
+
+
+class BounceProcessor:
+    """
+    Ingesta de rebotes en la lista de supresión
+
+    Los rebotes duros y las quejas suprimen la dirección de inmediato. Los
+    blandos se cuentan por dirección y la suprimen al llegar a soft_limit
+    dentro de soft_days días: solo cuentan los avisos de esa ventana, por
+    mucho que se vayan encadenando avisos más espaciados.
+    El estado por dirección y los mensajes ya procesados se guardan en la
+    misma base de datos que la lista de supresión, así que volver a leer el
+    buzón no cuenta dos veces el mismo aviso.
+    """
+
+    def __init__(self, suppression: SuppressionList, mailbox_path: str = '', format: Optional[str] = None,
+                 soft_limit: int = 3, soft_days: float = 30, ignore: Iterable[str] = ()):
+        """
+        Args:
+            suppression: Lista de supresión que se actualiza
+            mailbox_path: Buzón de rebotes (mbox o Maildir)
+            format: 'mbox' o 'maildir' (por defecto según mailbox_path)
+            soft_limit: Rebotes blandos que suprimen la dirección (0 = nunca)
+            soft_days: Ventana en días en la que se acumulan los rebotes blandos
+            ignore: Direcciones propias que aparecen en los avisos (el remitente)
+        """
+        self.suppression = suppression
+        self.mailbox_path = mailbox_path
+        self.format = format
+        self.soft_limit = soft_limit
+        self.soft_window = soft_days * 86400
+        self.ignore = tuple(address.lower() for address in ignore)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(suppression.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bounces ("
+            " email TEXT PRIMARY KEY, soft INTEGER NOT NULL DEFAULT 0, hard INTEGER NOT NULL DEFAULT 0,"
+            " status TEXT, diagnostic TEXT, first_seen REAL NOT NULL, last_seen REAL NOT NULL,"
+            " soft_seen TEXT NOT NULL DEFAULT ''"
+            ") WITHOUT ROWID")
+        # Bases creadas antes de guardar la fecha de cada rebote blando
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(bounces)")}
+        if 'soft_seen' not in columns:
+            self._conn.execute("ALTER TABLE bounces ADD COLUMN soft_seen TEXT NOT NULL DEFAULT ''")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bounce_messages (id TEXT PRIMARY KEY, processed REAL NOT NULL)"
+            " WITHOUT ROWID")
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, config: Dict, mailbox_path: Optional[str] = None) -> Optional["BounceProcessor"]:
+        """
+        Procesador configurado en email_settings.bounces
+
+        Args:
+            config: Configuración completa (se usa también sender_email)
+            mailbox_path: Buzón de rebotes (por defecto email_settings.bounces.mailbox)
+
+        Returns:
+            None si no hay lista de supresión (suppression_db)
+        """
+        settings = config.get('email_settings', {})
+        bounces = settings.get('bounces', {})
+        suppression = SuppressionList.from_settings(settings)
+        if suppression is None:
+            return None
+        return cls(suppression, mailbox_path or bounces.get('mailbox', ''), bounces.get('format'),
+                   soft_limit=bounces.get('soft_bounce_limit', 3),
+                   soft_days=bounces.get('soft_bounce_days', 30),
+                   ignore=[config.get('sender_email', '')])
+
+    def process(self, limit: int = MAX_MESSAGE_BYTES) -> BounceReport:
+        """
+        Recorre el buzón de rebotes mensaje a mensaje y actualiza la supresión
+
+        Cada mensaje se lee por separado y solo sus primeros limit bytes, así
+        que la memoria no depende del tamaño del buzón.
+        """
+        if not self.mailbox_path:
+            raise ValueError("Indica el buzón de rebotes o configura email_settings.bounces.mailbox")
+        box = open_mailbox(self.mailbox_path, self.format)
+        messages = skipped = hard = soft = complaints = suppressed = 0
+        pending: Dict[str, List[Tuple[str, str]]] = {}
+        try:
+            for key in box.iterkeys():
+                try:
+                    message, header = read_message(box, key, limit)
+                except (OSError, KeyError) as e:
+                    logging.warning(f"No se pudo leer el mensaje {key} de {self.mailbox_path}: {e}")
+                    continue
+                messages += 1
+                message_id = self._message_id(message, header)
+                with self._lock:
+                    if self._conn.execute("SELECT 1 FROM bounce_messages WHERE id = ?",
+                                          (message_id,)).fetchone():
+                        skipped += 1
+                        continue
+                    seen = self._date_of(message)
+                    for bounce in parse_bounces(message, self.ignore):
+                        reason = self._record(bounce, seen)
+                        hard += bounce.kind == KIND_HARD
+                        soft += bounce.kind == KIND_SOFT
+                        complaints += bounce.kind == KIND_COMPLAINT
+                        if reason is not None:
+                            source = (f"queja {bounce.diagnostic}" if bounce.kind == KIND_COMPLAINT
+                                      else f"rebote {bounce.status}".strip())
+                            pending.setdefault(reason, []).append((bounce.email, source))
+                    self._conn.execute("INSERT OR IGNORE INTO bounce_messages (id, processed) VALUES (?, ?)",
+                                       (message_id, time.time()))
+                if messages % COMMIT_EVERY == 0:
+                    suppressed += self._commit(pending)
+            suppressed += self._commit(pending)
+        finally:
+            with self._lock:
+                self._conn.rollback()
+            box.close()
+        report = BounceReport(messages, skipped, hard, soft, complaints, suppressed)
+        logging.info(f"Rebotes procesados en {self.mailbox_path}: {messages} mensajes ({skipped} ya vistos), "
+                     f"{hard} duros, {soft} blandos, {complaints} quejas, {suppressed} direcciones suprimidas")
+        return report
+
+    def _record(self, bounce: Bounce, seen: float) -> Optional[str]:
+        """Actualiza el estado de la dirección; devuelve el motivo si debe suprimirse"""
+        row = self._conn.execute("SELECT soft_seen FROM bounces WHERE email = ?",
+                                 (bounce.email,)).fetchone()
+        # Fechas de los rebotes blandos que siguen dentro de la ventana del más reciente
+        recent = [float(value) for value in row[0].split()] if row is not None else []
+        if bounce.kind == KIND_SOFT:
+            recent.append(seen)
+        newest = max(recent, default=seen)
+        recent = sorted(value for value in recent if newest - value <= self.soft_window)
+        if self.soft_limit:
+            recent = recent[-self.soft_limit:]
+        soft = len(recent)
+        self._conn.execute(
+            "INSERT INTO bounces (email, soft, hard, status, diagnostic, first_seen, last_seen, soft_seen)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(email) DO UPDATE SET soft = excluded.soft,"
+            " hard = hard + excluded.hard, status = excluded.status, diagnostic = excluded.diagnostic,"
+            " last_seen = MAX(last_seen, excluded.last_seen), soft_seen = excluded.soft_seen",
+            (bounce.email, soft, int(bounce.kind == KIND_HARD), bounce.status, bounce.diagnostic, seen, seen,
+             ' '.join(repr(value) for value in recent)))
+        if bounce.kind == KIND_COMPLAINT:
+            return REASON_COMPLAINT
+        if bounce.kind == KIND_HARD or (bounce.kind == KIND_SOFT and self.soft_limit
+                                        and soft >= self.soft_limit):
+            return REASON_BOUNCE
+        return None
+
+    def _commit(self, pending: Dict[str, List[Tuple[str, str]]]) -> int:
+        """
+        Suprime las direcciones pendientes y confirma el estado de los rebotes
+
+        Supresiones, contadores y mensajes procesados se confirman en una sola
+        transacción: un mensaje solo queda como procesado si sus direcciones
+        ya están en la lista de supresión.
+        """
+        added = 0
+        with self._lock:
+            for reason, entries in pending.items():
+                by_source: Dict[str, List[str]] = {}
+                for address, source in entries:
+                    by_source.setdefault(source, []).append(address)
+                for source, addresses in by_source.items():
+                    added += SuppressionList.insert_many(self._conn, addresses, reason, source)
+            self._conn.commit()
+        pending.clear()
+        return added
+
+    @staticmethod
+    def _message_id(message: Message, header: bytes) -> str:
+        message_id = str(message.get('Message-ID', '')).strip()
+        return message_id or 'sha1:' + hashlib.sha1(header).hexdigest()
+
+    @staticmethod
+    def _date_of(message: Message) -> float:
+        try:
+            return email.utils.parsedate_to_datetime(str(message.get('Date', ''))).timestamp()
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return time.time()
+
+    def status(self, email_address: str) -> Optional[Tuple[int, int, str, str, float]]:
+        """Estado de rebotes de una dirección: (blandos, duros, estado, diagnóstico, último)"""
+        key = normalize_email(email_address) or email_address.strip().lower()
+        with self._lock:
+            return self._conn.execute(
+                "SELECT soft, hard, status, diagnostic, last_seen FROM bounces WHERE email = ?",
+                (key,)).fetchone()
+
+    def entries(self) -> Iterator[Tuple[str, int, int, str, str, float]]:
+        """Recorre las direcciones con rebotes (email, blandos, duros, estado, diagnóstico, último)"""
+        return iter(self._conn.execute(
+            "SELECT email, soft, hard, status, diagnostic, last_seen FROM bounces ORDER BY email"))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+        self.suppression.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Procesado de rebotes desde la línea de comandos"""
+    import argparse
+    import csv
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description="Procesado de rebotes de Tavolo Casa")
+    parser.add_argument('--config', default="config.json",
+                        help="Archivo de configuración (por defecto config.json)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    process = commands.add_parser('process', help="Leer el buzón de rebotes y actualizar la supresión")
+    process.add_argument('mailbox', nargs='?', help="Buzón mbox o Maildir (por defecto email_settings.bounces.mailbox)")
+    process.add_argument('--format', choices=['mbox', 'maildir'], help="Formato del buzón")
+
+    check = commands.add_parser('check', help="Estado de rebotes de una dirección")
+    check.add_argument('emails', nargs='+')
+
+    commands.add_parser('export', help="Volcar el estado de rebotes en CSV por la salida estándar")
+
+    args = parser.parse_args(argv)
+    try:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error: {e}")
+        return 1
+
+    processor = BounceProcessor.from_config(config, getattr(args, 'mailbox', None))
+    if processor is None:
+        print("❌ Error: Configura email_settings.suppression_db para procesar rebotes")
+        return 1
+    with processor:
+        if args.command == 'process':
+            processor.format = args.format or processor.format
+            try:
+                report = processor.process()
+            except (OSError, ValueError) as e:
+                print(f"❌ Error: {e}")
+                return 1
+            print(f"📬 {report.messages} mensajes leídos ({report.skipped} ya procesados)")
+            print(f"📊 Rebotes: {report.hard} duros, {report.soft} blandos, {report.complaints} quejas")
+            print(f"✅ {report.suppressed} direcciones añadidas a la lista de supresión")
+        elif args.command == 'check':
+            for address in args.emails:
+                row = processor.status(address)
+                if row is None:
+                    print(f"✅ {address}: sin rebotes")
+                else:
+                    soft, hard, status, diagnostic, _ = row
+                    print(f"📋 {address}: {hard} duros, {soft} blandos (último {status or '?'}) {diagnostic}")
+        elif args.command == 'export':
+            writer = csv.writer(sys.stdout)
+            writer.writerow(['email', 'soft', 'hard', 'status', 'diagnostic', 'last_seen'])
+            for row in processor.entries():
+                writer.writerow(row)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
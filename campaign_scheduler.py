@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+"""
+Planificador de campañas para el sistema de correos Tavolo Casa
+Cola persistente de campañas que se envían por tramos dentro de su franja
+horaria, sin superar la cuota diaria y compartiendo sesiones SMTP y límites
+"""
+
+import json
+import logging
+import os
+import signal
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import FrozenSet, List, NamedTuple, Optional, Tuple
+
+from bounce_processor import BounceProcessor
+from contact_store import ContactStore
+from email_sender import TavoloCasaEmailSender
+from rate_limiter import RateLimiter
+from send_journal import SendJournal, make_campaign_id
+
+STATUS_QUEUED = 'queued'
+STATUS_PAUSED = 'paused'
+STATUS_DONE = 'done'
+STATUS_CANCELLED = 'cancelled'
+STATUS_ERROR = 'error'
+
+# Días de la semana en el orden de datetime.weekday()
+DAY_NAMES = ('lun', 'mar', 'mie', 'jue', 'vie', 'sab', 'dom')
+
+MINUTES_PER_DAY = 24 * 60
+
+_ACCENTS = str.maketrans('áéíóú', 'aeiou')
+
+
+def _parse_time(value: str) -> int:
+    """Minutos desde medianoche de una hora HH:MM (24:00 = fin del día)"""
+    hours, _, minutes = value.strip().partition(':')
+    total = int(hours) * 60 + int(minutes or 0)
+    if not 0 <= total <= MINUTES_PER_DAY:
+        raise ValueError(f"Hora fuera de rango: {value}")
+    return total
+
+
+def _parse_days(value: str) -> FrozenSet[int]:
+    """Días de la semana de una lista como "lun-vie,dom" (vacía = todos)"""
+    days = set()
+    # "miércoles" y "sábado" valen igual que sin tilde
+    value = value.lower().translate(_ACCENTS)
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        first, _, last = item.partition('-')
+        try:
+            start, end = DAY_NAMES.index(first[:3]), DAY_NAMES.index((last or first)[:3])
+        except ValueError:
+            raise ValueError(f"Día desconocido en {item!r} (usa {', '.join(DAY_NAMES)})") from None
+        day = start
+        days.add(day)
+        while day != end:
+            day = (day + 1) % 7
+            days.add(day)
+    return frozenset(days)
+
+
+class SendWindow(NamedTuple):
+    """
+    Franja horaria en la que una campaña puede enviar
+
+    Si start es mayor que end la franja cruza la medianoche y pertenece al
+    día en que empieza (22:00-06:00 del viernes incluye la madrugada del sábado).
+    """
+    start: int  # minutos desde medianoche
+    end: int
+    days: FrozenSet[int]  # vacío = todos los días
+
+    @classmethod
+    def parse(cls, window: str = '00:00-24:00', days: str = '') -> "SendWindow":
+        start, separator, end = window.partition('-')
+        if not separator:
+            raise ValueError(f"Franja inválida {window!r} (formato HH:MM-HH:MM)")
+        return cls(_parse_time(start), _parse_time(end), _parse_days(days))
+
+    def _day_allowed(self, day: int) -> bool:
+        return not self.days or day in self.days
+
+    def contains(self, moment: datetime) -> bool:
+        minute = moment.hour * 60 + moment.minute
+        if self.start < self.end:
+            return self.start <= minute < self.end and self._day_allowed(moment.weekday())
+        if self.start == self.end:
+            return self._day_allowed(moment.weekday())
+        if minute >= self.start:
+            return self._day_allowed(moment.weekday())
+        return minute < self.end and self._day_allowed((moment.weekday() - 1) % 7)
+
+    def next_open(self, moment: datetime) -> datetime:
+        """Primer instante a partir de moment en el que la franja está abierta"""
+        if self.contains(moment):
+            return moment
+        midnight = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        for offset in range(8):
+            opening = midnight + timedelta(days=offset, minutes=self.start % MINUTES_PER_DAY)
+            if opening > moment and self._day_allowed(opening.weekday()):
+                return opening
+        raise ValueError("La franja no tiene ningún día permitido")
+
+    def __str__(self) -> str:
+        def hhmm(minutes: int) -> str:
+            return f"{minutes // 60:02d}:{minutes % 60:02d}"
+        days = ','.join(DAY_NAMES[day] for day in sorted(self.days)) if self.days else 'todos los días'
+        return f"{hhmm(self.start)}-{hhmm(self.end)} ({days})"
+
+
+class Job(NamedTuple):
+    """Campaña de la cola"""
+    id: str
+    email_list_file: str
+    template_file: str
+    subject: str
+    attachments: List[str]
+    window: SendWindow
+    not_before: float
+    daily_quota: Optional[int]
+    status: str
+    created: float
+    last_run: float
+    sent: int
+    failed: int
+    error: Optional[str]
+    position: int  # contactos de la lista ya recorridos
+    journal_offset: int  # bytes del diario que corresponden a esos contactos
+    list_key: Optional[str]  # versión de la lista a la que se refiere la posición
+
+
+class JobQueue:
+    """
+    Cola de campañas almacenada en SQLite
+
+    Guarda cada campaña con su franja, su estado y sus totales, y los envíos
+    de cada día por campaña para aplicar las cuotas diarias. El progreso por
+    destinatario está en el diario de cada campaña (send_journal); la cola
+    guarda además hasta dónde se ha recorrido la lista, para que cada tramo
+    continúe ahí sin volver a leer la lista ni el diario desde el principio.
+    """
+
+    _COLUMNS = ('id, email_list_file, template_file, subject, attachments, window, days,'
+                ' not_before, daily_quota, status, created, last_run, sent, failed, error,'
+                ' position, journal_offset, list_key')
+
+    def __init__(self, path: str = "campaigns.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS campaigns ("
+            " id TEXT PRIMARY KEY, email_list_file TEXT NOT NULL, template_file TEXT NOT NULL,"
+            " subject TEXT NOT NULL, attachments TEXT NOT NULL DEFAULT '[]',"
+            " window TEXT NOT NULL, days TEXT NOT NULL DEFAULT '', not_before REAL NOT NULL DEFAULT 0,"
+            " daily_quota INTEGER, status TEXT NOT NULL, created REAL NOT NULL,"
+            " last_run REAL NOT NULL DEFAULT 0, sent INTEGER NOT NULL DEFAULT 0,"
+            " failed INTEGER NOT NULL DEFAULT 0, error TEXT,"
+            " position INTEGER NOT NULL DEFAULT 0, journal_offset INTEGER NOT NULL DEFAULT 0,"
+            " list_key TEXT)")
+        # Colas creadas antes de guardar la posición de cada campaña
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(campaigns)")}
+        for column, definition in (('position', 'INTEGER NOT NULL DEFAULT 0'),
+                                   ('journal_offset', 'INTEGER NOT NULL DEFAULT 0'),
+                                   ('list_key', 'TEXT')):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE campaigns ADD COLUMN {column} {definition}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            " day TEXT NOT NULL, campaign_id TEXT NOT NULL, sent INTEGER NOT NULL,"
+            " PRIMARY KEY (day, campaign_id)) WITHOUT ROWID")
+        self._conn.commit()
+
+    def add(self, email_list_file: str, template_file: str, subject: str,
+            attachments: Optional[List[str]] = None, window: str = '00:00-24:00', days: str = '',
+            not_before: Optional[float] = None, daily_quota: Optional[int] = None,
+            campaign_id: Optional[str] = None) -> Job:
+        """
+        Encola una campaña
+
+        Args:
+            email_list_file: Archivo CSV con la lista de correos
+            template_file: Archivo HTML con la plantilla del correo
+            subject: Asunto del correo
+            attachments: Lista de archivos adjuntos
+            window: Franja horaria HH:MM-HH:MM
+            days: Días permitidos (p. ej. "lun-vie"; vacío = todos)
+            not_before: No empezar antes de este instante (epoch)
+            daily_quota: Máximo de envíos diarios de esta campaña (None = sin límite propio)
+            campaign_id: Identificador (por defecto el mismo que usa email_sender,
+                así el diario es compartido con --resume)
+
+        Raises:
+            ValueError: Si la franja no es válida o la campaña ya está en la cola
+        """
+        SendWindow.parse(window, days)
+        campaign_id = campaign_id or make_campaign_id(email_list_file, template_file, subject)
+        try:
+            with self._lock:
+                self._conn.execute(
+                    f"INSERT INTO campaigns ({self._COLUMNS}) VALUES"
+                    " (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 0, 0, NULL, 0, 0, NULL)",
+                    (campaign_id, os.path.abspath(email_list_file), os.path.abspath(template_file),
+                     subject, json.dumps([os.path.abspath(path) for path in attachments or []]),
+                     window, days, not_before or 0, daily_quota, STATUS_QUEUED, time.time()))
+                self._conn.commit()
+        except sqlite3.IntegrityError:
+            raise ValueError(f"La campaña {campaign_id} ya está en la cola") from None
+        return self.get(campaign_id)
+
+    def get(self, campaign_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {self._COLUMNS} FROM campaigns WHERE id = ?", (campaign_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def jobs(self, *statuses: str) -> List[Job]:
+        """Campañas con alguno de los estados indicados (todas si no se indica ninguno), por antigüedad"""
+        query = f"SELECT {self._COLUMNS} FROM campaigns"
+        if statuses:
+            query += f" WHERE status IN ({','.join('?' * len(statuses))})"
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY created", statuses).fetchall()
+        return [self._job(row) for row in rows]
+
+    def set_status(self, campaign_id: str, status: str, error: Optional[str] = None) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE campaigns SET status = ?, error = ? WHERE id = ?", (status, error, campaign_id))
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def record_slice(self, campaign_id: str, day: str, sent: int, failed: int,
+                     position: int = 0, journal_offset: int = 0, list_key: Optional[str] = None):
+        """
+        Suma un tramo enviado a los totales de la campaña y a la cuota del día
+
+        Args:
+            position: Contactos de la lista recorridos al terminar el tramo
+            journal_offset: Tamaño del diario al terminar el tramo
+            list_key: Versión de la lista a la que se refiere position
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE campaigns SET sent = sent + ?, failed = failed + ?, last_run = ?,"
+                " position = ?, journal_offset = ?, list_key = ? WHERE id = ?",
+                (sent, failed, time.time(), position, journal_offset, list_key, campaign_id))
+            self._conn.execute(
+                "INSERT INTO usage (day, campaign_id, sent) VALUES (?, ?, ?)"
+                " ON CONFLICT(day, campaign_id) DO UPDATE SET sent = sent + excluded.sent",
+                (day, campaign_id, sent + failed))
+            self._conn.commit()
+
+    def used(self, day: str, campaign_id: Optional[str] = None) -> int:
+        """Envíos del día, de todas las campañas o de una"""
+        query, params = "SELECT COALESCE(SUM(sent), 0) FROM usage WHERE day = ?", [day]
+        if campaign_id is not None:
+            query += " AND campaign_id = ?"
+            params.append(campaign_id)
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()[0]
+
+    @staticmethod
+    def _job(row: Tuple) -> Job:
+        (campaign_id, email_list_file, template_file, subject, attachments, window, days,
+         not_before, daily_quota, status, created, last_run, sent, failed, error,
+         position, journal_offset, list_key) = row
+        return Job(campaign_id, email_list_file, template_file, subject, json.loads(attachments),
+                   SendWindow.parse(window, days), not_before, daily_quota, status, created,
+                   last_run, sent, failed, error, position, journal_offset, list_key)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class CampaignScheduler:
+    """
+    Envía las campañas de la cola por tramos
+
+    En cada vuelta elige, entre las campañas cuya franja está abierta y que
+    no han agotado su cuota, la que lleva más tiempo sin enviar (reparto
+    round-robin), y le envía un tramo de como mucho slice_size destinatarios
+    con send_bulk_emails(resume=True, max_messages=...). Cada tramo continúa
+    en la posición de la lista donde acabó el anterior; el diario de la
+    campaña cubre los envíos de un tramo interrumpido. Todas
+    las campañas comparten el pool SMTP y el limitador de envíos, y la suma
+    de sus envíos del día no supera daily_quota.
+    """
+
+    def __init__(self, config_file: str = "config.json", db_path: Optional[str] = None):
+        """
+        Args:
+            config_file: Ruta al archivo de configuración
+            db_path: Cola de campañas (por defecto email_settings.scheduler.db)
+        """
+        self.sender = TavoloCasaEmailSender(config_file)
+        self.settings = self.sender.config.get('email_settings', {})
+        scheduler = self.settings.get('scheduler', {})
+        self.queue = JobQueue(db_path or scheduler.get('db', 'campaigns.sqlite'))
+        self.daily_quota = scheduler.get('daily_quota', 450)
+        self.slice_size = max(1, scheduler.get('slice_size', 50))
+        self.poll_interval = scheduler.get('poll_interval', 60)
+        self.rate_limiter = RateLimiter.from_settings(self.settings, scheduler.get('delay_seconds', 2))
+        self.bounces = BounceProcessor.from_config(self.sender.config)
+        if self.bounces is not None and not self.bounces.mailbox_path:
+            self.bounces.close()
+            self.bounces = None
+        self._bounces_checked = float('-inf')
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Termina run() al acabar el tramo en curso"""
+        self._stop.set()
+
+    def next_slice(self, now: datetime) -> Tuple[Optional[Job], int, float]:
+        """
+        Campaña a la que le toca enviar y tamaño del tramo
+
+        Returns:
+            (campaña, destinatarios del tramo, 0) o, si no hay nada que enviar
+            ahora, (None, 0, segundos hasta que pueda haberlo)
+        """
+        today = now.date().isoformat()
+        tomorrow = (now.replace(hour=0, minute=0, second=0, microsecond=0)
+                    + timedelta(days=1) - now).total_seconds()
+        remaining = self.daily_quota - self.queue.used(today) if self.daily_quota else self.slice_size
+        if remaining <= 0:
+            return None, 0, tomorrow
+
+        wait = float('inf')
+        epoch = now.timestamp()
+        ready: List[Tuple[Job, int]] = []
+        for job in self.queue.jobs(STATUS_QUEUED):
+            if job.not_before > epoch:
+                wait = min(wait, job.not_before - epoch)
+                continue
+            if not job.window.contains(now):
+                wait = min(wait, (job.window.next_open(now) - now).total_seconds())
+                continue
+            quota = job.daily_quota - self.queue.used(today, job.id) if job.daily_quota else remaining
+            if quota <= 0:
+                wait = min(wait, tomorrow)
+                continue
+            ready.append((job, quota))
+        if not ready:
+            return None, 0, wait
+
+        job, quota = min(ready, key=lambda item: (item[0].last_run, item[0].created))
+        return job, min(self.slice_size, remaining, quota), 0.0
+
+    def run_slice(self, job: Job, size: int, now: Optional[datetime] = None) -> bool:
+        """
+        Envía un tramo de la campaña
+
+        Returns:
+            True si la campaña ha terminado (o ha fallado)
+        """
+        day = (now or datetime.now()).date().isoformat()
+        logging.info(f"Campaña {job.id}: tramo de hasta {size} destinatarios")
+        try:
+            list_key = self._list_key(job)
+            # Si la lista ha cambiado la posición guardada ya no vale: se
+            # recorre desde el principio y el diario completo evita reenvíos
+            position, journal_offset = ((job.position, job.journal_offset)
+                                        if list_key == job.list_key else (0, 0))
+            self.sender.send_bulk_emails(
+                job.email_list_file, job.template_file, job.subject, job.attachments or None,
+                campaign_id=job.id, resume=True, retry_failed=False, max_messages=size,
+                rate_limiter=self.rate_limiter, show_summary=False, count_total=False,
+                start=position, journal_offset=journal_offset)
+        except Exception as e:
+            logging.error(f"Campaña {job.id} detenida: {e}")
+            self.queue.set_status(job.id, STATUS_ERROR, str(e))
+            print(f"❌ Campaña {job.id} detenida: {e}")
+            return True
+
+        stats = self.sender.last_stats
+        attempted = stats.sent + stats.failed
+        journal = SendJournal.path_for(job.id, self.settings)
+        self.queue.record_slice(job.id, day, stats.sent, stats.failed, stats.position,
+                                os.path.getsize(journal) if os.path.exists(journal) else 0, list_key)
+        print(f"📤 Campaña {job.id}: {stats.sent} enviados y {stats.failed} fallidos en este tramo")
+        if attempted < size:
+            # La lista se agotó antes de completar el tramo
+            self.queue.set_status(job.id, STATUS_DONE)
+            job = self.queue.get(job.id)
+            logging.info(f"Campaña {job.id} completada: {job.sent} enviados, {job.failed} fallidos")
+            print(f"✅ Campaña {job.id} completada: {job.sent} enviados, {job.failed} fallidos")
+            return True
+        return False
+
+    def run(self, once: bool = False):
+        """
+        Envía las campañas de la cola hasta que se llama a stop() (o Ctrl+C / SIGTERM)
+
+        Args:
+            once: Enviar lo que se pueda enviar ahora y terminar (p. ej. desde
+                el Programador de tareas o cron) en lugar de quedarse esperando
+        """
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        quota = f"{self.daily_quota} correos/día" if self.daily_quota else "sin cuota diaria"
+        logging.info(f"Planificador iniciado ({quota}, tramos de {self.slice_size})")
+        try:
+            while not self._stop.is_set():
+                self.process_bounces()
+                now = datetime.now()
+                job, size, wait = self.next_slice(now)
+                if job is not None:
+                    self._open_pool()
+                    self.run_slice(job, size, now)
+                    continue
+                if once:
+                    break
+                # Sin nada que enviar no se mantienen sesiones abiertas
+                self._close_pool()
+                if wait != float('inf'):
+                    logging.info(f"Nada que enviar ahora; siguiente comprobación en "
+                                 f"{min(wait, self.poll_interval):.0f} s")
+                # Se despierta cada poll_interval para ver campañas nuevas
+                self._stop.wait(min(wait, self.poll_interval))
+        except KeyboardInterrupt:
+            print("\n⏹️ Planificador detenido por el usuario")
+        finally:
+            self._close_pool()
+            logging.info("Planificador detenido")
+
+    def process_bounces(self):
+        """
+        Lee el buzón de rebotes (como mucho una vez cada poll_interval) para
+        que los rebotes de tramos anteriores se supriman antes del siguiente
+        """
+        if self.bounces is None or time.monotonic() - self._bounces_checked < self.poll_interval:
+            return
+        self._bounces_checked = time.monotonic()
+        try:
+            self.bounces.process()
+        except (OSError, ValueError, sqlite3.Error) as e:
+            logging.warning(f"No se pudieron procesar los rebotes: {e}")
+
+    def _list_key(self, job: Job) -> str:
+        """Versión de la lista y del orden de envío a la que se refiere la posición guardada"""
+        return json.dumps({
+            **ContactStore.source_signature(job.email_list_file),
+            'group_by_domain': self.settings.get('group_by_domain', False),
+            'dedupe_recipients': self.settings.get('dedupe_recipients', True),
+            'contact_store': self.settings.get('contact_store', True),
+        }, sort_keys=True)
+
+    def _open_pool(self):
+        if self.sender.pool is None:
+            from smtp_pool import SMTPConnectionPool
+            self.sender.pool = SMTPConnectionPool.from_config(
+                self.sender.config,
+                size=max(self.settings.get('concurrency', 1), self.settings.get('pool_size', 1)),
+                metrics=self.sender.metrics)
+
+    def _close_pool(self):
+        if self.sender.pool is not None:
+            self.sender.pool.close()
+            self.sender.pool = None
+
+    def close(self):
+        self._close_pool()
+        if self.bounces is not None:
+            self.bounces.close()
+        self.queue.close()
+
+
+def _print_jobs(queue: JobQueue, today: str):
+    jobs = queue.jobs()
+    if not jobs:
+        print("📭 No hay campañas en la cola")
+        return
+    for job in jobs:
+        quota = f", cuota {queue.used(today, job.id)}/{job.daily_quota} hoy" if job.daily_quota else ""
+        start = (f", desde {datetime.fromtimestamp(job.not_before):%Y-%m-%d %H:%M}"
+                 if job.not_before else "")
+        print(f"📋 {job.id} [{job.status}] {job.subject}")
+        print(f"   {job.email_list_file} → {job.sent} enviados, {job.failed} fallidos; "
+              f"franja {job.window}{start}{quota}")
+        if job.error:
+            print(f"   ❌ {job.error}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Gestión de la cola y ejecución del planificador desde la línea de comandos"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Planificador de campañas de Tavolo Casa")
+    parser.add_argument('--config', default="config.json",
+                        help="Archivo de configuración (por defecto config.json)")
+    parser.add_argument('--db', help="Cola de campañas (por defecto email_settings.scheduler.db)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help="Encolar una campaña")
+    add.add_argument('--csv', required=True, dest='email_list_file', help="Lista de correos")
+    add.add_argument('--template', required=True, dest='template_file', help="Plantilla HTML")
+    add.add_argument('--subject', required=True, help="Asunto del correo")
+    add.add_argument('--attach', action='append', default=[], metavar='ARCHIVO', dest='attachments',
+                     help="Archivo adjunto (se puede repetir)")
+    add.add_argument('--window', default='00:00-24:00', metavar='HH:MM-HH:MM',
+                     help="Franja horaria de envío (por defecto todo el día)")
+    add.add_argument('--days', default='', metavar='DÍAS',
+                     help=f"Días de envío, p. ej. lun-vie (días: {', '.join(DAY_NAMES)})")
+    add.add_argument('--start', metavar='AAAA-MM-DDTHH:MM', help="No empezar antes de esta fecha")
+    add.add_argument('--daily-quota', type=int, help="Máximo de envíos diarios de esta campaña")
+    add.add_argument('--campaign-id', help="Identificador de la campaña")
+
+    commands.add_parser('list', help="Mostrar las campañas de la cola")
+    for name, help_text in (('pause', "Pausar campañas"), ('resume', "Reanudar campañas pausadas o con error"),
+                            ('cancel', "Cancelar campañas")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('campaign_ids', nargs='+', metavar='CAMPAÑA')
+
+    run = commands.add_parser('run', help="Ejecutar el planificador")
+    run.add_argument('--once', action='store_true',
+                     help="Enviar lo que toque ahora y terminar en lugar de seguir esperando")
+
+    args = parser.parse_args(argv)
+    try:
+        scheduler = CampaignScheduler(args.config, args.db)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"❌ Error: {e}")
+        return 1
+
+    try:
+        queue = scheduler.queue
+        if args.command == 'add':
+            for path in [args.email_list_file, args.template_file] + args.attachments:
+                if not os.path.isfile(path):
+                    print(f"❌ Error: No se encuentra el archivo {path}")
+                    return 1
+            try:
+                not_before = datetime.fromisoformat(args.start).timestamp() if args.start else None
+                job = queue.add(args.email_list_file, args.template_file, args.subject,
+                                args.attachments, args.window, args.days, not_before,
+                                args.daily_quota, args.campaign_id)
+            except ValueError as e:
+                print(f"❌ Error: {e}")
+                return 1
+            print(f"✅ Campaña {job.id} encolada (franja {job.window})")
+        elif args.command == 'list':
+            _print_jobs(queue, datetime.now().date().isoformat())
+        elif args.command in ('pause', 'resume', 'cancel'):
+            status = {'pause': STATUS_PAUSED, 'resume': STATUS_QUEUED, 'cancel': STATUS_CANCELLED}[args.command]
+            for campaign_id in args.campaign_ids:
+                if queue.set_status(campaign_id, status):
+                    print(f"✅ Campaña {campaign_id}: {status}")
+                else:
+                    print(f"❌ Campaña {campaign_id} no encontrada")
+        elif args.command == 'run':
+            scheduler.run(once=args.once)
+        return 0
+    finally:
+        scheduler.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
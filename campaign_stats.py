@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Estadísticas de campaña para el sistema de correos Tavolo Casa
+Contadores, velocidad alcanzada y resumen final del envío
+"""
+
+import time
+from typing import Dict, List, Optional
+
+from metrics import Histogram
+
+
+class CampaignStats:
+    """Acumula los resultados de una campaña y genera el resumen"""
+
+    def __init__(self, expected: Optional[int] = None, dry_run: bool = False):
+        """
+        Args:
+            expected: Número estimado de contactos (None si no se conoce)
+            dry_run: Simulación: los mensajes se generan pero no se envían
+        """
+        self.expected = expected
+        self.dry_run = dry_run
+        self.sent = 0
+        self.rendered = 0  # mensajes generados sin enviar (simulación)
+        self.failed = 0
+        self.skipped = 0
+        self.suppressed = 0
+        self.first_try = 0
+        self.retried_success = 0
+        self.retries = 0
+        # Contactos de la lista ya recorridos, en el orden de envío (ver
+        # send_bulk_emails start); la siguiente ejecución puede seguir desde aquí
+        self.position = 0
+        # Enviados y fallos por variante de plantilla (solo campañas con varias)
+        self.variants: Dict[str, Dict[str, int]] = {}
+        # Latencia por lote en un histograma de cubos fijos: ocupa lo mismo
+        # sea cual sea el número de lotes y se combina entre shards
+        self.batch_latency = Histogram()
+        self.batch_messages = 0
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    @classmethod
+    def merge(cls, parts: List["CampaignStats"], started: Optional[float] = None) -> "CampaignStats":
+        """
+        Combina las estadísticas de varios shards de una misma campaña
+
+        Args:
+            parts: Estadísticas de cada shard
+            started: Inicio de la campaña completa (time.monotonic del coordinador)
+        """
+        expected = [part.expected for part in parts]
+        merged = cls(sum(expected) if None not in expected else None,
+                     any(part.dry_run for part in parts))
+        for part in parts:
+            for field in ('sent', 'rendered', 'failed', 'skipped', 'suppressed', 'first_try',
+                          'retried_success', 'retries', 'batch_messages'):
+                setattr(merged, field, getattr(merged, field) + getattr(part, field))
+            merged.batch_latency.merge(part.batch_latency.snapshot())
+            for name, counts in part.variants.items():
+                merged_counts = merged.variants.setdefault(name, {'sent': 0, 'failed': 0})
+                for key, value in counts.items():
+                    merged_counts[key] += value
+        if started is not None:
+            merged.started = started
+        return merged
+
+    @property
+    def succeeded(self) -> int:
+        """Contactos con el mensaje enviado (o generado, en una simulación)"""
+        return self.rendered if self.dry_run else self.sent
+
+    @property
+    def processed(self) -> int:
+        return self.succeeded + self.failed
+
+    @property
+    def total(self) -> int:
+        """Contactos procesados (se conoce con certeza al terminar)"""
+        return self.processed
+
+    @property
+    def progress_total(self) -> str:
+        """Total mostrado en las líneas de progreso [i/total]"""
+        return str(self.expected) if self.expected is not None else '?'
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished if self.finished is not None else time.monotonic()
+        return end - self.started
+
+    @property
+    def rate(self) -> float:
+        """Mensajes enviados (o generados, en una simulación) por segundo"""
+        elapsed = self.elapsed
+        return self.succeeded / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def result(self) -> str:
+        """Resultado para la línea final del log"""
+        if self.dry_run:
+            return f"Generados: {self.rendered}/{self.total} (simulación, {self.rate:.2f} mensajes/s)"
+        return f"Éxito: {self.sent}/{self.total} ({self.rate:.2f} correos/s)"
+
+    def record(self, success: bool, attempt: int = 0, variant: Optional[str] = None):
+        """
+        Registra el resultado definitivo de un contacto
+
+        Args:
+            success: Si el correo se envió (o se generó, en una simulación)
+            attempt: Reintentos que hicieron falta (0 = primer intento)
+            variant: Variante de plantilla que recibió el contacto
+        """
+        if variant is not None:
+            counts = self.variants.setdefault(variant, {'sent': 0, 'failed': 0})
+            counts['sent' if success else 'failed'] += 1
+        if success and self.dry_run:
+            self.rendered += 1
+        elif success:
+            self.sent += 1
+            if attempt:
+                self.retried_success += 1
+            else:
+                self.first_try += 1
+        else:
+            self.failed += 1
+
+    def retry(self):
+        """Un fallo transitorio se ha reprogramado"""
+        self.retries += 1
+
+    def record_batch(self, seconds: float, size: int):
+        """Registra la latencia de envío de un lote de size mensajes"""
+        if size:
+            self.batch_latency.observe(seconds)
+            self.batch_messages += size
+
+    def skip(self):
+        """Contacto omitido por haber recibido ya el correo (reanudación)"""
+        self.skipped += 1
+
+    def suppress(self, count: int = 1):
+        """Contactos excluidos por estar en la lista de supresión"""
+        self.suppressed += count
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    def as_dict(self) -> Dict:
+        return {
+            'total': self.total,
+            'sent': self.sent,
+            **({'dry_run': True, 'rendered': self.rendered} if self.dry_run else {}),
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'suppressed': self.suppressed,
+            'first_try': self.first_try,
+            'retried_success': self.retried_success,
+            'retries': self.retries,
+            'batches': self.batch_latency.count,
+            'batch_latency_avg': (round(self.batch_latency.sum / self.batch_latency.count, 4)
+                                  if self.batch_latency.count else 0.0),
+            'elapsed_seconds': round(self.elapsed, 3),
+            'messages_per_second': round(self.rate, 3),
+            **({'variants': self.variants} if self.variants else {}),
+        }
+
+    def print_summary(self):
+        total = self.total
+        if self.dry_run:
+            print(f"\n📊 RESUMEN DE LA SIMULACIÓN:")
+            print(f"Total contactos: {total}")
+            print(f"Mensajes generados (sin enviar): {self.rendered}")
+            print(f"Fallos al generar: {self.failed}")
+        else:
+            print(f"\n📊 RESUMEN DEL ENVÍO:")
+            print(f"Total contactos: {total}")
+            print(f"Enviados exitosamente: {self.sent}")
+            print(f"  - Al primer intento: {self.first_try}")
+            print(f"  - Tras reintentar: {self.retried_success}")
+            print(f"Fallos definitivos: {self.failed}")
+        if self.retries:
+            print(f"Reintentos programados: {self.retries}")
+        if self.skipped:
+            print(f"Omitidos (ya enviados): {self.skipped}")
+        if self.suppressed:
+            print(f"Suprimidos (bajas, rebotes o quejas): {self.suppressed}")
+        if total:
+            print(f"Tasa de éxito: {(self.succeeded/total)*100:.1f}%")
+        print(f"Duración: {self.elapsed:.1f} s")
+        print(f"Velocidad: {self.rate:.2f} {'mensajes generados' if self.dry_run else 'correos'}/s")
+        latency = self.batch_latency.snapshot()
+        batches = latency['count']
+        if batches and self.batch_messages > batches:
+            # Los cuantiles son el límite superior del cubo que los contiene
+            print(f"Lotes: {batches} (media {self.batch_messages / batches:.1f} correos/lote)")
+            print(f"Latencia por lote: media {latency['avg']:.3f} s, p50 ≤{latency['p50']:.3f} s, "
+                  f"p95 ≤{latency['p95']:.3f} s, máx {latency['max']:.3f} s")
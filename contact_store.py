@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Almacén columnar de contactos para el sistema de correos Tavolo Casa
+La lista se importa una vez a un archivo binario (cadenas internadas y
+columnas de enteros) que las campañas siguientes leen con mmap sin copiarlo
+"""
+
+import csv
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from recipient_index import (CONTACT_FIELDS, REASON_DUPLICATE, REASON_INVALID, REASON_MERGED,
+                             REPORT_HEADER, email_domain, normalize_email)
+
+MAGIC = b'TAVOLOC1'
+FORMAT_VERSION = 1
+SUFFIX = '.contactos'
+
+# Columnas que tiene siempre el almacén, en este orden (las demás del CSV van detrás)
+BASE_COLUMNS = ('email',) + CONTACT_FIELDS
+
+_HEADER_SIZE = struct.Struct('<I')
+
+
+def _aligned(position: int) -> int:
+    return (position + 7) & ~7
+
+
+class Contact(Mapping):
+    """
+    Contacto del almacén: solo guarda su número de fila
+
+    Se usa como el diccionario de iter_email_list (contact['email'],
+    contact.get('nombre')), pero cada valor se decodifica del archivo
+    mapeado al pedirlo, sin un dict por fila.
+    """
+
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store: "ContactStore", row: int):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, column: str) -> str:
+        return self._store.value(self._row, column)
+
+    def get(self, column: str, default=None):
+        if column in self._store.column_index:
+            return self._store.value(self._row, column)
+        return default
+
+    def __contains__(self, column) -> bool:
+        return column in self._store.column_index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._store.columns)
+
+    def __len__(self) -> int:
+        return len(self._store.columns)
+
+    def __repr__(self) -> str:
+        return f"Contact({dict(self)!r})"
+
+
+class ContactStore:
+    """
+    Lista de destinatarios únicos importada a un archivo binario columnar
+
+    El archivo contiene una tabla de cadenas sin repetir (cada nombre,
+    empresa o dominio se guarda una sola vez) y, por cada columna, un array
+    de enteros con el índice de la cadena de cada fila, además del dominio,
+    el hash de shard y el orden por dominio precalculados. Al abrirlo se
+    mapea en memoria: las columnas son vistas sobre el archivo y los valores
+    se decodifican solo cuando un contacto los pide. La importación aplica la
+    misma depuración que RecipientIndex (direcciones normalizadas, inválidas
+    y duplicadas descartadas, campos vacíos completados con los duplicados).
+    """
+
+    def __init__(self, path: str, cache_size: int = 65536):
+        """
+        Args:
+            path: Archivo del almacén creado con build()
+            cache_size: Cadenas decodificadas que se conservan como máximo
+                (nombres, empresas...; las direcciones no se repiten y no se guardan)
+        """
+        self.path = path
+        self.cache_size = cache_size
+        self._decoded: Dict[int, str] = {}
+        with open(path, 'rb') as f:
+            # El mapeo conserva su propio descriptor: el archivo puede cerrarse ya
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"{path} está vacío") from None
+        self._views: List[memoryview] = []
+        try:
+            self._open()
+        except Exception:
+            self.close()
+            raise
+
+    def _open(self):
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} no es un almacén de contactos")
+        (header_size,) = _HEADER_SIZE.unpack_from(self._mmap, len(MAGIC))
+        start = len(MAGIC) + _HEADER_SIZE.size
+        self.header: Dict = json.loads(self._mmap[start:start + header_size])
+        if (self.header.get('version') != FORMAT_VERSION
+                or self.header.get('byteorder') != sys.byteorder):
+            raise ValueError(f"{self.path} tiene un formato distinto (vuelve a importarlo)")
+
+        self.columns: List[str] = self.header['columns']
+        self.column_index = {name: position for position, name in enumerate(self.columns)}
+        self.rows: int = self.header['rows']
+        self.rows_read: int = self.header['rows_read']
+        self.duplicates: int = self.header['duplicates']
+        self.merged: int = self.header['merged']
+        self.invalid: int = self.header['invalid']
+        self.report_file: Optional[str] = self.header.get('report_file')
+
+        view = memoryview(self._mmap)
+        self._views.append(view)
+        position = _aligned(start + header_size)
+
+        def section(size: int, code: str) -> memoryview:
+            nonlocal position
+            length = size * array(code).itemsize
+            part = view[position:position + length].cast(code)
+            self._views.append(part)
+            position = _aligned(position + length)
+            return part
+
+        self._offsets = section(self.header['strings'] + 1, 'Q')
+        self._by_name = {name: section(self.rows, 'I') for name in self.columns}
+        self._domains = section(self.rows, 'I')
+        self._hashes = section(self.rows, 'I')
+        self._domain_order = section(self.rows, 'I')
+        self._blob = view[position:position + self._offsets[-1]]
+        self._views.append(self._blob)
+
+    @staticmethod
+    def path_for(csv_file: str, settings: Dict) -> str:
+        """Ruta del almacén de una lista según email_settings.contact_store_dir"""
+        key = hashlib.sha1(os.path.abspath(csv_file).encode('utf-8')).hexdigest()[:12]
+        return os.path.join(settings.get('contact_store_dir', 'contactos'),
+                            f"{os.path.splitext(os.path.basename(csv_file))[0]}-{key}{SUFFIX}")
+
+    @staticmethod
+    def source_signature(csv_file: str) -> Dict:
+        stat = os.stat(csv_file)
+        return {'path': os.path.abspath(csv_file), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+    @classmethod
+    def for_csv(cls, csv_file: str, settings: Dict) -> "ContactStore":
+        """
+        Almacén de la lista, importándola de nuevo solo si el CSV ha cambiado
+
+        Args:
+            csv_file: Lista de correos
+            settings: email_settings (contact_store_dir)
+        """
+        path = cls.path_for(csv_file, settings)
+        signature = cls.source_signature(csv_file)
+        if os.path.exists(path):
+            try:
+                store = cls(path)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Almacén de contactos {path} ilegible ({e}), se vuelve a importar")
+            else:
+                if store.header.get('source') == signature:
+                    logging.info(f"Almacén de contactos {path}: {len(store)} destinatarios "
+                                 f"(sin volver a leer {csv_file})")
+                    return store
+                store.close()
+                logging.info(f"{csv_file} ha cambiado: se vuelve a importar")
+        return cls.build(csv_file, path)
+
+    @classmethod
+    def build(cls, csv_file: str, path: str, report_file: Optional[str] = None) -> "ContactStore":
+        """
+        Importa un CSV con el formato de lista_correos.csv
+
+        Args:
+            csv_file: Lista de correos
+            path: Archivo del almacén (se sustituye de forma atómica)
+            report_file: CSV donde anotar las filas descartadas o fusionadas
+                (por defecto junto al almacén, con extensión .descartados.csv)
+        """
+        report_file = report_file or os.path.splitext(path)[0] + '.descartados.csv'
+        signature = cls.source_signature(csv_file)
+        strings: List[str] = ['']
+        interned: Dict[str, int] = {'': 0}
+        # Por cadena: fila del almacén + 1 si es una dirección normalizada ya
+        # conservada (0 = ninguna); evita un segundo diccionario de direcciones
+        kept = array('I', [0])
+
+        def intern(value: str) -> int:
+            number = interned.get(value)
+            if number is None:
+                number = interned[value] = len(strings)
+                strings.append(value)
+                kept.append(0)
+            return number
+
+        rows_read = invalid = duplicates = merged = 0
+        row_numbers = array('I')
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(csv_file, 'r', encoding='utf-8-sig', newline='') as f, \
+                open(report_file, 'w', encoding='utf-8', newline='') as report:
+            writer = csv.writer(report)
+            writer.writerow(REPORT_HEADER)
+            reader = csv.reader(f)
+            header = [name.strip() for name in next(reader, [])]
+            if 'email' not in header:
+                raise ValueError(f"{csv_file} no tiene columna email")
+            columns = list(BASE_COLUMNS) + [name for name in dict.fromkeys(header)
+                                            if name and name not in BASE_COLUMNS]
+            positions = [header.index(name) if name in header else None for name in columns]
+            email_position = positions[0]
+            data = [array('I') for _ in columns]
+            domains, hashes = array('I'), array('I')
+
+            # fila 1 = cabecera, igual que al abrir el CSV en una hoja de cálculo
+            for row_number, row in enumerate(reader, 2):
+                rows_read += 1
+                raw = row[email_position] if email_position < len(row) else ''
+                key = normalize_email(raw)
+                if key is None:
+                    invalid += 1
+                    writer.writerow([row_number, raw, REASON_INVALID, '', ''])
+                    continue
+                values = [(row[position] if position is not None and position < len(row) else '').strip()
+                          for position in positions[1:]]
+                key_number = intern(key)
+                existing = kept[key_number] - 1
+                if existing < 0:
+                    kept[key_number] = len(row_numbers) + 1
+                    row_numbers.append(row_number)
+                    data[0].append(intern(raw.strip()))
+                    for column, value in zip(data[1:], values):
+                        column.append(intern(value))
+                    domains.append(intern(email_domain(key)))
+                    hashes.append(zlib.crc32(key.encode('utf-8')))
+                    continue
+
+                duplicates += 1
+                # Se completan los campos de contacto vacíos de la fila conservada
+                filled = False
+                for column, value in zip(data[1:len(BASE_COLUMNS)], values):
+                    if value and not strings[column[existing]]:
+                        column[existing] = intern(value)
+                        filled = True
+                if filled:
+                    merged += 1
+                writer.writerow([row_number, raw, REASON_MERGED if filled else REASON_DUPLICATE,
+                                 key, row_numbers[existing]])
+
+        del interned, kept
+        rows = len(row_numbers)
+        # Orden por dominio: filas agrupadas por dominio (pocos) sin ordenar toda la lista
+        by_domain: Dict[int, array] = {}
+        for row, domain in enumerate(domains):
+            rows_of_domain = by_domain.get(domain)
+            if rows_of_domain is None:
+                rows_of_domain = by_domain[domain] = array('I')
+            rows_of_domain.append(row)
+        domain_order = array('I')
+        for domain in sorted(by_domain, key=strings.__getitem__):
+            domain_order.extend(by_domain.pop(domain))
+
+        offsets = array('Q', [0])
+        total = 0
+        for value in strings:
+            total += len(value) if value.isascii() else len(value.encode('utf-8'))
+            offsets.append(total)
+
+        header_bytes = json.dumps({
+            'version': FORMAT_VERSION, 'byteorder': sys.byteorder, 'source': signature,
+            'columns': columns, 'rows': rows, 'strings': len(strings), 'rows_read': rows_read,
+            'duplicates': duplicates, 'merged': merged, 'invalid': invalid,
+            'report_file': report_file,
+        }, ensure_ascii=False).encode('utf-8')
+
+        fd, temporary = tempfile.mkstemp(prefix='.importando-', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(MAGIC + _HEADER_SIZE.pack(len(header_bytes)) + header_bytes)
+                for section in (offsets, *data, domains, hashes, domain_order):
+                    out.write(b'\0' * (_aligned(out.tell()) - out.tell()))
+                    section.tofile(out)
+                out.write(b'\0' * (_aligned(out.tell()) - out.tell()))
+                for start in range(0, len(strings), 65536):
+                    out.write(''.join(strings[start:start + 65536]).encode('utf-8'))
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+        logging.info(f"Lista {csv_file} importada en {path}: {rows} únicos de {rows_read} filas "
+                     f"({duplicates} duplicados, {merged} fusionados, {invalid} inválidos; "
+                     f"{len(strings)} cadenas distintas)")
+        return cls(path)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def value(self, row: int, column: str) -> str:
+        """Valor de una columna de una fila (decodificado del archivo mapeado)"""
+        number = self._by_name[column][row]
+        text = self._decoded.get(number)
+        if text is None:
+            text = str(self._blob[self._offsets[number]:self._offsets[number + 1]], 'utf-8')
+            if column != 'email' and len(self._decoded) < self.cache_size:
+                # Cadena internada: todas las filas que la usan comparten el mismo str
+                self._decoded[number] = text
+        return text
+
+    def count(self, shard: Optional[Tuple[int, int]] = None) -> int:
+        """Destinatarios de la lista, o de un shard (mismo reparto que recipient_index.shard_of)"""
+        if shard is None:
+            return self.rows
+        number, shards = shard
+        return sum(1 for value in self._hashes if value % shards == number)
+
+    def iter_contacts(self, group_by_domain: bool = False,
+                      shard: Optional[Tuple[int, int]] = None, start: int = 0) -> Iterator[Contact]:
+        """
+        Recorre los destinatarios en el orden del CSV (o agrupados por dominio)
+
+        Args:
+            group_by_domain: Entregar seguidos los contactos de cada dominio
+            shard: (shard, total) para recorrer solo las direcciones de ese shard
+            start: Posición en ese orden desde la que empezar (sin recorrer las anteriores)
+        """
+        rows = self._domain_order if group_by_domain else range(self.rows)
+        rows = rows[start:]
+        if shard is None:
+            for row in rows:
+                yield Contact(self, row)
+            return
+        number, shards = shard
+        hashes = self._hashes
+        for row in rows:
+            if hashes[row] % shards == number:
+                yield Contact(self, row)
+
+    def __iter__(self) -> Iterator[Contact]:
+        return self.iter_contacts()
+
+    def __getitem__(self, row: int) -> Contact:
+        if not 0 <= row < self.rows:
+            raise IndexError(row)
+        return Contact(self, row)
+
+    def close(self):
+        # Las vistas deben liberarse antes de cerrar el mapeo
+        for view in reversed(self._views):
+            view.release()
+        self._views.clear()
+        self._decoded.clear()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Importación y consulta del almacén desde la línea de comandos"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Almacén de contactos de Tavolo Casa")
+    parser.add_argument('--config', default="config.json",
+                        help="Archivo de configuración (por defecto config.json)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    load = commands.add_parser('import', help="Importar (o actualizar) una lista de correos")
+    load.add_argument('csv_file')
+    info = commands.add_parser('info', help="Mostrar el contenido de un almacén")
+    info.add_argument('csv_file')
+    args = parser.parse_args(argv)
+
+    settings: Dict = {}
+    if os.path.exists(args.config):
+        with open(args.config, 'r', encoding='utf-8') as f:
+            settings = json.load(f).get('email_settings', {})
+    if not os.path.exists(args.csv_file):
+        print(f"❌ Error: No se encuentra el archivo {args.csv_file}")
+        return 1
+
+    if args.command == 'import':
+        with ContactStore.build(args.csv_file, ContactStore.path_for(args.csv_file, settings)) as store:
+            print(f"✅ {len(store)} contactos importados en {store.path} "
+                  f"({os.path.getsize(store.path) / 1024:.0f} KB)")
+            print(f"🧹 {store.duplicates} duplicados ({store.merged} fusionados) y {store.invalid} "
+                  f"inválidos omitidos (informe: {store.report_file})")
+    else:
+        path = ContactStore.path_for(args.csv_file, settings)
+        if not os.path.exists(path):
+            print(f"❌ {args.csv_file} no se ha importado todavía")
+            return 1
+        with ContactStore(path) as store:
+            current = store.header['source'] == ContactStore.source_signature(args.csv_file)
+            print(f"📊 {store.path}: {len(store)} contactos, {store.header['strings']} cadenas distintas, "
+                  f"columnas {', '.join(store.columns)}")
+            print("✅ Al día con el CSV" if current else "🔁 El CSV ha cambiado: se reimportará al enviar")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -8,9 +8,10 @@ echo.
 echo 1. Configuracion inicial del sistema
 echo 2. Enviar correo de prueba
 echo 3. Enviar correos masivos
-echo 4. Salir
+echo 4. Iniciar programador de campanas
+echo 5. Salir
 echo.
-set /p choice="Ingresa tu opcion (1-4): "
+set /p choice="Ingresa tu opcion (1-5): "
 
 if "%choice%"=="1" (
     echo.
@@ -28,6 +29,11 @@ if "%choice%"=="1" (
     python email_sender.py
     pause
 ) else if "%choice%"=="4" (
+    echo.
+    echo Iniciando programador de campanas ^(Ctrl+C para detenerlo^)...
+    python campaign_scheduler.py run
+    pause
+) else if "%choice%"=="5" (
     echo.
     echo Saliendo del sistema...
     exit
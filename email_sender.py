@@ -4,21 +4,44 @@ Script de automatización de correos para Tavolo Casa
 Automatiza el envío de correos masivos a listas de destinatarios
 """
 
-import smtplib
-import ssl
+from __future__ import annotations
+
 import csv
 import json
 import logging
+import re
+import sys
+import threading
 import time
-from datetime import datetime
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
-from pathlib import Path
-from typing import List, Dict, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from typing import TYPE_CHECKING, Deque, Iterator, List, Dict, NamedTuple, Optional, Sequence, Tuple, Union
 import os
 
+from attachment_cache import AttachmentCache, build_attachment_part
+from campaign_stats import CampaignStats
+from contact_store import ContactStore
+from inline_images import InlineImage, attach_related
+from log_pipeline import configure_logging, log_event
+from message_builder import MessageSkeleton, to_wire
+from metrics import MetricsRegistry, ProfileHook
+from rate_limiter import RateLimiter
+from recipient_index import RecipientIndex, shard_of
+from retry_queue import TRANSIENT, RetryScheduler, classify_error
+from send_journal import STATUS_FAILED, STATUS_SENT, DryRunJournal, SendJournal, make_campaign_id
+from suppression import SuppressionList
+from template_engine import CompiledTemplate, campaign_variables
+from template_registry import VARIANT_STAGE_PREFIX, TemplateRegistry, Variant, VariantSelector
+
+# smtplib, ssl y email.mime se importan al construir o enviar el primer
+# mensaje: un arranque que no envía nada (--help, errores de configuración,
+# listas vacías) no paga su importación
+if TYPE_CHECKING:
+    import argparse
+    from email.mime.multipart import MIMEMultipart
+    from smtp_pool import SMTPConnectionPool
+
 class TavoloCasaEmailSender:
     def __init__(self, config_file: str = "config.json"):
         """
@@ -28,6 +51,12 @@ class TavoloCasaEmailSender:
             config_file: Ruta al archivo de configuración
         """
         self.config = self.load_config(config_file)
+        self.pool: Optional[SMTPConnectionPool] = None
+        self._template_cache: Dict[str, CompiledTemplate] = {}
+        self.templates = TemplateRegistry.from_settings(self.config.get('email_settings', {}))
+        self.attachment_cache: Optional[AttachmentCache] = None
+        self.metrics = MetricsRegistry()
+        self.last_stats: Optional[CampaignStats] = None
         self.setup_logging()
         
     def load_config(self, config_file: str) -> Dict:
@@ -43,22 +72,23 @@ class TavoloCasaEmailSender:
             raise
     
     def setup_logging(self):
-        """Configura el sistema de logging"""
-        log_file = f"email_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
-                logging.StreamHandler()
-            ]
-        )
-        logging.info("Sistema de correos Tavolo Casa iniciado")
+        """
+        Configura el sistema de logging (una sola vez por proceso)
+        
+        Por defecto los registros se escriben desde un hilo aparte, por lotes,
+        en un archivo rotado por tamaño; "mode": "classic" en la sección
+        logging de la configuración recupera el archivo por ejecución.
+        """
+        configure_logging(self.config.get('logging'))
     
     def load_email_list(self, file_path: str) -> List[Dict[str, str]]:
         """
         Carga la lista de correos desde un archivo CSV
         
+        Devuelve las filas tal cual (sin deduplicar) como diccionarios; el
+        almacén columnar (contact_store) solo se usa al recorrer la lista
+        durante el envío.
+        
         Args:
             file_path: Ruta al archivo CSV con los correos
             
@@ -68,20 +98,40 @@ class TavoloCasaEmailSender:
         Formato esperado del CSV:
         email,nombre,apellido,empresa
         """
-        contacts = []
+        return list(self.iter_email_list(file_path))
+    
+    def iter_email_list(self, file_path: str,
+                        extra_fields: Sequence[str] = ()) -> Iterator[Dict[str, str]]:
+        """
+        Lee la lista de correos de forma perezosa, contacto a contacto
+        
+        La memoria usada no depende del tamaño del archivo: cada fila se
+        valida y se entrega en cuanto se lee.
+        
+        Args:
+            file_path: Ruta al archivo CSV con los correos
+            extra_fields: Otras columnas del CSV que conservar en cada contacto
+            
+        Yields:
+            Diccionarios con información de contactos válidos
+        """
+        count = 0
         try:
             with open(file_path, 'r', encoding='utf-8-sig') as f:
                 reader = csv.DictReader(f)
                 for row in reader:
                     if row.get('email') and '@' in row['email']:
-                        contacts.append({
+                        count += 1
+                        contact = {
                             'email': row['email'].strip(),
-                            'nombre': row.get('nombre', '').strip(),
-                            'apellido': row.get('apellido', '').strip(),
-                            'empresa': row.get('empresa', '').strip()
-                        })
-            logging.info(f"Cargados {len(contacts)} contactos desde {file_path}")
-            return contacts
+                            'nombre': (row.get('nombre') or '').strip(),
+                            'apellido': (row.get('apellido') or '').strip(),
+                            'empresa': (row.get('empresa') or '').strip()
+                        }
+                        for name in extra_fields:
+                            contact[name] = (row.get(name) or '').strip()
+                        yield contact
+            logging.info(f"Cargados {count} contactos desde {file_path}")
         except FileNotFoundError:
             logging.error(f"Archivo {file_path} no encontrado")
             raise
@@ -89,6 +139,27 @@ class TavoloCasaEmailSender:
             logging.error(f"Error al cargar lista de correos: {e}")
             raise
     
+    def count_email_list(self, file_path: str) -> int:
+        """
+        Cuenta rápidamente las filas de datos del CSV (sin parsearlo)
+        
+        Es una estimación para mostrar el progreso: cuenta saltos de línea,
+        así que incluye filas inválidas y campos con saltos de línea.
+        """
+        lines = 0
+        last = b'\n'
+        try:
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    lines += chunk.count(b'\n')
+                    last = chunk[-1:]
+        except FileNotFoundError:
+            logging.error(f"Archivo {file_path} no encontrado")
+            raise
+        if last != b'\n':
+            lines += 1
+        return max(0, lines - 1)  # sin la cabecera
+    
     def load_template(self, template_file: str) -> str:
         """Carga la plantilla HTML del correo"""
         try:
@@ -98,35 +169,43 @@ class TavoloCasaEmailSender:
             logging.error(f"Plantilla {template_file} no encontrada")
             raise
     
-    def personalize_email(self, template: str, contact: Dict[str, str]) -> str:
+    def compile_template(self, template: str, name: str = "plantilla") -> CompiledTemplate:
         """
-        Personaliza el correo con los datos del contacto
+        Compila la plantilla una vez por campaña
+        
+        Las variables constantes ({{FECHA}}, {{AÑO}}) se calculan aquí, de
+        modo que por contacto solo se rellenan sus propios datos.
         
         Args:
             template: Plantilla HTML del correo
+            name: Nombre usado al informar de marcadores desconocidos
+        """
+        compiled = self._template_cache.get(template)
+        if compiled is None:
+            compiled = CompiledTemplate.compile(template, name)
+            self._template_cache[template] = compiled
+        return compiled.bind(campaign_variables())
+    
+    def personalize_email(self, template: Union[str, CompiledTemplate],
+                          contact: Dict[str, str]) -> str:
+        """
+        Personaliza el correo con los datos del contacto
+        
+        Args:
+            template: Plantilla HTML del correo (texto o ya compilada)
             contact: Datos del contacto
             
         Returns:
             HTML personalizado
         """
-        # Variables disponibles para personalización
-        variables = {
-            '{{NOMBRE}}': contact.get('nombre', 'Estimado/a cliente'),
-            '{{APELLIDO}}': contact.get('apellido', ''),
-            '{{EMPRESA}}': contact.get('empresa', ''),
-            '{{NOMBRE_COMPLETO}}': f"{contact.get('nombre', '')} {contact.get('apellido', '')}".strip(),
-            '{{FECHA}}': datetime.now().strftime('%d de %B de %Y'),
-            '{{AÑO}}': str(datetime.now().year)
-        }
-        
-        personalized = template
-        for placeholder, value in variables.items():
-            personalized = personalized.replace(placeholder, value)
-            
-        return personalized
+        if not isinstance(template, CompiledTemplate):
+            template = self.compile_template(template)
+        return template.render(contact)
     
     def create_message(self, to_email: str, subject: str, html_content: str, 
-                      attachments: Optional[List[str]] = None) -> MIMEMultipart:
+                      attachments: Optional[List[str]] = None,
+                      text_content: Optional[str] = None,
+                      inline_images: Optional[Sequence[InlineImage]] = None) -> MIMEMultipart:
         """
         Crea el mensaje de correo
         
@@ -135,68 +214,91 @@ class TavoloCasaEmailSender:
             subject: Asunto del correo
             html_content: Contenido HTML del correo
             attachments: Lista de rutas de archivos adjuntos
+            text_content: Alternativa en texto plano (se añade antes del HTML,
+                que los clientes de correo prefieren por ir en último lugar)
+            inline_images: Imágenes cid: del HTML (van con él en multipart/related)
             
         Returns:
             Mensaje MIME configurado
         """
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+
         message = MIMEMultipart("alternative")
         message["Subject"] = subject
         message["From"] = f"{self.config['sender_name']} <{self.config['sender_email']}>"
         message["To"] = to_email
         
-        # Agregar contenido HTML
+        # Agregar texto plano y contenido HTML
+        if text_content is not None:
+            message.attach(MIMEText(text_content, "plain", "utf-8"))
         html_part = MIMEText(html_content, "html", "utf-8")
-        message.attach(html_part)
+        if inline_images:
+            # Partes ya codificadas una vez por campaña
+            message.attach(attach_related(html_part, inline_images))
+        else:
+            message.attach(html_part)
         
         # Agregar archivos adjuntos si existen
         if attachments:
             for file_path in attachments:
-                if os.path.isfile(file_path):
-                    with open(file_path, "rb") as attachment:
-                        part = MIMEBase('application', 'octet-stream')
-                        part.set_payload(attachment.read())
-                    
-                    encoders.encode_base64(part)
-                    part.add_header(
-                        'Content-Disposition',
-                        f'attachment; filename= {os.path.basename(file_path)}'
-                    )
+                if not os.path.isfile(file_path):
+                    continue
+                if self.attachment_cache is not None:
+                    # Campaña en curso: adjunto codificado una sola vez
+                    part = self.attachment_cache.get_part(file_path)
+                else:
+                    part = build_attachment_part(file_path)
+                if part is not None:
                     message.attach(part)
                     
         return message
     
-    def send_email(self, message: MIMEMultipart, to_email: str) -> bool:
+    def send_email(self, message: Union[MIMEMultipart, bytes], to_email: str) -> bool:
         """
         Envía un correo individual
         
         Args:
-            message: Mensaje MIME configurado
+            message: Mensaje MIME configurado, o ya serializado en bytes
             to_email: Dirección de destino
             
         Returns:
             True si el envío fue exitoso, False en caso contrario
         """
         try:
-            context = ssl.create_default_context()
-            
-            with smtplib.SMTP(self.config['smtp_server'], self.config['smtp_port']) as server:
-                server.starttls(context=context)
-                server.login(self.config['sender_email'], self.config['sender_password'])
-                
-                # Enviar mensaje como string
-                text = message.as_string()
-                server.sendmail(self.config['sender_email'], to_email, text)
-                
-            logging.info(f"Correo enviado exitosamente a {to_email}")
+            self._deliver(message, to_email)
             return True
-            
         except Exception as e:
             logging.error(f"Error al enviar correo a {to_email}: {e}")
             return False
     
+    def _deliver(self, message: Union[MIMEMultipart, bytes], to_email: str):
+        """Envía el mensaje y propaga cualquier error SMTP o de red"""
+        # Enviar mensaje como string (o bytes ya serializados)
+        text = message if isinstance(message, bytes) else message.as_string()
+        
+        if self.pool is not None:
+            # Campaña en curso: reutilizar una sesión ya autenticada
+            self.pool.sendmail(self.config['sender_email'], to_email, text)
+        else:
+            # Envío puntual: sesión de un solo uso
+            from smtp_pool import SMTPConnectionPool
+            with SMTPConnectionPool.from_config(self.config, size=1, metrics=self.metrics) as pool:
+                pool.sendmail(self.config['sender_email'], to_email, text)
+        
+        logging.info(f"Correo enviado exitosamente a {to_email}")
+    
     def send_bulk_emails(self, email_list_file: str, template_file: str, 
                         subject: str, attachments: Optional[List[str]] = None,
-                        delay_seconds: int = 2):
+                        delay_seconds: int = 2, concurrency: Optional[int] = None,
+                        count_total: bool = True, campaign_id: Optional[str] = None,
+                        resume: bool = False, profile: Optional[str] = None,
+                        shard: Optional[Tuple[int, int]] = None,
+                        rate_limiter: Optional[RateLimiter] = None,
+                        show_summary: bool = True, batch_size: Optional[int] = None,
+                        dry_run: bool = False, render_to: Optional[str] = None,
+                        max_messages: Optional[int] = None, retry_failed: bool = True,
+                        start: int = 0, journal_offset: int = 0) -> Dict:
         """
         Envía correos masivos a toda la lista
         
@@ -205,104 +307,687 @@ class TavoloCasaEmailSender:
             template_file: Archivo HTML con la plantilla del correo
             subject: Asunto del correo
             attachments: Lista de archivos adjuntos
-            delay_seconds: Segundos de espera entre envíos
+            delay_seconds: Segundos entre envíos si no hay rate_limits configurados
+            concurrency: Envíos simultáneos (por defecto email_settings.concurrency)
+            count_total: Contar antes las filas del CSV para mostrar [i/total];
+                si es False el progreso se muestra como [i/?] (con dedupe_recipients
+                el total se conoce siempre tras construir el índice)
+            campaign_id: Identificador de la campaña (por defecto se deriva de
+                la lista, la plantilla y el asunto)
+            resume: Omitir los destinatarios que ya constan como enviados en
+                el diario de la campaña
+            profile: Archivo .prof donde guardar un perfil cProfile de los
+                hilos de envío, solo del principal en Python 3.12+ (por
+                defecto email_settings.profile_file; sin perfil si no se indica)
+            shard: (shard, total) para enviar solo la parte de la lista que
+                corresponde a este proceso (ver sharded_runner)
+            rate_limiter: Limitador a usar en lugar del de email_settings (p. ej.
+                uno compartido entre procesos)
+            show_summary: Mostrar el resumen final por consola
+            batch_size: Mensajes por sesión y lote (por defecto email_settings.batch_size)
+            dry_run: Ejecutar carga, personalización y construcción sin conectar
+                con el servidor SMTP ni escribir el diario
+            render_to: Directorio donde guardar cada mensaje como archivo .eml
+                en lugar de enviarlo (implica dry_run)
+            max_messages: Enviar como mucho a este número de destinatarios
+                nuevos y terminar (con resume, la siguiente llamada continúa
+                donde se quedó; ver campaign_scheduler)
+            retry_failed: Al reanudar, volver a intentar los destinatarios que
+                constan como fallidos en el diario
+            start: Posición de la lista (en el orden de envío) desde la que
+                empezar; la alcanzada queda en last_stats.position
+            journal_offset: Con resume, byte del diario desde el que cargar
+                los entregados (los anteriores son de contactos previos a start)
+            
+        Returns:
+            Resumen de la campaña (enviados, fallos, reintentos, velocidad)
         """
-        # Cargar datos
-        contacts = self.load_email_list(email_list_file)
-        template = self.load_template(template_file)
+        settings = self.config.get('email_settings', {})
+        workers = max(1, concurrency or settings.get('concurrency', 1))
         
-        # Estadísticas
-        total_contacts = len(contacts)
-        sent_count = 0
-        failed_count = 0
+        # Métricas por etapa de esta campaña (se vuelcan periódicamente y al terminar)
+        self.metrics = MetricsRegistry(settings.get('metrics_exact_stages', ()))
+        # En modo shard las métricas las combina y escribe el proceso coordinador
+        metrics_file = settings.get('metrics_file') if shard is None else None
+        if metrics_file:
+            self.metrics.start_periodic(metrics_file, settings.get('metrics_interval', 30))
+        profile = profile or settings.get('profile_file')
+        profiler = ProfileHook() if profile else None
         
-        logging.info(f"Iniciando envío masivo a {total_contacts} contactos")
-        
-        for i, contact in enumerate(contacts, 1):
+        # Plantillas de cada variante: se compilan una vez y se recargan si cambian en disco
+        variants = VariantSelector.from_settings(settings, template_file, subject)
+        self.templates.set_constants(campaign_variables())
+        for variant in variants.variants.values():
             try:
-                # Personalizar correo
-                personalized_html = self.personalize_email(template, contact)
+                self.templates.get(variant.template_file)
+            except FileNotFoundError:
+                logging.error(f"Plantilla {variant.template_file} no encontrada")
+                raise
+        if variants.multiple:
+            print("🧩 Variantes: " + ", ".join(
+                f"{variant.name} ({variant.template_file})" for variant in variants.variants.values()))
+        
+        # Diario de la campaña: registra cada resultado y permite reanudar
+        campaign_id = campaign_id or make_campaign_id(email_list_file, template_file, subject)
+        journal_id = campaign_id if shard is None else f"{campaign_id}.shard{shard[0]}"
+        dry_run = dry_run or bool(render_to)
+        if dry_run:
+            journal: SendJournal = DryRunJournal(SendJournal.path_for(journal_id, settings))
+        else:
+            journal = SendJournal.for_campaign(journal_id, settings, journal_offset if resume else 0)
+        journal.start(campaign_id, email_list_file=email_list_file,
+                      template_file=template_file, subject=subject, resume=resume,
+                      **({'shard': shard[0], 'shards': shard[1]} if shard else {}))
+        if shard is None and not dry_run:
+            # Diarios de shards que una ejecución por procesos interrumpida no
+            # llegó a combinar: lo que entregaron cuenta también al reanudar
+            for shard_journal in SendJournal.shard_paths(campaign_id, settings):
+                journal.merge_from(shard_journal)
+                os.remove(shard_journal)
+        if resume and shard is not None:
+            # Los resultados de ejecuciones anteriores ya están en el diario principal
+            main_journal = SendJournal.path_for(campaign_id, settings)
+            if os.path.exists(main_journal):
+                journal.load_delivered(main_journal)
+        if resume:
+            logging.info(f"Reanudando campaña {campaign_id}: "
+                         f"{journal.delivered_count} destinatarios ya entregados")
+        
+        index: Optional[Union[ContactStore, RecipientIndex]] = None
+        if settings.get('dedupe_recipients', True) and settings.get('contact_store', True):
+            # Almacén columnar de la lista: se importa una vez y se reutiliza
+            # en cada campaña mientras el CSV no cambie
+            with self.metrics.timer('index'):
+                index = ContactStore.for_csv(email_list_file, settings)
+            expected = index.count(shard)
+            contacts = index.iter_contacts(settings.get('group_by_domain', False), shard, start)
+            if (index.duplicates or index.invalid) and (shard is None or shard[0] == 0):
+                print(f"🧹 Lista depurada: {index.duplicates} duplicados ({index.merged} fusionados) "
+                      f"y {index.invalid} direcciones inválidas omitidos (informe: {index.report_file})")
+        elif settings.get('dedupe_recipients', True):
+            # Índice en disco: direcciones normalizadas, sin duplicados
+            report_file = str(journal.path.with_name(f"{journal_id}.descartados.csv"))
+            with self.metrics.timer('index'):
+                index = RecipientIndex.build(email_list_file, report_file, shard=shard,
+                                             extra_fields=variants.extra_fields)
+            expected = len(index)
+            contacts = islice(index.iter_contacts(settings.get('group_by_domain', False)), start, None)
+            if index.duplicates or index.invalid:
+                print(f"🧹 Lista depurada: {index.duplicates} duplicados ({index.merged} fusionados) "
+                      f"y {index.invalid} direcciones inválidas omitidos (informe: {report_file})")
+        else:
+            expected = self.count_email_list(email_list_file) if count_total else None
+            contacts = self.iter_email_list(email_list_file, variants.extra_fields)
+            if shard is not None:
+                contacts = (c for c in contacts if shard_of(c['email'], shard[1]) == shard[0])
+            contacts = islice(contacts, start, None)
+        
+        # Bajas, rebotes y quejas: se descartan antes de personalizar
+        suppression = SuppressionList.from_settings(settings)
+        stats = CampaignStats(expected, dry_run)
+        contacts, track_position = self._positioned(contacts, stats, start)
+        if suppression is not None:
+            def suppressed(contact: Dict[str, str]):
+                stats.suppress()
+                log_event('suppressed', contact['email'])
+            contacts = suppression.filter_contacts(contacts, on_suppressed=suppressed)
+        contacts = self._timed_contacts(contacts)
+        
+        if batch_size is None and 'batch_size' not in settings and not dry_run:
+            # Sin lote configurado se usa el sugerido por el último preflight:
+            # lotes encadenados solo si el servidor anuncia PIPELINING
+            from preflight import cached_profile, suggest
+            server = cached_profile(self.config)
+            if server is not None:
+                batch_size = suggest(server, settings)['batch_size']
+        
+        run = CampaignRun(
+            templates=self.templates,
+            variants=variants,
+            subject=subject,
+            attachments=attachments,
+            stats=stats,
+            journal=journal,
+            # Sin red no hay nada que limitar: la simulación mide solo la CPU
+            rate_limiter=(RateLimiter() if dry_run
+                          else rate_limiter or RateLimiter.from_settings(settings, delay_seconds)),
+            retries=RetryScheduler.from_settings(settings),
+            batch_size=batch_size or settings.get('batch_size', 1),
+            profiler=profiler,
+            dry_run=dry_run,
+            render_dir=render_to,
+            plain_text=settings.get('plain_text_alternative', True),
+            fast_path=settings.get('fast_message_path', True),
+        )
+        if render_to:
+            os.makedirs(render_to, exist_ok=True)
+        
+        logging.info(f"Iniciando {'simulación de ' if dry_run else ''}envío masivo a "
+                     f"{run.stats.progress_total} contactos con {workers} hilos y lotes de {run.batch_size}")
+        
+        # Sesiones SMTP persistentes durante toda la campaña (o las del pool
+        # que ya tenga abierto quien llama, p. ej. el planificador)
+        owns_pool = not dry_run and self.pool is None
+        if owns_pool:
+            from smtp_pool import SMTPConnectionPool
+            self.pool = SMTPConnectionPool.from_config(
+                self.config, size=max(workers, settings.get('pool_size', 1)), metrics=self.metrics)
+        elif self.pool is not None:
+            # Las sesiones del pool prestado miden en el registro de esta campaña
+            self.pool.use_metrics(self.metrics)
+        self.attachment_cache = AttachmentCache.from_settings(settings)
+        try:
+            if resume:
+                contacts = self._skip_delivered(contacts, run, retry_failed)
+            if max_messages is not None:
+                contacts = islice(contacts, max_messages)
+            contacts = track_position(contacts)
+            dispatch = profiler.wrap(self._dispatch) if profiler else self._dispatch
+            dispatch(enumerate(contacts, 1), run, workers)
+        finally:
+            if owns_pool:
+                self.pool.close()
+                self.pool = None
+            self.attachment_cache = None
+            journal.close()
+            if index is not None:
+                index.close()
+            if suppression is not None:
+                suppression.close()
+            self.metrics.stop_periodic()
+            if metrics_file:
+                try:
+                    self.metrics.write(metrics_file)
+                    logging.info(f"Métricas de la campaña guardadas en {metrics_file}")
+                except OSError as e:
+                    logging.warning(f"No se pudieron escribir las métricas en {metrics_file}: {e}")
+            if profiler:
+                profiler.dump(profile)
+        
+        # Resumen final
+        stats = run.stats
+        stats.finish()
+        self.last_stats = stats
+        if show_summary:
+            if dry_run:
+                print(f"\n🧪 Simulación: no se ha enviado ningún correo"
+                      + (f" (mensajes guardados en {render_to})" if render_to else ""))
+            stats.print_summary()
+            self.print_variant_summary(stats)
+            self.print_stage_summary()
+            if self.metrics.counters.get('reconnections'):
+                print(f"🔁 Reconexiones SMTP: {self.metrics.counters['reconnections']}")
+        
+        for path, cache in self.templates.cache_stats().items():
+            logging.info(f"Plantilla {path}: {cache['hits']} renders reutilizados de "
+                         f"{cache['hits'] + cache['misses']}, {cache['reloads']} recargas, "
+                         f"{cache['evictions']} descartados de la caché")
+        if self.templates.images is not None:
+            images = self.templates.images.stats()
+            if images['images']:
+                logging.info(f"Imágenes incrustadas: {images['images']} "
+                             f"({images['original_bytes'] / 1024:.0f} KB originales, "
+                             f"{images['embedded_bytes'] / 1024:.0f} KB tras optimizar)")
+        if self.metrics.counters.get('reconnections'):
+            logging.info(f"Sesiones SMTP reconectadas durante la campaña: "
+                         f"{self.metrics.counters['reconnections']}")
+        logging.info(f"{'Simulación completada' if dry_run else 'Envío masivo completado'}. {stats.result}")
+        return stats.as_dict()
+    
+    def print_stage_summary(self):
+        """Muestra el tiempo por etapa de la última campaña"""
+        stages = [stage for stage in self.metrics.histograms if not stage.startswith(VARIANT_STAGE_PREFIX)]
+        stage_lines = self.metrics.format_summary(stages)
+        if stage_lines:
+            print("⏱️ Tiempo por etapa:")
+            for line in stage_lines:
+                print(line)
+    
+    def print_variant_summary(self, stats: CampaignStats):
+        """Muestra los resultados y el tiempo de construcción de cada variante"""
+        if not stats.variants:
+            return
+        print("🧩 Resultado por variante:")
+        for name, counts in sorted(stats.variants.items()):
+            histogram = self.metrics.histograms.get(VARIANT_STAGE_PREFIX + name)
+            timing = (f"  media {histogram.snapshot()['avg'] * 1000:.2f} ms/correo"
+                      if histogram is not None and histogram.count else "")
+            label = 'generados' if stats.dry_run else 'enviados'
+            print(f"  {name:<12} {label} {counts['sent']:<8} fallos {counts['failed']:<6}{timing}")
+    
+    @staticmethod
+    def _positioned(contacts: Iterator[Dict[str, str]], stats: CampaignStats, start: int):
+        """
+        Numera los contactos de la lista para saber hasta dónde se ha recorrido
+        
+        Los filtros intermedios (supresiones, diario) leen por adelantado, así
+        que la posición alcanzada es la del último contacto que llega a enviarse;
+        los descartados antes de él también quedan recorridos.
+        
+        Returns:
+            (contactos numerados, función que envuelve los contactos que se envían)
+        """
+        stats.position = start
+        order: Deque[Tuple[int, Dict[str, str]]] = deque()
+        
+        def numbered() -> Iterator[Dict[str, str]]:
+            for position, contact in enumerate(contacts, start + 1):
+                order.append((position, contact))
+                yield contact
+        
+        def track(dispatched: Iterator[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+            for contact in dispatched:
+                while order:
+                    position, queued = order.popleft()
+                    if queued is contact:
+                        stats.position = position
+                        break
+                yield contact
+        
+        return numbered(), track
+    
+    def _timed_contacts(self, contacts: Iterator[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+        """Mide la lectura y validación de cada fila del CSV (etapa load)"""
+        observe = self.metrics.histogram('load').observe
+        while True:
+            start = time.perf_counter()
+            contact = next(contacts, None)
+            if contact is None:
+                return
+            observe(time.perf_counter() - start)
+            yield contact
+    
+    @staticmethod
+    def _skip_delivered(contacts: Iterator[Dict[str, str]], run: "CampaignRun",
+                        retry_failed: bool = True) -> Iterator[Dict[str, str]]:
+        """Filtra los contactos que ya constan como entregados (o fallidos) en el diario"""
+        for contact in contacts:
+            if (run.journal.is_delivered(contact['email'])
+                    or not retry_failed and run.journal.is_failed(contact['email'])):
+                run.stats.skip()
+                log_event('skipped', contact['email'])
+                continue
+            yield contact
+    
+    def _dispatch(self, contacts: Iterator[Tuple[int, Dict[str, str]]], run: "CampaignRun",
+                  workers: int):
+        """
+        Reparte los contactos, en lotes de run.batch_size, entre los hilos de trabajo
+        
+        Los fallos transitorios vuelven a la cola de reintentos y se reenvían
+        cuando vence su espera, sin detener el resto de la campaña.
+        """
+        # Se limita el número de lotes pendientes para no encolar toda la lista
+        max_pending = workers * 2
+        pending = set()
+        exhausted = False
+        send_batch = run.profiler.wrap(self._send_batch) if run.profiler else self._send_batch
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='envio') as executor:
+            while True:
+                for (i, contact), attempt in run.retries.pop_due():
+                    pending.add(executor.submit(send_batch, [(i, contact, attempt)], run))
                 
-                # Crear mensaje
-                message = self.create_message(
-                    contact['email'], 
-                    subject, 
-                    personalized_html, 
-                    attachments
-                )
+                while not exhausted and len(pending) < max_pending:
+                    batch = [(i, contact, 0) for i, contact in islice(contacts, run.batch_size)]
+                    if len(batch) < run.batch_size:
+                        exhausted = True
+                    if batch:
+                        pending.add(executor.submit(send_batch, batch, run))
                 
-                # Enviar correo
-                if self.send_email(message, contact['email']):
-                    sent_count += 1
-                    print(f"✅ [{i}/{total_contacts}] Enviado a {contact['email']}")
-                else:
-                    failed_count += 1
-                    print(f"❌ [{i}/{total_contacts}] Falló envío a {contact['email']}")
+                if not pending:
+                    wait_retry = run.retries.time_until_next()
+                    if wait_retry is None:
+                        break
+                    # Solo quedan reintentos programados para más adelante
+                    time.sleep(wait_retry)
+                    continue
                 
-                # Pausa entre envíos para evitar ser marcado como spam
-                if i < total_contacts:
-                    time.sleep(delay_seconds)
-                    
+                done, pending = wait(pending, timeout=run.retries.time_until_next(),
+                                     return_when=FIRST_COMPLETED)
+                self._report_results(done, run)
+    
+    def _build_for_contact(self, contact: Dict[str, str],
+                           run: "CampaignRun") -> Union[MIMEMultipart, bytes]:
+        """Personaliza y construye el mensaje de un contacto"""
+        # Personalizar correo con la plantilla de su variante
+        start = time.perf_counter()
+        variant = run.variants.choose(contact)
+        personalized_html, personalized_text, images = run.templates.render_parts(
+            variant.template_file, contact, text=run.plain_text)
+        built = time.perf_counter()
+        self.metrics.observe('personalize', built - start)
+        
+        # Crear mensaje: ruta rápida sobre el esqueleto pre-serializado
+        skeleton = self._skeleton_for(variant, images, run)
+        if skeleton is not None and skeleton.supports(contact['email']):
+            message = skeleton.render(contact['email'], personalized_html, personalized_text)
+        else:
+            message = self.create_message(
+                contact['email'], 
+                variant.subject, 
+                personalized_html, 
+                run.attachments,
+                personalized_text,
+                images
+            )
+        finished = time.perf_counter()
+        self.metrics.observe('build', finished - built)
+        if run.variants.multiple:
+            self.metrics.observe(VARIANT_STAGE_PREFIX + variant.name, finished - start)
+        return message
+    
+    def _skeleton_for(self, variant: Variant, images: Tuple[InlineImage, ...],
+                      run: "CampaignRun") -> Optional[MessageSkeleton]:
+        """
+        Esqueleto de la variante con sus imágenes incrustadas
+        
+        Cabeceras, boundaries, adjuntos e imágenes se serializan una sola vez;
+        si la plantilla se recarga con otras imágenes se construye otro.
+        """
+        if not run.fast_path:
+            return None
+        key = (variant.name, tuple(image.cid for image in images))
+        skeleton = run.skeletons.get(key)
+        if skeleton is None:
+            with run.lock:
+                skeleton = run.skeletons.get(key)
+                if skeleton is None:
+                    skeleton = run.skeletons[key] = MessageSkeleton.build(
+                        self.create_message, variant.subject, run.attachments,
+                        plain_text=run.plain_text, inline_images=images)
+        return skeleton
+    
+    def _send_batch(self, batch: List[Tuple[int, Dict[str, str], int]],
+                    run: "CampaignRun") -> Tuple[List["SendOutcome"], float]:
+        """
+        Construye y envía un lote de contactos por una misma sesión (hilo de trabajo)
+        
+        Args:
+            batch: Tuplas (índice, contacto, número de intento)
+            run: Estado de la campaña
+            
+        Returns:
+            (resultados de cada contacto, segundos que tardó el envío del lote)
+        """
+        outcomes: List[SendOutcome] = []
+        ready = []
+        for i, contact, attempt in batch:
+            try:
+                ready.append((i, contact, attempt, self._build_for_contact(contact, run)))
             except Exception as e:
-                failed_count += 1
                 logging.error(f"Error procesando contacto {contact.get('email', 'unknown')}: {e}")
-                print(f"❌ [{i}/{total_contacts}] Error con {contact.get('email', 'unknown')}")
+                outcomes.append(SendOutcome(i, contact, attempt, False, e, 'build'))
+        if not ready:
+            return outcomes, 0.0
         
-        # Resumen final
-        print(f"\n📊 RESUMEN DEL ENVÍO:")
-        print(f"Total contactos: {total_contacts}")
-        print(f"Enviados exitosamente: {sent_count}")
-        print(f"Fallos: {failed_count}")
-        print(f"Tasa de éxito: {(sent_count/total_contacts)*100:.1f}%")
+        pooled = len(ready) > 1 and not run.dry_run
+        if not pooled:
+            # Esperar turno según los límites global y del dominio
+            started = time.perf_counter()
+            for _, contact, _, _ in ready:
+                run.rate_limiter.acquire(contact['email'])
+            self.metrics.observe('rate_wait', time.perf_counter() - started)
+        
+        # En un lote por el pool, cada mensaje pide su turno justo antes de su
+        # MAIL FROM para no enviar el lote de golpe saltándose la ráfaga
+        waited = 0.0
         
-        logging.info(f"Envío masivo completado. Éxito: {sent_count}/{total_contacts}")
+        def take_turn(email: str) -> float:
+            nonlocal waited
+            wait = run.rate_limiter.reserve(email)
+            self.metrics.observe('rate_wait', max(wait, 0.0))
+            waited += max(wait, 0.0)
+            return wait
+        
+        started = time.perf_counter()
+        if run.dry_run:
+            errors = self._render_batch(ready, run)
+        elif len(ready) == 1:
+            i, contact, attempt, message = ready[0]
+            try:
+                self._deliver(message, contact['email'])
+                errors: List[Optional[Exception]] = [None]
+            except Exception as e:
+                errors = [e]
+        else:
+            messages = [
+                (contact['email'],
+                 message if isinstance(message, bytes) else to_wire(message.as_string()))
+                for _, contact, _, message in ready
+            ]
+            try:
+                errors = self.pool.send_batch(self.config['sender_email'], messages,
+                                              take_turn if run.rate_limiter.enabled else None)
+            except Exception as e:
+                errors = [e] * len(ready)
+        latency = time.perf_counter() - started - waited
+        self.metrics.observe('render' if run.dry_run else 'send', latency)
+        
+        for (i, contact, attempt, _), error in zip(ready, errors):
+            if error is None:
+                if pooled:
+                    logging.info(f"Correo enviado exitosamente a {contact['email']}")
+                outcomes.append(SendOutcome(i, contact, attempt, True))
+            else:
+                logging.error(f"Error al enviar correo a {contact['email']}: {error}")
+                outcomes.append(SendOutcome(i, contact, attempt, False, error))
+        return outcomes, latency
+    
+    @staticmethod
+    def _render_batch(ready: List[Tuple[int, Dict[str, str], int, Union[MIMEMultipart, bytes]]],
+                      run: "CampaignRun") -> List[Optional[Exception]]:
+        """Serializa los mensajes del lote sin enviarlos y, con render_dir, los guarda como .eml"""
+        errors: List[Optional[Exception]] = []
+        for i, contact, _, message in ready:
+            data = message if isinstance(message, bytes) else to_wire(message.as_string())
+            if run.render_dir:
+                name = re.sub(r'[^\w.@+-]', '_', contact['email'])
+                try:
+                    with open(os.path.join(run.render_dir, f"{i:07d}_{name}.eml"), 'wb') as f:
+                        f.write(data)
+                except OSError as e:
+                    errors.append(e)
+                    continue
+            errors.append(None)
+        return errors
+    
+    def _report_results(self, futures, run: "CampaignRun"):
+        """Muestra el progreso de los envíos terminados, actualiza estadísticas y diario"""
+        stats = run.stats
+        for future in futures:
+            outcomes, latency = future.result()
+            stats.record_batch(latency, len(outcomes))
+            for outcome in outcomes:
+                self._report_outcome(outcome, run)
+    
+    def _report_outcome(self, outcome: "SendOutcome", run: "CampaignRun"):
+        """Muestra el resultado de un contacto, lo reprograma o lo registra en el diario"""
+        stats = run.stats
+        i, contact = outcome.index, outcome.contact
+        
+        variant = run.variants.choose(contact).name if run.variants.multiple else None
+        if outcome.success:
+            self.metrics.increment('messages_rendered' if run.dry_run else 'messages_sent')
+            stats.record(True, outcome.attempt, variant)
+            run.journal.record(contact['email'], STATUS_SENT, attempts=outcome.attempt + 1)
+            log_event('rendered' if run.dry_run else 'sent', contact['email'],
+                      attempt=outcome.attempt + 1)
+            action = "Generado para" if run.dry_run else "Enviado a"
+            print(f"✅ [{i}/{stats.progress_total}] {action} {contact['email']}")
+            return
+        
+        if outcome.stage == 'send' and classify_error(outcome.error) == TRANSIENT:
+            delay = run.retries.schedule((i, contact), outcome.attempt + 1)
+            if delay is not None:
+                self.metrics.increment('retries')
+                stats.retry()
+                log_event('retry', contact['email'], attempt=outcome.attempt + 1,
+                          delay=round(delay, 1), error=str(outcome.error))
+                print(f"🔁 [{i}/{stats.progress_total}] Reintento {outcome.attempt + 1}/"
+                      f"{run.retries.max_retries} en {delay:.1f} s para {contact['email']}")
+                return
+        
+        self.metrics.increment('messages_failed')
+        stats.record(False, outcome.attempt, variant)
+        run.journal.record(contact['email'], STATUS_FAILED, attempts=outcome.attempt + 1,
+                           error=str(outcome.error))
+        log_event('failed', contact['email'], attempt=outcome.attempt + 1,
+                  stage=outcome.stage, error=str(outcome.error))
+        if outcome.stage == 'send':
+            print(f"❌ [{i}/{stats.progress_total}] Falló envío a {contact['email']}")
+        else:
+            print(f"❌ [{i}/{stats.progress_total}] Error con {contact.get('email', 'unknown')}")
+
 
-def main():
+class SendOutcome(NamedTuple):
+    """Resultado de un intento de envío a un contacto"""
+    index: int
+    contact: Dict[str, str]
+    attempt: int
+    success: bool
+    error: Optional[BaseException] = None
+    stage: str = 'send'  # 'build' si falló antes de llegar a enviar
+
+
+class CampaignRun:
+    """Estado compartido por los hilos durante una ejecución de send_bulk_emails"""
+    
+    def __init__(self, templates: TemplateRegistry, variants: VariantSelector, subject: str,
+                 attachments: Optional[List[str]], stats: CampaignStats,
+                 journal: SendJournal, rate_limiter: RateLimiter,
+                 retries: RetryScheduler, batch_size: int = 1,
+                 profiler: Optional[ProfileHook] = None,
+                 dry_run: bool = False, render_dir: Optional[str] = None,
+                 plain_text: bool = True, fast_path: bool = True):
+        self.templates = templates
+        self.variants = variants
+        self.subject = subject
+        self.attachments = attachments
+        self.stats = stats
+        self.journal = journal
+        self.rate_limiter = rate_limiter
+        self.retries = retries
+        # Esqueletos por (variante, Content-IDs de sus imágenes)
+        self.skeletons: Dict[Tuple[str, Tuple[str, ...]], MessageSkeleton] = {}
+        self.lock = threading.Lock()
+        self.batch_size = max(1, batch_size)
+        self.profiler = profiler
+        self.dry_run = dry_run
+        self.render_dir = render_dir
+        self.plain_text = plain_text
+        self.fast_path = fast_path
+
+DEFAULT_EMAIL_LIST = "lista_correos.csv"
+DEFAULT_TEMPLATE = "plantilla_correo.html"
+DEFAULT_SUBJECT = "🛏️ Descubre el mejor descanso con Tavolo Casa - Ofertas especiales"
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Argumentos de línea de comandos"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Envío masivo de correos Tavolo Casa")
+    parser.add_argument('--config', default="config.json",
+                        help="Archivo de configuración (por defecto config.json)")
+    parser.add_argument('--csv', default=DEFAULT_EMAIL_LIST, dest='email_list_file',
+                        help=f"Lista de correos (por defecto {DEFAULT_EMAIL_LIST})")
+    parser.add_argument('--template', default=DEFAULT_TEMPLATE, dest='template_file',
+                        help=f"Plantilla HTML (por defecto {DEFAULT_TEMPLATE})")
+    parser.add_argument('--subject', default=DEFAULT_SUBJECT, help="Asunto del correo")
+    parser.add_argument('--attach', action='append', default=[], metavar='ARCHIVO',
+                        dest='attachments', help="Archivo adjunto (se puede repetir)")
+    parser.add_argument('--delay', type=float, default=2,
+                        help="Segundos entre envíos si no hay rate_limits configurados (por defecto 2)")
+    parser.add_argument('--concurrency', type=int,
+                        help="Envíos simultáneos (por defecto email_settings.concurrency)")
+    parser.add_argument('--batch-size', type=int,
+                        help="Mensajes por lote y sesión (por defecto email_settings.batch_size)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Procesos de envío: con más de uno la lista se reparte por shards")
+    parser.add_argument('--resume', action='store_true',
+                        help="Reanudar la campaña omitiendo los destinatarios ya enviados")
+    parser.add_argument('--campaign-id',
+                        help="Identificador de la campaña (por defecto se deriva de lista, plantilla y asunto)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Cargar, personalizar y construir los mensajes sin conectar con el servidor SMTP")
+    parser.add_argument('--render-to', metavar='DIRECTORIO',
+                        help="Guardar cada mensaje como archivo .eml en DIRECTORIO en lugar de enviarlo")
+    parser.add_argument('--profile', metavar='ARCHIVO',
+                        help="Guardar un perfil cProfile del envío (p. ej. envio.prof)")
+    parser.add_argument('-y', '--yes', action='store_true',
+                        help="No pedir confirmación (para ejecuciones programadas)")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
     """Función principal para ejecutar el script"""
+    args = parse_args(argv)
     try:
-        # Inicializar el enviador
-        sender = TavoloCasaEmailSender()
-        
-        # Configurar parámetros del envío
-        email_list_file = "lista_correos.csv"
-        template_file = "plantilla_correo.html"
-        subject = "🛏️ Descubre el mejor descanso con Tavolo Casa - Ofertas especiales"
-        attachments = []  # Agregar rutas de archivos si es necesario
-        
         # Verificar que los archivos existen
-        if not os.path.exists(email_list_file):
-            print(f"❌ Error: No se encuentra el archivo {email_list_file}")
+        if not os.path.exists(args.email_list_file):
+            print(f"❌ Error: No se encuentra el archivo {args.email_list_file}")
             print("Por favor, crea este archivo con las direcciones de correo")
-            return
+            return 1
             
-        if not os.path.exists(template_file):
-            print(f"❌ Error: No se encuentra el archivo {template_file}")
+        if not os.path.exists(args.template_file):
+            print(f"❌ Error: No se encuentra el archivo {args.template_file}")
             print("Por favor, crea este archivo con la plantilla HTML")
-            return
+            return 1
+        
+        for attachment in args.attachments:
+            if not os.path.isfile(attachment):
+                print(f"❌ Error: No se encuentra el adjunto {attachment}")
+                return 1
+        
+        dry_run = args.dry_run or bool(args.render_to)
         
         # Confirmar envío
         print("🚀 SISTEMA DE CORREOS TAVOLO CASA")
         print("="*50)
-        print(f"📧 Archivo de correos: {email_list_file}")
-        print(f"📝 Plantilla: {template_file}")
-        print(f"📋 Asunto: {subject}")
-        
-        confirm = input("\n¿Deseas proceder con el envío? (s/n): ").lower().strip()
-        
-        if confirm in ['s', 'si', 'sí', 'y', 'yes']:
-            sender.send_bulk_emails(
-                email_list_file=email_list_file,
-                template_file=template_file,
-                subject=subject,
-                attachments=attachments,
-                delay_seconds=2
-            )
+        print(f"📧 Archivo de correos: {args.email_list_file}")
+        print(f"📝 Plantilla: {args.template_file}")
+        print(f"📋 Asunto: {args.subject}")
+        if args.attachments:
+            print(f"📎 Adjuntos: {', '.join(args.attachments)}")
+        if args.resume:
+            print("🔁 Modo reanudación: se omiten los destinatarios ya enviados")
+        if args.workers > 1:
+            print(f"⚙️ Procesos de envío: {args.workers}")
+        if args.render_to:
+            print(f"🧪 Simulación: los mensajes se guardan en {args.render_to} sin enviarse")
+        elif dry_run:
+            print("🧪 Simulación: no se conecta con el servidor SMTP")
+        
+        if not args.yes and not dry_run:
+            confirm = input("\n¿Deseas proceder con el envío? (s/n): ").lower().strip()
+            if confirm not in ['s', 'si', 'sí', 'y', 'yes']:
+                print("Envío cancelado por el usuario")
+                return 0
+        
+        options = dict(
+            email_list_file=args.email_list_file,
+            template_file=args.template_file,
+            subject=args.subject,
+            attachments=args.attachments,
+            delay_seconds=args.delay,
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            campaign_id=args.campaign_id,
+            resume=args.resume,
+            profile=args.profile,
+            dry_run=args.dry_run,
+            render_to=args.render_to
+        )
+        if args.workers > 1:
+            from sharded_runner import ShardedCampaign
+            summary = ShardedCampaign(args.config, workers=args.workers).run(**options)
         else:
-            print("Envío cancelado por el usuario")
+            summary = TavoloCasaEmailSender(args.config).send_bulk_emails(**options)
+        return 0 if not summary['failed'] else 2
             
     except Exception as e:
         logging.error(f"Error en función principal: {e}")
         print(f"❌ Error: {e}")
+        return 1
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Conversión de HTML a texto plano para el sistema de correos Tavolo Casa
+Genera la alternativa text/plain de los correos a partir de la plantilla HTML
+"""
+
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+# Etiquetas cuyo contenido no se muestra en el texto
+SKIP_TAGS = {'head', 'style', 'script', 'title', 'noscript'}
+
+# Bloques separados por una línea en blanco
+PARAGRAPH_TAGS = {'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'ul', 'ol', 'blockquote', 'pre'}
+
+# Bloques que empiezan en una línea nueva; se separan con una línea en blanco
+# si contienen otros bloques o un texto de al menos PARAGRAPH_LENGTH caracteres
+LINE_TAGS = {'div', 'section', 'article', 'header', 'footer', 'tr', 'li', 'dt', 'dd', 'center'}
+PARAGRAPH_LENGTH = 60
+
+_SPACES = re.compile(r'[ \t\r\n\f]+')
+_BLANK_LINES = re.compile(r'\n{3,}')
+
+
+@lru_cache(maxsize=None)
+def _extractor_class() -> type:
+    """La clase del recorrido se crea al primer uso: html.parser no se carga al importar"""
+    from html.parser import HTMLParser
+
+    class _TextExtractor(HTMLParser):
+        """Recorre el HTML y acumula el texto visible con saltos de línea de bloque"""
+
+        def __init__(self):
+            super().__init__(convert_charrefs=True)
+            self.chunks: List[str] = []
+            self._pending = 0  # saltos de línea que se escriben antes del siguiente texto
+            self._skip = 0
+            self._pre = 0
+            self._links: List[Tuple[Optional[str], int]] = []
+            self._blocks: List[List] = []  # [etiqueta, primer fragmento, contiene bloques]
+
+        def _newline(self, count: int = 1):
+            # Bloques anidados o consecutivos no acumulan líneas en blanco
+            self._pending = max(self._pending, count)
+
+        def _write(self, text: str):
+            if self._pending:
+                if self.chunks:
+                    self.chunks.append('\n' * self._pending)
+                self._pending = 0
+            self.chunks.append(text)
+
+        def handle_starttag(self, tag, attrs):
+            if tag in SKIP_TAGS:
+                self._skip += 1
+                return
+            if self._skip:
+                return
+            attributes = dict(attrs)
+            if tag in PARAGRAPH_TAGS:
+                self._newline(2)
+            elif tag in LINE_TAGS:
+                self._newline()
+                if self._blocks:
+                    self._blocks[-1][2] = True
+                self._blocks.append([tag, len(self.chunks), False])
+            if tag == 'pre':
+                self._pre += 1
+            elif tag == 'br':
+                self._newline()
+            elif tag == 'hr':
+                self._newline()
+                self._write('-' * 40)
+                self._newline()
+            elif tag == 'li':
+                self._write('- ')
+            elif tag in ('td', 'th'):
+                self._write(' ')
+            elif tag == 'img' and attributes.get('alt'):
+                self._write(attributes['alt'])
+            elif tag == 'a':
+                self._links.append((attributes.get('href'), len(self.chunks)))
+
+        def handle_startendtag(self, tag, attrs):
+            self.handle_starttag(tag, attrs)
+            if tag in SKIP_TAGS:
+                self._skip -= 1
+
+        def handle_endtag(self, tag):
+            if tag in SKIP_TAGS:
+                self._skip = max(0, self._skip - 1)
+                return
+            if self._skip:
+                return
+            if tag == 'a' and self._links:
+                href, start = self._links.pop()
+                text = ''.join(self.chunks[start:]).strip()
+                if href and self._show_href(href, text):
+                    if text:
+                        self.chunks[-1] = self.chunks[-1].rstrip(' ')
+                        self._write(f" ({href})")
+                    else:
+                        self._write(href)
+            elif tag == 'pre':
+                self._pre = max(0, self._pre - 1)
+            if tag in PARAGRAPH_TAGS:
+                self._newline(2)
+            elif tag in LINE_TAGS:
+                self._close_block(tag)
+
+        def _close_block(self, tag: str):
+            while self._blocks:
+                name, start, nested = self._blocks.pop()
+                if name == tag:
+                    break
+            else:
+                self._newline()
+                return
+            text = ''.join(self.chunks[start:]).strip()
+            self._newline(2 if nested or len(text) >= PARAGRAPH_LENGTH else 1)
+
+        @staticmethod
+        def _show_href(href: str, text: str) -> bool:
+            """El enlace se muestra salvo anclas internas o si el texto ya es la dirección"""
+            if href.startswith('#') or href.lower().startswith('javascript:'):
+                return False
+            bare = re.sub(r'^(?:mailto:|https?://)', '', href, flags=re.IGNORECASE).rstrip('/')
+            return bare.lower() != text.lower()
+
+        def handle_data(self, data):
+            if self._skip:
+                return
+            if self._pre:
+                self._write(data)
+                return
+            text = _SPACES.sub(' ', data)
+            if text.strip():
+                self._write(text)
+            elif self.chunks and not self._pending:
+                self.chunks.append(' ')
+
+    return _TextExtractor
+
+
+def html_to_text(html: str) -> str:
+    """
+    Texto plano legible equivalente a un HTML
+
+    Los marcadores {{...}} del texto y de los enlaces se conservan, así que el
+    resultado puede compilarse como plantilla con los mismos huecos.
+    """
+    parser = _extractor_class()()
+    parser.feed(html)
+    parser.close()
+    lines = [line.strip() for line in ''.join(parser.chunks).split('\n')]
+    return _BLANK_LINES.sub('\n\n', '\n'.join(lines)).strip() + '\n'
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Imágenes incrustadas (CID) para el sistema de correos Tavolo Casa
+Las referencias <img src> de la plantilla se reescriben a cid: al compilarla y
+cada imagen se lee, optimiza y codifica una sola vez por campaña
+"""
+
+import base64
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+import re
+import threading
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
+
+if TYPE_CHECKING:
+    from email.mime.base import MIMEBase
+
+IMG_SRC_PATTERN = re.compile(r'(<img\b[^>]*?\bsrc\s*=\s*)(["\'])(.*?)\2', re.IGNORECASE | re.DOTALL)
+
+# Dominio de los Content-ID generados (<hash>@CID_DOMAIN)
+CID_DOMAIN = 'tavolocasa'
+
+# Firmas de los formatos que los clientes de correo muestran en línea
+_MAGIC = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+# Formatos que se redimensionan y recomprimen (los GIF pueden ser animados)
+OPTIMIZABLE = ('jpeg', 'png')
+
+
+class InlineImage(NamedTuple):
+    """Imagen ya codificada, lista para adjuntarse en multipart/related"""
+    cid: str
+    subtype: str
+    filename: str
+    encoded: str  # base64 con líneas de 76
+
+    def part(self) -> "MIMEBase":
+        """Parte MIME de la imagen (sin volver a codificar)"""
+        from email.mime.base import MIMEBase
+
+        part = MIMEBase('image', self.subtype)
+        part.set_payload(self.encoded)
+        part['Content-Transfer-Encoding'] = 'base64'
+        part['Content-ID'] = f'<{self.cid}>'
+        part.add_header('Content-Disposition', 'inline', filename=self.filename)
+        return part
+
+
+def image_subtype(data: bytes, name: str = '') -> Optional[str]:
+    """Subtipo MIME de la imagen según su contenido o, si no se reconoce, su extensión"""
+    for magic, subtype in _MAGIC:
+        if data.startswith(magic):
+            return subtype
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    guessed, _ = mimetypes.guess_type(name)
+    if guessed and guessed.startswith('image/'):
+        return guessed.split('/', 1)[1]
+    return None
+
+
+class InlineImageStore:
+    """
+    Imágenes incrustadas de todas las plantillas de la campaña
+
+    Las imágenes se identifican por el SHA-256 de su contenido: la misma
+    imagen referenciada desde varias plantillas o con rutas distintas se
+    adjunta con el mismo Content-ID y se codifica una sola vez. Los archivos
+    se vuelven a leer solo si cambian en disco (al recompilar la plantilla).
+    """
+
+    def __init__(self, max_width: int = 1200, quality: int = 85,
+                 remote: bool = False, timeout: float = 10.0):
+        """
+        Args:
+            max_width: Ancho máximo en píxeles; las más anchas se reducen (0 = sin límite)
+            quality: Calidad JPEG al recomprimir (0 = no recomprimir)
+            remote: Descargar e incrustar también las imágenes http(s)
+            timeout: Segundos de espera al descargar una imagen remota
+        """
+        self.max_width = max_width
+        self.quality = quality
+        self.remote = remote
+        self.timeout = timeout
+        self.original_bytes = 0
+        self.embedded_bytes = 0
+        self._by_hash: Dict[str, InlineImage] = {}
+        self._by_source: Dict[str, Tuple[Optional[Tuple[int, int]], InlineImage]] = {}
+        self._pillow_warned = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: Dict) -> Optional["InlineImageStore"]:
+        """Almacén configurado en email_settings, o None si inline_images está desactivado"""
+        if not settings.get('inline_images', True):
+            return None
+        return cls(max_width=settings.get('inline_image_max_width', 1200),
+                   quality=settings.get('inline_image_quality', 85),
+                   remote=settings.get('inline_remote_images', False))
+
+    def embed(self, html: str, base_dir: str) -> Tuple[str, Tuple[InlineImage, ...]]:
+        """
+        Reescribe las referencias <img src> a cid: y devuelve las imágenes usadas
+
+        Args:
+            html: Plantilla HTML (sin personalizar)
+            base_dir: Directorio desde el que se resuelven las rutas relativas
+
+        Returns:
+            (HTML reescrito, imágenes en orden de aparición y sin repetir)
+        """
+        images: Dict[str, InlineImage] = {}
+
+        def replace(match: "re.Match") -> str:
+            image = self.load(match.group(3), base_dir)
+            if image is None:
+                return match.group(0)
+            images[image.cid] = image
+            return f"{match.group(1)}{match.group(2)}cid:{image.cid}{match.group(2)}"
+
+        return IMG_SRC_PATTERN.sub(replace, html), tuple(images.values())
+
+    def load(self, src: str, base_dir: str) -> Optional[InlineImage]:
+        """
+        Imagen de una referencia src, o None si no debe (o no puede) incrustarse
+
+        Se dejan tal cual las referencias cid: y data:, las que dependen del
+        contacto ({{...}}) y las remotas si remote está desactivado.
+        """
+        from urllib.parse import unquote, urlsplit
+
+        src = src.strip()
+        scheme = urlsplit(src).scheme.lower()
+        if not src or '{{' in src or scheme in ('cid', 'data'):
+            return None
+        if scheme in ('http', 'https'):
+            if not self.remote:
+                return None
+            source, signature = src, None
+        elif scheme in ('', 'file') or len(scheme) == 1:  # una letra: unidad de Windows
+            path = unquote(urlsplit(src).path) if scheme == 'file' else src
+            source = os.path.normpath(os.path.join(base_dir, path))
+            try:
+                stat = os.stat(source)
+            except OSError:
+                logging.warning(f"Imagen {src} no encontrada en {base_dir}: se deja la referencia")
+                return None
+            signature = (stat.st_mtime_ns, stat.st_size)
+        else:
+            return None
+
+        with self._lock:
+            cached = self._by_source.get(source)
+            if cached is not None and (signature is None or cached[0] == signature):
+                return cached[1]
+
+        try:
+            data = self._read(source, scheme in ('http', 'https'))
+        except OSError as e:
+            logging.warning(f"No se pudo leer la imagen {src}: {e}")
+            return None
+        subtype = image_subtype(data, source)
+        if subtype is None:
+            logging.warning(f"{src} no es una imagen reconocible: se deja la referencia")
+            return None
+
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            image = self._by_hash.get(digest)
+        if image is None:
+            optimized = self._optimize(data, subtype, src)
+            name = os.path.basename(urlsplit(source).path) or f"imagen.{subtype}"
+            image = InlineImage(f"{digest[:16]}@{CID_DOMAIN}", subtype, name,
+                                base64.encodebytes(optimized).decode('ascii'))
+            with self._lock:
+                if digest not in self._by_hash:
+                    self._by_hash[digest] = image
+                    self.original_bytes += len(data)
+                    self.embedded_bytes += len(optimized)
+                image = self._by_hash[digest]
+        with self._lock:
+            self._by_source[source] = (signature, image)
+        return image
+
+    def _read(self, source: str, remote: bool) -> bytes:
+        if not remote:
+            with open(source, 'rb') as f:
+                return f.read()
+        from urllib.request import urlopen
+
+        with urlopen(source, timeout=self.timeout) as response:
+            return response.read()
+
+    def _optimize(self, data: bytes, subtype: str, src: str) -> bytes:
+        """Reduce y recomprime con Pillow si está instalado; se queda con la versión más pequeña"""
+        if subtype not in OPTIMIZABLE or not (self.max_width or self.quality):
+            return data
+        try:
+            from PIL import Image
+        except ImportError:
+            if not self._pillow_warned:
+                self._pillow_warned = True
+                logging.info("Pillow no está instalado: las imágenes se incrustan sin optimizar")
+            return data
+
+        output = io.BytesIO()
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                if self.max_width and image.width > self.max_width:
+                    height = max(1, round(image.height * self.max_width / image.width))
+                    image = image.resize((self.max_width, height), Image.LANCZOS)
+                if subtype == 'jpeg':
+                    image.convert('RGB').save(output, 'JPEG', quality=self.quality or 95,
+                                              optimize=True, progressive=True)
+                else:
+                    image.save(output, 'PNG', optimize=True)
+        except (OSError, ValueError) as e:
+            logging.warning(f"No se pudo optimizar la imagen {src}: {e}")
+            return data
+        optimized = output.getvalue()
+        return optimized if len(optimized) < len(data) else data
+
+    def stats(self) -> Dict[str, int]:
+        """Imágenes distintas y bytes antes y después de optimizar"""
+        with self._lock:
+            return {'images': len(self._by_hash), 'original_bytes': self.original_bytes,
+                    'embedded_bytes': self.embedded_bytes}
+
+
+def attach_related(html_part: "MIMEBase", images: List[InlineImage]) -> "MIMEBase":
+    """Envuelve la parte HTML en multipart/related junto a sus imágenes"""
+    from email.mime.multipart import MIMEMultipart
+
+    related = MIMEMultipart('related')
+    related.attach(html_part)
+    for image in images:
+        related.attach(image.part())
+    return related
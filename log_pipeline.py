@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Logging asíncrono para el sistema de correos Tavolo Casa
+Los hilos de envío solo encolan registros; un hilo aparte los formatea y los
+escribe por lotes en archivos rotados por tamaño
+"""
+
+import atexit
+import json
+import logging
+import queue
+import threading
+from datetime import datetime
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from logging.handlers import QueueListener
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+EVENT_LOGGER = 'tavolo.eventos'
+
+MODE_QUEUE = 'queue'
+MODE_CLASSIC = 'classic'
+
+DEFAULT_SETTINGS = {
+    'mode': MODE_QUEUE,
+    'level': 'INFO',
+    'file': 'email_log.log',
+    'max_bytes': 5 * 1024 * 1024,
+    'backup_count': 5,
+    'batch_size': 256,
+    'events_file': 'email_events.jsonl',
+}
+
+
+@lru_cache(maxsize=None)
+def _batch_classes() -> Tuple[type, type]:
+    """
+    (BatchedRotatingFileHandler, BatchQueueListener)
+
+    Se definen la primera vez que se instala el logging: importar
+    logging.handlers arrastra socket y pickle, y un simple "import
+    email_sender" (o --help) no los necesita.
+    """
+    from logging.handlers import QueueListener, RotatingFileHandler
+
+    class BatchedRotatingFileHandler(RotatingFileHandler):
+        """
+        RotatingFileHandler que no vacía el buffer tras cada registro
+
+        El vaciado lo hace BatchQueueListener una vez por lote, así que cada lote
+        cuesta una sola escritura a disco.
+        """
+
+        def emit(self, record: logging.LogRecord):
+            try:
+                if self.shouldRollover(record):
+                    self.doRollover()
+                if self.stream is None:
+                    self.stream = self._open()
+                self.stream.write(self.format(record) + self.terminator)
+            except RecursionError:
+                raise
+            except Exception:
+                self.handleError(record)
+
+    class BatchQueueListener(QueueListener):
+        """QueueListener que atiende los registros por lotes y vacía los handlers al final de cada uno"""
+
+        def __init__(self, log_queue, *handlers, batch_size: int = 256):
+            super().__init__(log_queue, *handlers, respect_handler_level=True)
+            self.batch_size = max(1, batch_size)
+
+        def _monitor(self):
+            log_queue = self.queue
+            while True:
+                batch = [self.dequeue(True)]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(log_queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                stop = False
+                for record in batch:
+                    if record is self._sentinel:
+                        stop = True
+                        continue
+                    self.handle(record)
+                for handler in self.handlers:
+                    handler.flush()
+                if stop:
+                    break
+
+    return BatchedRotatingFileHandler, BatchQueueListener
+
+
+class JsonEventFormatter(logging.Formatter):
+    """Una línea JSON por evento de destinatario"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = {'ts': round(record.created, 3), 'event': record.getMessage()}
+        event.update(getattr(record, 'fields', {}))
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+def _is_event(record: logging.LogRecord) -> bool:
+    return record.name == EVENT_LOGGER
+
+
+def _is_not_event(record: logging.LogRecord) -> bool:
+    return record.name != EVENT_LOGGER
+
+
+class LogPipeline:
+    """Configuración de logging del proceso (se instala una sola vez)"""
+
+    def __init__(self, settings: Dict):
+        self.settings = {**DEFAULT_SETTINGS, **settings}
+        self.mode = self.settings['mode']
+        self.listener: Optional["QueueListener"] = None
+        self._listeners: List["QueueListener"] = []
+        self._handlers: List[logging.Handler] = []
+
+    def install(self):
+        settings = self.settings
+        level = getattr(logging, str(settings['level']).upper(), logging.INFO)
+        formatter = logging.Formatter(LOG_FORMAT)
+        BatchedRotatingFileHandler, BatchQueueListener = _batch_classes()
+
+        if self.mode == MODE_CLASSIC:
+            # Comportamiento original: un archivo por ejecución, escritura síncrona
+            log_file = f"email_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+            main_handler: logging.Handler = logging.FileHandler(log_file, encoding='utf-8', delay=True)
+        else:
+            main_handler = BatchedRotatingFileHandler(
+                settings['file'], maxBytes=settings['max_bytes'],
+                backupCount=settings['backup_count'], encoding='utf-8', delay=True)
+        main_handler.setFormatter(formatter)
+        main_handler.addFilter(_is_not_event)
+
+        console = logging.StreamHandler()
+        console.setFormatter(formatter)
+        console.addFilter(_is_not_event)
+        self._handlers = [main_handler, console]
+
+        if settings.get('events_file'):
+            if self.mode == MODE_CLASSIC:
+                events: logging.Handler = logging.FileHandler(settings['events_file'], encoding='utf-8',
+                                                              delay=True)
+            else:
+                events = BatchedRotatingFileHandler(
+                    settings['events_file'], maxBytes=settings['max_bytes'],
+                    backupCount=settings['backup_count'], encoding='utf-8', delay=True)
+            events.setFormatter(JsonEventFormatter())
+            events.addFilter(_is_event)
+            self._handlers.append(events)
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        event_logger = logging.getLogger(EVENT_LOGGER)
+        event_logger.setLevel(logging.INFO)
+        event_logger.disabled = not settings.get('events_file')
+
+        if self.mode == MODE_CLASSIC:
+            for handler in self._handlers:
+                root.addHandler(handler)
+            return
+
+        # Los hilos de envío solo encolan; el listener formatea y escribe
+        from logging.handlers import QueueHandler
+
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        root.addHandler(QueueHandler(log_queue))
+        self.listener = BatchQueueListener(log_queue, *self._handlers,
+                                           batch_size=settings['batch_size'])
+        self.listener.start()
+
+    def attach_queue(self, log_queue) -> "QueueListener":
+        """
+        Atiende otra cola con los mismos handlers
+
+        Los procesos hijos (configure_worker_logging) encolan sus registros en
+        una cola de multiprocessing y este proceso es el único que escribe.
+        """
+        listener = _batch_classes()[1](log_queue, *self._handlers,
+                                       batch_size=self.settings['batch_size'])
+        listener.start()
+        self._listeners.append(listener)
+        return listener
+
+    def stop(self):
+        """Vacía la cola y cierra los archivos (se llama también al salir del proceso)"""
+        for listener in self._listeners:
+            listener.stop()
+        self._listeners.clear()
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        for handler in self._handlers:
+            handler.flush()
+
+
+_pipeline: Optional[LogPipeline] = None
+_lock = threading.Lock()
+
+
+def configure_logging(settings: Optional[Dict] = None) -> LogPipeline:
+    """
+    Instala el logging del proceso según la sección "logging" de la configuración
+
+    Solo la primera llamada tiene efecto: crear varios enviadores en el mismo
+    proceso ya no genera un archivo de log nuevo cada vez.
+
+    Args:
+        settings: Sección "logging" (mode "queue" o "classic", level, file,
+            max_bytes, backup_count, batch_size, events_file)
+    """
+    global _pipeline
+    with _lock:
+        if _pipeline is None:
+            _pipeline = LogPipeline(settings or {})
+            _pipeline.install()
+            atexit.register(_pipeline.stop)
+        return _pipeline
+
+
+def configure_worker_logging(log_queue, settings: Optional[Dict] = None):
+    """
+    Logging de un proceso hijo: todos los registros van a log_queue
+
+    Sustituye cualquier configuración heredada del proceso padre; quien creó
+    la cola la atiende con LogPipeline.attach_queue.
+    """
+    global _pipeline
+    from logging.handlers import QueueHandler
+
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    with _lock:
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(QueueHandler(log_queue))
+        root.setLevel(getattr(logging, str(settings['level']).upper(), logging.INFO))
+        event_logger = logging.getLogger(EVENT_LOGGER)
+        event_logger.setLevel(logging.INFO)
+        event_logger.disabled = not settings.get('events_file')
+        # Las llamadas posteriores a configure_logging no instalan nada más
+        _pipeline = LogPipeline(settings)
+
+
+def log_event(event: str, email: str, **fields):
+    """
+    Registra un evento de destinatario en el log JSONL (sent, retry, failed, skipped)
+
+    No hace nada si events_file no está configurado.
+    """
+    logger = logging.getLogger(EVENT_LOGGER)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(event, extra={'fields': {'email': email, **fields}})
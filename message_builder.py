@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Serialización rápida de mensajes para el sistema de correos Tavolo Casa
+El esqueleto MIME constante se serializa una vez por campaña
+"""
+
+import base64
+import re
+from typing import TYPE_CHECKING, Callable, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    from email.mime.multipart import MIMEMultipart
+    from inline_images import InlineImage
+
+# Marcadores que ocupan el lugar de las partes variables en el esqueleto
+TO_SENTINEL = 'tavolo-casa-destinatario@invalid'
+BODY_SENTINEL = 'TAVOLOCASACUERPOHTML\n'
+TEXT_SENTINEL = 'TAVOLOCASACUERPOTEXTO\n'
+
+_EOL_PATTERN = re.compile(r'(?:\r\n|\n|\r(?!\n))')
+
+
+def to_wire(message_text: str) -> bytes:
+    """Convierte un mensaje serializado a los bytes que smtplib enviaría (CRLF)"""
+    return _EOL_PATTERN.sub('\r\n', message_text).encode('ascii')
+
+
+def encode_body(html_content: str) -> bytes:
+    """Cuerpo (HTML o texto) en UTF-8 + base64 con líneas de 76, igual que MIMEText"""
+    return base64.encodebytes(html_content.encode('utf-8')).replace(b'\n', b'\r\n')
+
+
+class MessageSkeleton:
+    """
+    Mensaje pre-serializado en el que solo se insertan To y los cuerpos
+
+    Cabeceras constantes, boundaries, adjuntos e imágenes incrustadas se
+    serializan una vez; por destinatario solo se unen bytes. El resultado es
+    idéntico byte a byte al de create_message() + as_string() con los mismos
+    boundaries.
+    """
+
+    def __init__(self, chunks: List[bytes], boundaries: List[str]):
+        """
+        Args:
+            chunks: Segmentos fijos: [antes de To, entre To y cuerpo, después del
+                cuerpo], o con texto plano [antes de To, entre To y texto, entre
+                texto y HTML, después del HTML]
+            boundaries: Boundaries MIME del esqueleto, en el orden de walk()
+        """
+        self._head, *self._middle, self._tail = chunks
+        self.boundaries = boundaries
+        self.boundary = boundaries[0]
+        self.plain_text = len(self._middle) == 2
+
+    @classmethod
+    def build(cls, create_message: Callable[..., "MIMEMultipart"], subject: str,
+              attachments: Optional[List[str]] = None,
+              plain_text: bool = False,
+              inline_images: Sequence["InlineImage"] = ()) -> "MessageSkeleton":
+        """
+        Construye el esqueleto con el mismo create_message que la ruta normal
+
+        Args:
+            create_message: Función que construye el mensaje MIME completo
+            subject: Asunto del correo
+            attachments: Lista de rutas de archivos adjuntos
+            plain_text: Incluir la alternativa text/plain antes del HTML
+            inline_images: Imágenes incrustadas que referencia el HTML
+        """
+        message = create_message(TO_SENTINEL, subject, '', attachments,
+                                 text_content='' if plain_text else None,
+                                 inline_images=list(inline_images) or None)
+        # Los cuerpos son las primeras partes text/plain y text/html del mensaje
+        bodies = {}
+        for part in message.walk():
+            bodies.setdefault(part.get_content_type(), part)
+        if plain_text:
+            bodies['text/plain'].set_payload(TEXT_SENTINEL)
+        bodies['text/html'].set_payload(BODY_SENTINEL)
+        wire = to_wire(message.as_string())
+
+        head, rest = wire.split(TO_SENTINEL.encode('ascii'), 1)
+        chunks = [head]
+        if plain_text:
+            middle, rest = rest.split(to_wire(TEXT_SENTINEL), 1)
+            chunks.append(middle)
+        middle, tail = rest.split(to_wire(BODY_SENTINEL), 1)
+        boundaries = [part.get_boundary() for part in message.walk() if part.is_multipart()]
+        return cls(chunks + [middle, tail], boundaries)
+
+    @staticmethod
+    def supports(to_email: str) -> bool:
+        """La ruta rápida solo admite direcciones ASCII sin saltos de línea"""
+        return to_email.isascii() and '\r' not in to_email and '\n' not in to_email
+
+    def render(self, to_email: str, html_content: str, text_content: Optional[str] = None) -> bytes:
+        """Mensaje completo listo para sendmail()"""
+        if self.plain_text:
+            before_text, before_html = self._middle
+            return b''.join((self._head, to_email.encode('ascii'), before_text,
+                             encode_body(text_content or ''), before_html,
+                             encode_body(html_content), self._tail))
+        return b''.join((self._head, to_email.encode('ascii'), self._middle[0],
+                         encode_body(html_content), self._tail))
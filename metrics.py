@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Instrumentación del envío para el sistema de correos Tavolo Casa
+Histogramas de tiempo por etapa, exportación JSON / Prometheus y perfilado opcional
+"""
+
+import bisect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import cProfile
+
+# Límites superiores (segundos) de los cubos de los histogramas
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+METRIC_PREFIX = 'tavolo'
+
+
+class Histogram:
+    """
+    Histograma de cubos fijos, seguro entre hilos
+
+    Con exact=True guarda además cada muestra (8 bytes por observación) y los
+    cuantiles son exactos en lugar del límite superior del cubo.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, exact: bool = False):
+        self.buckets = buckets
+        self.samples: Optional[array] = array('d') if exact else None
+        self.counts = [0] * (len(buckets) + 1)  # el último cubo es +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict:
+        # Se envía entre procesos (p. ej. dentro de CampaignStats): el cerrojo no viaja
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+            if self.samples is not None:
+                self.samples.append(value)
+
+    def merge(self, snapshot: Dict):
+        """Suma a este histograma el snapshot de otro con los mismos cubos"""
+        with self._lock:
+            # Las muestras del otro histograma no viajan en el snapshot
+            self.samples = None
+            for index, bucket_count in enumerate(snapshot['buckets'].values()):
+                self.counts[index] += bucket_count
+            if snapshot['count']:
+                self.min = min(self.min, snapshot['min'])
+                self.max = max(self.max, snapshot['max'])
+            self.count += snapshot['count']
+            self.sum += snapshot['sum']
+
+    def quantile(self, fraction: float, ordered: Optional[List[float]] = None) -> float:
+        """
+        Cuantil exacto si se guardan las muestras; si no, límite superior del cubo que lo contiene
+
+        Args:
+            ordered: Muestras ya ordenadas (para calcular varios cuantiles con una sola ordenación)
+        """
+        if not self.count:
+            return 0.0
+        if self.samples is not None:
+            if ordered is None:
+                ordered = sorted(self.samples)
+            return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+        target = fraction * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                # El máximo observado acota mejor que el límite del último cubo con muestras
+                return min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            ordered = sorted(self.samples) if self.samples is not None else None
+            return {
+                'count': self.count,
+                'sum': round(self.sum, 6),
+                'avg': round(self.sum / self.count, 6) if self.count else 0.0,
+                'min': round(self.min, 6) if self.count else 0.0,
+                'max': round(self.max, 6),
+                'p50': self.quantile(0.50, ordered),
+                'p95': self.quantile(0.95, ordered),
+                'p99': self.quantile(0.99, ordered),
+                'exact': self.samples is not None,
+                'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.counts)),
+            }
+
+
+class MetricsRegistry:
+    """
+    Métricas de una campaña: histogramas por etapa y contadores
+
+    Etapas instrumentadas: load, personalize, build, rate_wait, send, batch
+    y, dentro de cada sesión SMTP, connect, starttls, auth y data.
+    """
+
+    def __init__(self, exact_stages: Iterable[str] = ()):
+        """
+        Args:
+            exact_stages: Etapas que guardan cada muestra para dar cuantiles
+                exactos (p. ej. data en los benchmarks)
+        """
+        self.exact_stages = frozenset(exact_stages)
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._periodic: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def histogram(self, stage: str) -> Histogram:
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(
+                    stage, Histogram(exact=stage in self.exact_stages))
+        return histogram
+
+    def observe(self, stage: str, seconds: float):
+        self.histogram(stage).observe(seconds)
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Mide la duración del bloque y la añade al histograma de la etapa"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def merge(self, data: Dict):
+        """Acumula las métricas de otro registro (to_dict), p. ej. de otro proceso"""
+        for name, value in data.get('counters', {}).items():
+            self.increment(name, value)
+        for stage, snapshot in data.get('stages', {}).items():
+            self.histogram(stage).merge(snapshot)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            counters = dict(self.counters)
+            stages = list(self.histograms.items())
+        return {
+            'generated': round(time.time(), 3),
+            'uptime_seconds': round(time.time() - self.started, 3),
+            'counters': counters,
+            'stages': {stage: histogram.snapshot() for stage, histogram in stages},
+        }
+
+    def to_prometheus(self) -> str:
+        """Formato de texto de Prometheus (exposition format 0.0.4)"""
+        data = self.to_dict()
+        lines = [
+            f"# HELP {METRIC_PREFIX}_stage_seconds Duración de cada etapa del envío",
+            f"# TYPE {METRIC_PREFIX}_stage_seconds histogram",
+        ]
+        for stage, snapshot in data['stages'].items():
+            cumulative = 0
+            for bound, bucket_count in snapshot['buckets'].items():
+                cumulative += bucket_count
+                lines.append(f'{METRIC_PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_sum{{stage="{stage}"}} {snapshot["sum"]}')
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_count{{stage="{stage}"}} {snapshot["count"]}')
+        for name, value in data['counters'].items():
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name}_total counter")
+            lines.append(f"{METRIC_PREFIX}_{name}_total {value}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str):
+        """
+        Escribe las métricas de forma atómica
+
+        Formato Prometheus si la extensión es .prom o .txt; JSON en otro caso.
+        """
+        if path.endswith(('.prom', '.txt')):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), indent=2, ensure_ascii=False)
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temporary, path)
+
+    def start_periodic(self, path: str, interval: float):
+        """Vuelca las métricas a disco cada interval segundos en segundo plano"""
+        if interval <= 0 or self._periodic is not None:
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.write(path)
+                except OSError as e:
+                    logging.warning(f"No se pudieron escribir las métricas en {path}: {e}")
+
+        self._periodic = threading.Thread(target=loop, name='metricas', daemon=True)
+        self._periodic.start()
+
+    def stop_periodic(self):
+        if self._periodic is not None:
+            self._stop.set()
+            self._periodic.join()
+            self._periodic = None
+
+    def format_summary(self, stages: Optional[List[str]] = None) -> List[str]:
+        """Líneas legibles con el tiempo por etapa para el resumen final"""
+        lines = []
+        for stage, histogram in self.histograms.items():
+            if stages is not None and stage not in stages:
+                continue
+            snapshot = histogram.snapshot()
+            if not snapshot['count']:
+                continue
+            lines.append(f"  {stage:<12} n={snapshot['count']:<8} total {snapshot['sum']:.3f} s  "
+                         f"media {snapshot['avg'] * 1000:.2f} ms  "
+                         f"p95 {'' if snapshot['exact'] else '≤'}{snapshot['p95'] * 1000:.2f} ms")
+        return lines
+
+
+class ProfileHook:
+    """
+    Perfilado con cProfile de los hilos de trabajo
+
+    cProfile solo perfila el hilo que lo activa, así que cada hilo usa su
+    propio perfil y al final se combinan en un único archivo .prof. Desde
+    Python 3.12 cProfile se apoya en sys.monitoring y solo admite un perfil
+    activo en todo el proceso: ahí se perfila únicamente el hilo principal.
+    """
+
+    # Python < 3.12: un perfil por hilo
+    PER_THREAD = sys.version_info < (3, 12)
+
+    def __init__(self):
+        self._local = threading.local()
+        self._profiles: List["cProfile.Profile"] = []
+        self._lock = threading.Lock()
+        if not self.PER_THREAD:
+            logging.warning("Python 3.12+: cProfile admite un solo perfil por proceso, "
+                            "se perfila solo el hilo principal")
+
+    def _profile(self) -> Optional["cProfile.Profile"]:
+        if not self.PER_THREAD and threading.current_thread() is not threading.main_thread():
+            return None
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            import cProfile  # solo se carga si se pide perfilar (--profile)
+            profile = cProfile.Profile()
+            self._local.profile = profile
+            with self._lock:
+                self._profiles.append(profile)
+        return profile
+
+    def wrap(self, function: Callable) -> Callable:
+        """Devuelve function ejecutándose bajo el perfil del hilo que la llame"""
+        def profiled(*args, **kwargs):
+            profile = self._profile()
+            if profile is None:
+                return function(*args, **kwargs)
+            profile.enable()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.disable()
+        return profiled
+
+    def dump(self, path: str):
+        """Combina los perfiles de los hilos y los guarda para pstats/snakeviz"""
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return
+        import pstats
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+        logging.info(f"Perfil de CPU guardado en {path}")
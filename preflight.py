@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Preflight SMTP para el sistema de correos Tavolo Casa
+Resuelve el servidor, registra sus extensiones ESMTP y mide la conexión una
+vez; las sesiones de envío reutilizan esos datos en lugar de repetirlos
+"""
+
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
+
+if TYPE_CHECKING:
+    import smtplib
+
+# Extensiones que determinan cómo se envía (ver PooledSession.send_batch)
+KEY_EXTENSIONS = ('pipelining', 'size', '8bitmime', 'smtputf8')
+
+# Idas y vueltas por mensaje: con PIPELINING el sobre y el contenido viajan
+# encadenados; sin él, MAIL, RCPT, DATA y el fin del contenido esperan cada uno
+ROUND_TRIPS_PIPELINED = 1
+ROUND_TRIPS_SEQUENTIAL = 4
+
+CACHE_FILE = 'smtp_preflight.json'
+
+
+class ServerProfile(NamedTuple):
+    """Datos del servidor SMTP obtenidos en el último preflight"""
+    host: str
+    port: int
+    addresses: Tuple[str, ...]
+    local_hostname: str
+    capabilities: Dict[str, str]    # extensiones tras STARTTLS (nombre en minúsculas -> parámetros)
+    timings: Dict[str, float]       # segundos: dns, connect, tls, auth, rtt (mediana de las sondas)
+    sessions: int                   # sesiones simultáneas que aceptó el servidor
+    checked: float                  # fecha del preflight
+    resolved: float                 # fecha de la última resolución DNS
+
+    def supports(self, extension: str) -> bool:
+        return extension.lower() in self.capabilities
+
+    def to_json(self) -> Dict:
+        data = self._asdict()
+        data['addresses'] = list(self.addresses)
+        return data
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "ServerProfile":
+        return cls(**{**data, 'addresses': tuple(data['addresses'])})
+
+
+def cache_key(host: str, port: int) -> str:
+    return f"{host.lower()}:{port}"
+
+
+def resolve(host: str, port: int) -> Tuple[str, ...]:
+    """Direcciones IP del servidor, en el orden de getaddrinfo y sin repetir"""
+    import socket
+
+    addresses: Dict[str, None] = {}
+    for *_, sockaddr in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+        addresses[sockaddr[0]] = None
+    return tuple(addresses)
+
+
+class PreflightCache:
+    """
+    Archivo JSON con el perfil de cada servidor (host:puerto)
+
+    Se lee una vez por proceso y se vuelve a leer solo si el archivo cambia,
+    así que consultarlo en cada conexión cuesta un stat().
+    """
+
+    _shared: Dict[str, "PreflightCache"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path: str = CACHE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple[int, int]] = None
+        self._profiles: Dict[str, ServerProfile] = {}
+
+    @classmethod
+    def shared(cls, path: str) -> "PreflightCache":
+        """Caché del proceso para el archivo path"""
+        with cls._shared_lock:
+            cache = cls._shared.get(path)
+            if cache is None:
+                cache = cls._shared[path] = cls(path)
+            return cache
+
+    def _load(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self._signature, self._profiles = None, {}
+            return
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._profiles = {key: ServerProfile.from_json(value) for key, value in data.items()}
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            logging.warning(f"Caché de preflight {self.path} no válida ({e}): se ignora")
+            self._profiles = {}
+        self._signature = signature
+
+    def get(self, host: str, port: int) -> Optional[ServerProfile]:
+        with self._lock:
+            self._load()
+            return self._profiles.get(cache_key(host, port))
+
+    def save(self, profile: ServerProfile):
+        """Guarda (o sustituye) el perfil del servidor de forma atómica"""
+        with self._lock:
+            self._load()
+            self._profiles[cache_key(profile.host, profile.port)] = profile
+            data = {key: value.to_json() for key, value in self._profiles.items()}
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, temporary = tempfile.mkstemp(prefix='.preflight-', dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=4, ensure_ascii=False)
+                os.replace(temporary, self.path)
+            except BaseException:
+                os.remove(temporary)
+                raise
+            self._signature = None
+
+
+def cached_profile(config: Dict) -> Optional[ServerProfile]:
+    """
+    Perfil del servidor configurado si el preflight está vigente
+
+    Las extensiones y medidas valen preflight_ttl segundos; las direcciones
+    se vuelven a resolver (una sola consulta DNS) cada dns_cache_ttl.
+
+    Returns:
+        None si no hay preflight, ha caducado o la caché está desactivada
+    """
+    settings = config.get('email_settings', {})
+    path = settings.get('preflight_cache', CACHE_FILE)
+    if not path:
+        return None
+    cache = PreflightCache.shared(path)
+    profile = cache.get(config['smtp_server'], config['smtp_port'])
+    now = time.time()
+    if profile is None or now - profile.checked > settings.get('preflight_ttl', 86400):
+        return None
+    if now - profile.resolved > settings.get('dns_cache_ttl', 3600):
+        try:
+            addresses = resolve(profile.host, profile.port)
+        except OSError as e:
+            logging.warning(f"No se pudo resolver {profile.host} ({e}): se usan las direcciones en caché")
+            return profile
+        profile = profile._replace(addresses=addresses, resolved=now)
+        try:
+            cache.save(profile)
+        except OSError as e:
+            logging.debug(f"No se pudo actualizar la caché de preflight: {e}")
+    return profile
+
+
+@lru_cache(maxsize=None)
+def _resolved_smtp_class() -> type:
+    """
+    Clase SMTP que abre el socket contra direcciones ya resueltas
+
+    Se crea con el nombre del servidor, que smtplib conserva para el SNI y la
+    verificación del certificado en STARTTLS; solo el socket se abre contra
+    la primera de las direcciones que responda.
+    """
+    import smtplib  # no se carga (con ssl) solo para leer la caché de preflight
+
+    class ResolvedSMTP(smtplib.SMTP):
+        def __init__(self, addresses: Tuple[str, ...], host: str, port: int, **kwargs):
+            self.addresses = addresses
+            super().__init__(host, port, **kwargs)
+
+        def _get_socket(self, host, port, timeout):
+            error: Optional[OSError] = None
+            for address in self.addresses:
+                try:
+                    return super()._get_socket(address, port, timeout)
+                except OSError as e:
+                    logging.info(f"No se pudo conectar a {address} ({e}), probando otra dirección")
+                    error = e
+            raise error or OSError(f"Sin direcciones para {host}")
+
+    return ResolvedSMTP
+
+
+def open_connection(config: Dict, timeout: float, profile: Optional[ServerProfile] = None) -> "smtplib.SMTP":
+    """
+    Abre la conexión SMTP (sin STARTTLS ni autenticación)
+
+    Con perfil se conecta directamente a la dirección en caché, sin consulta
+    DNS ni getfqdn(); el nombre del servidor se conserva para el SNI y la
+    verificación del certificado en STARTTLS.
+    """
+    import smtplib
+
+    if profile is None:
+        return smtplib.SMTP(config['smtp_server'], config['smtp_port'], timeout=timeout)
+    try:
+        return _resolved_smtp_class()(profile.addresses, profile.host, profile.port,
+                                      local_hostname=profile.local_hostname, timeout=timeout)
+    except OSError:
+        pass
+    # Direcciones de la caché obsoletas: conexión normal por nombre
+    return smtplib.SMTP(profile.host, profile.port, local_hostname=profile.local_hostname, timeout=timeout)
+
+
+class Probe(NamedTuple):
+    """Resultado de una sonda (una sesión completa)"""
+    timings: Dict[str, float]
+    capabilities: Dict[str, str]
+    error: Optional[str]
+
+
+def probe(config: Dict, address: str, local_hostname: str, timeout: float = 30) -> Probe:
+    """Conecta, negocia STARTTLS y se autentica midiendo cada paso"""
+    import smtplib
+    from smtp_pool import default_ssl_context
+
+    timings: Dict[str, float] = {}
+    capabilities: Dict[str, str] = {}
+    server: Optional["smtplib.SMTP"] = None
+    try:
+        started = time.perf_counter()
+        server = _resolved_smtp_class()((address,), config['smtp_server'], config['smtp_port'],
+                                        local_hostname=local_hostname, timeout=timeout)
+        server.ehlo()
+        timings['connect'] = time.perf_counter() - started
+        if config.get('smtp_starttls', True):
+            started = time.perf_counter()
+            server.starttls(context=default_ssl_context())
+            server.ehlo()
+            timings['tls'] = time.perf_counter() - started
+        capabilities = dict(server.esmtp_features)
+        if config.get('sender_password'):
+            started = time.perf_counter()
+            server.login(config['sender_email'], config['sender_password'])
+            timings['auth'] = time.perf_counter() - started
+        started = time.perf_counter()
+        server.noop()
+        timings['rtt'] = time.perf_counter() - started
+        return Probe(timings, capabilities, None)
+    except (smtplib.SMTPException, OSError) as e:
+        return Probe(timings, capabilities, str(e) or type(e).__name__)
+    finally:
+        if server is not None:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                server.close()
+
+
+class PreflightReport(NamedTuple):
+    profile: Optional[ServerProfile]
+    probes: List[Probe]
+    suggestion: Dict[str, int]
+
+
+def target_rate(settings: Dict) -> Optional[float]:
+    """Correos por segundo que permite la configuración (None = sin límite)"""
+    global_limit = settings.get('rate_limits', {}).get('global')
+    if global_limit:
+        return global_limit['rate']
+    delay = settings.get('delay_between_emails', 2)
+    return 1 / delay if delay and delay > 0 else None
+
+
+def suggest(profile: ServerProfile, settings: Dict) -> Dict[str, int]:
+    """
+    Ajustes de concurrency y batch_size para el servidor medido
+
+    La concurrencia es la necesaria para sostener el ritmo permitido con la
+    latencia medida (ritmo x segundos por mensaje), sin superar las sesiones
+    que el servidor aceptó a la vez. Con PIPELINING los lotes encadenan los
+    mensajes y cada uno cuesta una ida y vuelta; sin él, agrupar no ahorra
+    esperas y se envía de uno en uno.
+    """
+    pipelining = profile.supports('pipelining')
+    round_trips = ROUND_TRIPS_PIPELINED if pipelining else ROUND_TRIPS_SEQUENTIAL
+    per_message = profile.timings.get('rtt', 0) * round_trips
+    rate = target_rate(settings)
+    sessions = max(1, profile.sessions)
+    if rate is None:
+        concurrency = sessions
+    else:
+        concurrency = min(sessions, max(1, math.ceil(rate * per_message)))
+    batch_size = 1
+    if pipelining:
+        batch_size = min(50, settings.get('max_messages_per_session', 100) or 50)
+    return {'concurrency': concurrency, 'batch_size': batch_size}
+
+
+def run_preflight(config: Dict, parallel: Optional[int] = None, save: bool = True) -> PreflightReport:
+    """
+    Resuelve el servidor y lanza sondas simultáneas
+
+    Args:
+        config: Configuración del sistema
+        parallel: Sondas a la vez (por defecto la concurrencia configurada, mínimo 2)
+        save: Guardar el perfil en la caché (email_settings.preflight_cache)
+
+    Returns:
+        Perfil (None si ninguna sonda se completó), sondas y ajustes sugeridos
+    """
+    settings = config.get('email_settings', {})
+    host, port = config['smtp_server'], config['smtp_port']
+    parallel = max(1, parallel or max(2, settings.get('concurrency', 1), settings.get('pool_size', 1)))
+    timeout = settings.get('smtp_timeout', 30)
+
+    import socket
+    import statistics
+
+    started = time.perf_counter()
+    addresses = resolve(host, port)
+    dns = time.perf_counter() - started
+    local_hostname = socket.getfqdn()
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        probes = list(executor.map(lambda _: probe(config, addresses[0], local_hostname, timeout),
+                                   range(parallel)))
+    completed = [result for result in probes if result.error is None]
+    if not completed:
+        return PreflightReport(None, probes, {})
+
+    timings = {'dns': dns}
+    for stage in ('connect', 'tls', 'auth', 'rtt'):
+        values = [result.timings[stage] for result in completed if stage in result.timings]
+        if values:
+            timings[stage] = statistics.median(values)
+    now = time.time()
+    profile = ServerProfile(host, port, addresses, local_hostname, completed[0].capabilities,
+                            timings, len(completed), now, now)
+    if save and settings.get('preflight_cache', CACHE_FILE):
+        PreflightCache.shared(settings.get('preflight_cache', CACHE_FILE)).save(profile)
+    return PreflightReport(profile, probes, suggest(profile, settings))
+
+
+def print_report(report: PreflightReport):
+    """Resumen del preflight para la consola"""
+    errors = [result.error for result in report.probes if result.error]
+    profile = report.profile
+    if profile is None:
+        print(f"❌ Ninguna sesión SMTP se completó: {errors[0] if errors else 'error desconocido'}")
+        return
+
+    def ms(stage: str) -> str:
+        return f"{profile.timings[stage] * 1000:.0f} ms" if stage in profile.timings else "-"
+
+    print(f"🔍 Servidor {profile.host}:{profile.port} → {', '.join(profile.addresses)} (DNS {ms('dns')})")
+    print(f"   Conexión {ms('connect')} · TLS {ms('tls')} · autenticación {ms('auth')} · "
+          f"ida y vuelta {ms('rtt')}")
+    extensions = [f"{name.upper()} {profile.capabilities[name]}".strip()
+                  for name in KEY_EXTENSIONS if profile.supports(name)]
+    print(f"   Extensiones: {', '.join(extensions) or 'ninguna de ' + ', '.join(KEY_EXTENSIONS).upper()}")
+    print(f"   Sesiones simultáneas aceptadas: {profile.sessions}/{len(report.probes)}")
+    for error in dict.fromkeys(errors):
+        print(f"   ⚠️ {error}")
+    print("💡 Ajustes sugeridos para config.json (email_settings): "
+          + ", ".join(f'"{key}": {value}' for key, value in report.suggestion.items()))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Preflight desde la línea de comandos"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Preflight del servidor SMTP de Tavolo Casa")
+    parser.add_argument('--config', default="config.json",
+                        help="Archivo de configuración (por defecto config.json)")
+    parser.add_argument('--parallel', type=int, help="Sesiones de prueba simultáneas")
+    parser.add_argument('--apply', action='store_true',
+                        help="Guardar los ajustes sugeridos en el archivo de configuración")
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        report = run_preflight(config, args.parallel)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"❌ Error: {e}")
+        return 1
+    print_report(report)
+    if report.profile is None:
+        return 1
+    if args.apply:
+        config.setdefault('email_settings', {}).update(report.suggestion)
+        with open(args.config, 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=4, ensure_ascii=False)
+        print(f"✅ Ajustes guardados en {args.config}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Limitador de velocidad para el sistema de correos Tavolo Casa
+Token bucket global y por dominio de destino, configurable desde email_settings
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """
+    Token bucket seguro entre hilos
+
+    Cada envío reserva un token; si no hay disponibles, la reserva devuelve
+    cuánto hay que esperar para respetar el ritmo configurado.
+    """
+
+    def __init__(self, rate: float, burst: float = 1):
+        """
+        Args:
+            rate: Tokens (mensajes) por segundo
+            burst: Tokens acumulables como máximo (ráfaga permitida)
+        """
+        if rate <= 0:
+            raise ValueError("rate debe ser mayor que 0")
+        self.rate = rate
+        self.capacity = max(1.0, float(burst))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Reserva un token y devuelve los segundos a esperar antes de usarlo"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """Bloquea hasta disponer de un token"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket compartido entre procesos
+
+    El estado (tokens disponibles e instante de la última actualización) vive
+    en memoria compartida y se protege con un lock de multiprocessing, de modo
+    que varios procesos de envío respetan juntos el mismo ritmo. Se pasa a
+    los procesos hijos al crearlos (p. ej. en el initializer de un Pool).
+    """
+
+    def __init__(self, rate: float, burst: float = 1, context=None):
+        """
+        Args:
+            rate: Tokens (mensajes) por segundo
+            burst: Tokens acumulables como máximo
+            context: Contexto de multiprocessing (por defecto el del sistema)
+        """
+        if rate <= 0:
+            raise ValueError("rate debe ser mayor que 0")
+        if context is None:
+            import multiprocessing
+            context = multiprocessing.get_context()
+        self.rate = rate
+        self.capacity = max(1.0, float(burst))
+        # time.monotonic usa un reloj común a todo el sistema
+        self._state = context.RawArray('d', [self.capacity, time.monotonic()])
+        self._lock = context.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            tokens, updated = self._state[0], self._state[1]
+            now = time.monotonic()
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate) - 1
+            self._state[0], self._state[1] = tokens, now
+        if tokens >= 0:
+            return 0.0
+        return -tokens / self.rate
+
+
+class RateLimiter:
+    """
+    Límite global más límites por dominio de destino (gmail.com, outlook.com, ...)
+
+    Configuración en email_settings:
+
+        "rate_limits": {
+            "global": {"rate": 5, "burst": 5},
+            "domains": {"gmail.com": {"rate": 1, "burst": 2}}
+        }
+
+    Los dominios sin entrada propia solo están sujetos al límite global.
+    """
+
+    def __init__(self, global_bucket: Optional[TokenBucket] = None,
+                 domain_buckets: Optional[Dict[str, TokenBucket]] = None):
+        self.global_bucket = global_bucket
+        self.domain_buckets = {d.lower(): b for d, b in (domain_buckets or {}).items()}
+
+    @classmethod
+    def from_settings(cls, settings: Dict, delay_seconds: float = 0,
+                      shared: bool = False, context=None) -> "RateLimiter":
+        """
+        Crea el limitador a partir de email_settings
+
+        Si no hay límite global configurado se usa el ritmo equivalente a
+        delay_seconds (un mensaje cada delay_seconds segundos).
+
+        Args:
+            shared: Crear buckets compartidos entre procesos (SharedTokenBucket)
+            context: Contexto de multiprocessing para los buckets compartidos
+        """
+        limits = settings.get('rate_limits', {})
+
+        def bucket(rate: float, burst: float = 1) -> TokenBucket:
+            if shared:
+                return SharedTokenBucket(rate, burst, context)
+            return TokenBucket(rate, burst)
+
+        global_limit = limits.get('global')
+        if global_limit:
+            global_bucket = bucket(global_limit['rate'], global_limit.get('burst', 1))
+        elif delay_seconds and delay_seconds > 0:
+            global_bucket = bucket(1 / delay_seconds)
+        else:
+            global_bucket = None
+
+        domain_buckets = {
+            domain: bucket(limit['rate'], limit.get('burst', 1))
+            for domain, limit in limits.get('domains', {}).items()
+        }
+        return cls(global_bucket, domain_buckets)
+
+    @property
+    def enabled(self) -> bool:
+        return self.global_bucket is not None or bool(self.domain_buckets)
+
+    def reserve(self, email: str) -> float:
+        """
+        Reserva el turno de envío a la dirección sin bloquear
+
+        Returns:
+            Segundos que hay que esperar antes de enviar (0 si se puede ya)
+        """
+        wait = 0.0
+        if self.global_bucket is not None:
+            wait = self.global_bucket.reserve()
+        domain_bucket = self.domain_buckets.get(email.rpartition('@')[2].lower())
+        if domain_bucket is not None:
+            wait = max(wait, domain_bucket.reserve())
+        return wait
+
+    def acquire(self, email: str):
+        """Bloquea hasta que se pueda enviar a la dirección indicada"""
+        wait = self.reserve(email)
+        if wait > 0:
+            time.sleep(wait)
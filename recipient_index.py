@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Índice de destinatarios para el sistema de correos Tavolo Casa
+Normaliza y deduplica la lista antes de enviar y agrupa los contactos por dominio
+"""
+
+import csv
+import json
+import logging
+import os
+import re
+import tempfile
+import zlib
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import sqlite3
+
+CONTACT_FIELDS = ('nombre', 'apellido', 'empresa')
+
+REASON_INVALID = 'invalido'
+REASON_DUPLICATE = 'duplicado'
+REASON_MERGED = 'fusionado'
+
+REPORT_HEADER = ['fila', 'email_original', 'motivo', 'email_normalizado', 'fila_conservada']
+
+_ADDRESS = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+def normalize_email(raw: Optional[str]) -> Optional[str]:
+    """
+    Forma canónica de una dirección (sin espacios y en minúsculas)
+
+    Returns:
+        La dirección normalizada, o None si no es una dirección válida
+    """
+    if not raw:
+        return None
+    email = raw.strip().lower()
+    if not _ADDRESS.match(email):
+        return None
+    return email
+
+
+def email_domain(email: str) -> str:
+    return email.rpartition('@')[2]
+
+
+def shard_of(email: str, shards: int) -> int:
+    """
+    Shard (0..shards-1) al que pertenece una dirección
+
+    Usa un hash estable (CRC32 de la dirección normalizada), igual en todos los
+    procesos, así que los duplicados de una dirección caen en el mismo shard.
+    """
+    key = normalize_email(email) or email.strip().lower()
+    return zlib.crc32(key.encode('utf-8')) % shards
+
+
+class RecipientIndex:
+    """
+    Índice en disco (SQLite) de los destinatarios únicos de una lista
+
+    El CSV se lee una sola vez; cada fila se inserta con INSERT OR IGNORE
+    sobre la dirección normalizada, así que la memoria usada no depende del
+    tamaño de la lista. Las filas descartadas (inválidas o duplicadas) se
+    escriben en un informe CSV a medida que aparecen; si un duplicado trae
+    datos que faltaban en la fila conservada, se completan (fila fusionada).
+    """
+
+    def __init__(self, path: Optional[str] = None, cache_mb: int = 64):
+        """
+        Args:
+            path: Archivo del índice (por defecto uno temporal que se borra al cerrar)
+            cache_mb: Memoria máxima de la caché de páginas de SQLite
+        """
+        self._temporary = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='tavolo-destinatarios-', suffix='.sqlite')
+            os.close(fd)
+        self.path = path
+        self.rows_read = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.merged = 0
+
+        import sqlite3  # contact_store y suppression importan el módulo solo por sus funciones
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(f"PRAGMA cache_size=-{cache_mb * 1024}")
+        self._conn.execute("DROP TABLE IF EXISTS recipients")
+        self._conn.execute(
+            "CREATE TABLE recipients ("
+            " fila INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE, email TEXT NOT NULL,"
+            " domain TEXT NOT NULL, nombre TEXT, apellido TEXT, empresa TEXT, extra TEXT)")
+
+    @classmethod
+    def build(cls, csv_file: str, report_file: Optional[str] = None,
+              path: Optional[str] = None,
+              shard: Optional[Tuple[int, int]] = None,
+              extra_fields: Sequence[str] = ()) -> "RecipientIndex":
+        """
+        Construye el índice a partir de un CSV con el formato de lista_correos.csv
+
+        Args:
+            csv_file: Lista de correos
+            report_file: CSV donde anotar las filas descartadas o fusionadas
+            path: Archivo del índice (por defecto temporal)
+            shard: (shard, total) para indexar solo las direcciones de ese shard
+            extra_fields: Otras columnas del CSV que conservar en cada contacto
+                (p. ej. la que elige la variante de plantilla)
+        """
+        index = cls(path)
+        try:
+            index.load(csv_file, report_file, shard, extra_fields)
+        except Exception:
+            index.close()
+            raise
+        return index
+
+    def load(self, csv_file: str, report_file: Optional[str] = None,
+             shard: Optional[Tuple[int, int]] = None, extra_fields: Sequence[str] = ()):
+        """Lee el CSV en una sola pasada e inserta los destinatarios únicos (del shard indicado)"""
+        insert = ("INSERT OR IGNORE INTO recipients (key, email, domain, nombre, apellido, empresa, extra, fila)"
+                  " VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+        cursor = self._conn.cursor()
+        report = open(report_file, 'w', encoding='utf-8', newline='') if report_file else None
+        try:
+            writer = csv.writer(report) if report else None
+            if writer:
+                writer.writerow(REPORT_HEADER)
+            with open(csv_file, 'r', encoding='utf-8-sig') as f:
+                # fila 1 = cabecera, igual que al abrir el CSV en una hoja de cálculo
+                for row_number, row in enumerate(csv.DictReader(f), 2):
+                    self.rows_read += 1
+                    raw = row.get('email') or ''
+                    key = normalize_email(raw)
+                    if key is None:
+                        if shard is not None and shard[0] != 0:
+                            continue  # las filas inválidas se anotan solo en el primer shard
+                        self.invalid += 1
+                        if writer:
+                            writer.writerow([row_number, raw, REASON_INVALID, '', ''])
+                        continue
+
+                    if shard is not None and zlib.crc32(key.encode('utf-8')) % shard[1] != shard[0]:
+                        continue
+
+                    fields = [(row.get(name) or '').strip() for name in CONTACT_FIELDS]
+                    extra = (json.dumps({name: (row.get(name) or '').strip() for name in extra_fields},
+                                        ensure_ascii=False) if extra_fields else None)
+                    cursor.execute(insert, (key, raw.strip(), email_domain(key), *fields, extra, row_number))
+                    if cursor.rowcount:
+                        continue
+
+                    self.duplicates += 1
+                    reason = REASON_MERGED if self._merge(cursor, key, fields) else REASON_DUPLICATE
+                    if reason == REASON_MERGED:
+                        self.merged += 1
+                    if writer:
+                        kept = cursor.execute("SELECT fila FROM recipients WHERE key = ?", (key,)).fetchone()[0]
+                        writer.writerow([row_number, raw, reason, key, kept])
+            self._conn.execute("CREATE INDEX IF NOT EXISTS recipients_domain ON recipients (domain, fila)")
+            self._conn.commit()
+        finally:
+            if report:
+                report.close()
+
+        logging.info(f"Índice de destinatarios: {len(self)} únicos de {self.rows_read} filas "
+                     f"({self.duplicates} duplicados, {self.merged} fusionados, {self.invalid} inválidos)")
+
+    @staticmethod
+    def _merge(cursor: "sqlite3.Cursor", key: str, fields: List[str]) -> bool:
+        """Completa los campos vacíos de la fila conservada con los del duplicado"""
+        if not any(fields):
+            return False
+        assignments = ', '.join(
+            f"{name} = CASE WHEN {name} = '' AND ? != '' THEN ? ELSE {name} END" for name in CONTACT_FIELDS)
+        conditions = ' OR '.join(f"({name} = '' AND ? != '')" for name in CONTACT_FIELDS)
+        params = [value for value in fields for _ in (0, 1)] + [key] + fields
+        cursor.execute(f"UPDATE recipients SET {assignments} WHERE key = ? AND ({conditions})", params)
+        return cursor.rowcount > 0
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM recipients").fetchone()[0]
+
+    def domains(self) -> List[Tuple[str, int]]:
+        """Dominios de destino con su número de destinatarios, de mayor a menor"""
+        return self._conn.execute(
+            "SELECT domain, COUNT(*) AS n FROM recipients GROUP BY domain ORDER BY n DESC, domain"
+        ).fetchall()
+
+    def iter_contacts(self, group_by_domain: bool = False,
+                      fetch_size: int = 1000) -> Iterator[Dict[str, str]]:
+        """
+        Recorre los destinatarios únicos sin cargarlos todos en memoria
+
+        Args:
+            group_by_domain: Entregar seguidos los contactos de cada dominio (en
+                otro caso se respeta el orden original del CSV)
+            fetch_size: Filas leídas del índice en cada bloque
+        """
+        order = "domain, fila" if group_by_domain else "fila"
+        cursor = self._conn.execute(
+            f"SELECT email, nombre, apellido, empresa, extra FROM recipients ORDER BY {order}")
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                return
+            for email, nombre, apellido, empresa, extra in rows:
+                contact = {'email': email, 'nombre': nombre, 'apellido': apellido, 'empresa': empresa}
+                if extra:
+                    contact.update(json.loads(extra))
+                yield contact
+
+    def close(self):
+        self._conn.close()
+        if self._temporary:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
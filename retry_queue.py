@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Cola de reintentos para el sistema de correos Tavolo Casa
+Distingue errores SMTP transitorios de permanentes y reprograma los primeros
+con backoff exponencial y jitter
+"""
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    Clasifica un error de envío
+
+    Las respuestas 4xx, las desconexiones y los errores de red son
+    transitorios; las respuestas 5xx y el resto de errores son permanentes.
+    """
+    import smtplib  # ya cargado por quien envía; no se importa al arrancar
+
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        if codes and all(400 <= code < 500 for code in codes):
+            return TRANSIENT
+        return PERMANENT
+    if isinstance(error, smtplib.SMTPResponseException):
+        return TRANSIENT if 400 <= error.smtp_code < 500 else PERMANENT
+    if isinstance(error, (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)):
+        return TRANSIENT
+    if isinstance(error, smtplib.SMTPNotSupportedError):
+        return PERMANENT
+    if isinstance(error, OSError):
+        return TRANSIENT
+    return PERMANENT
+
+
+class RetryScheduler:
+    """
+    Cola de reintentos ordenada por instante de vencimiento
+
+    El retraso del intento n es base_delay * 2**n (limitado a max_delay), con
+    jitter: se espera entre la mitad y el total de ese valor.
+    """
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 5, max_delay: float = 300):
+        """
+        Args:
+            max_retries: Reintentos máximos por destinatario
+            base_delay: Segundos de espera antes del primer reintento
+            max_delay: Espera máxima entre reintentos
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._heap: List[Tuple[float, int, int, Any]] = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: Dict) -> "RetryScheduler":
+        """Crea la cola con max_retries y los retrasos de email_settings"""
+        return cls(
+            max_retries=settings.get('max_retries', 3),
+            base_delay=settings.get('retry_base_delay', 5),
+            max_delay=settings.get('retry_max_delay', 300),
+        )
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def backoff(self, attempt: int) -> float:
+        """Segundos de espera antes del reintento número attempt (1, 2, ...)"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def schedule(self, item: Any, attempt: int) -> Optional[float]:
+        """
+        Reprograma un elemento que ha fallado de forma transitoria
+
+        Args:
+            item: Elemento a reintentar
+            attempt: Número del reintento (1 para el primero)
+
+        Returns:
+            Segundos hasta el reintento, o None si se agotaron los reintentos
+        """
+        if attempt > self.max_retries:
+            return None
+        delay = self.backoff(attempt)
+        with self._lock:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), attempt, item))
+        return delay
+
+    def pop_due(self) -> List[Tuple[Any, int]]:
+        """Extrae los elementos cuyo reintento ya ha vencido, con su número de intento"""
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, _, attempt, item = heapq.heappop(self._heap)
+                due.append((item, attempt))
+        return due
+
+    def time_until_next(self) -> Optional[float]:
+        """Segundos hasta el próximo reintento (None si la cola está vacía)"""
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - time.monotonic())
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Diario de envíos para el sistema de correos Tavolo Casa
+Registro JSONL de solo escritura al final que permite reanudar campañas
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Union
+
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+
+def make_campaign_id(email_list_file: str, template_file: str, subject: str) -> str:
+    """Identificador estable de campaña a partir de lista, plantilla y asunto"""
+    key = '\0'.join((os.path.abspath(email_list_file), os.path.abspath(template_file), subject))
+    stem = Path(email_list_file).stem
+    return f"{stem}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}"
+
+
+class SendJournal:
+    """
+    Diario append-only con el resultado de cada destinatario
+
+    Cada línea es un objeto JSON. Las escrituras se acumulan en memoria y se
+    vuelcan a disco (con fsync) cada fsync_interval segundos o cada
+    fsync_batch registros, lo que ocurra antes.
+    """
+
+    def __init__(self, path: str, fsync_interval: float = 1.0, fsync_batch: int = 500,
+                 offset: int = 0):
+        """
+        Args:
+            path: Ruta del archivo JSONL del diario
+            fsync_interval: Segundos máximos entre volcados a disco
+            fsync_batch: Registros pendientes que fuerzan un volcado
+            offset: Byte del diario desde el que cargar los entregados (los
+                registros anteriores ya los tiene en cuenta quien llama)
+        """
+        self.path = Path(path)
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = fsync_batch
+        self._delivered: Set[str] = set()
+        self._failed: Set[str] = set()  # fallidos que aún no se han entregado
+        self._buffer: List[str] = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        truncated = False
+        if self.path.exists():
+            self.load_delivered(self.path, offset)
+            truncated = self._ends_mid_line()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if truncated:
+            self._file.write('\n')
+
+    @staticmethod
+    def path_for(campaign_id: str, settings: Dict) -> str:
+        """Ruta del diario de una campaña según email_settings"""
+        return os.path.join(settings.get('journal_dir', 'journals'), f"{campaign_id}.jsonl")
+
+    @staticmethod
+    def shard_paths(campaign_id: str, settings: Dict) -> List[str]:
+        """
+        Diarios de shards de la campaña que siguen en disco
+
+        Normalmente el coordinador los combina al terminar; si quedan es que
+        la ejecución por procesos se interrumpió antes de hacerlo.
+        """
+        pattern = os.path.join(glob.escape(settings.get('journal_dir', 'journals')),
+                               f"{glob.escape(campaign_id)}.shard*.jsonl")
+        return sorted(glob.glob(pattern))
+
+    @classmethod
+    def for_campaign(cls, campaign_id: str, settings: Dict, offset: int = 0) -> "SendJournal":
+        """Abre el diario de una campaña según email_settings"""
+        return cls(
+            cls.path_for(campaign_id, settings),
+            fsync_interval=settings.get('journal_fsync_interval', 1.0),
+            fsync_batch=settings.get('journal_fsync_batch', 500),
+            offset=offset,
+        )
+
+    @staticmethod
+    def normalize(email: str) -> str:
+        return email.strip().lower()
+
+    @property
+    def delivered_count(self) -> int:
+        return len(self._delivered)
+
+    def is_delivered(self, email: str) -> bool:
+        """Indica en O(1) si la dirección ya recibió el correo"""
+        return self.normalize(email) in self._delivered
+
+    def is_failed(self, email: str) -> bool:
+        """Indica si el último intento registrado para la dirección falló"""
+        return self.normalize(email) in self._failed
+
+    def start(self, campaign_id: str, **details):
+        """Registra el inicio (o reanudación) de una ejecución de la campaña"""
+        self._append({'type': 'run', 'campaign_id': campaign_id,
+                      'started': datetime.now().isoformat(timespec='seconds'), **details})
+        self.flush()
+
+    def record(self, email: str, status: str, **details):
+        """
+        Registra el resultado de un destinatario
+
+        Args:
+            email: Dirección de destino
+            status: STATUS_SENT o STATUS_FAILED
+            details: Campos adicionales (p. ej. error)
+        """
+        self._track(email, status)
+        self._append({'email': email, 'status': status, 'ts': round(time.time(), 3), **details})
+
+    def merge_from(self, path: str) -> int:
+        """
+        Añade al final de este diario los registros de otro (p. ej. el de un shard)
+
+        Returns:
+            Registros copiados
+        """
+        copied = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if 'email' in entry:
+                    self._track(entry['email'], entry.get('status'))
+                self._append(entry)
+                copied += 1
+        self.flush()
+        return copied
+
+    def _track(self, email: str, status: Optional[str]):
+        key = self.normalize(email)
+        if status == STATUS_SENT:
+            self._delivered.add(key)
+            self._failed.discard(key)
+        elif status == STATUS_FAILED and key not in self._delivered:
+            self._failed.add(key)
+
+    def flush(self):
+        """Vuelca a disco los registros pendientes"""
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _append(self, entry: Dict):
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._buffer.append(line)
+            if (len(self._buffer) >= self.fsync_batch
+                    or time.monotonic() - self._last_flush >= self.fsync_interval):
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self._buffer:
+            self._file.write('\n'.join(self._buffer) + '\n')
+            self._buffer.clear()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._last_flush = time.monotonic()
+
+    def _ends_mid_line(self) -> bool:
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b'\n'
+
+    def load_delivered(self, path: Union[str, Path], offset: int = 0):
+        """
+        Añade al índice de entregados los destinatarios enviados según un diario
+
+        Se usa al abrir el diario propio y, al reanudar por shards, para
+        cargar también el diario principal de la campaña.
+
+        Args:
+            offset: Byte (inicio de línea) desde el que leer
+        """
+        before = len(self._delivered)
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line_number, line in enumerate(f, 1):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Última línea a medias tras una caída: se ignora
+                    logging.warning(f"Línea {line_number} del diario {path} ilegible, se ignora")
+                    continue
+                if 'email' in entry:
+                    self._track(entry['email'], entry.get('status'))
+        logging.info(f"Diario {path}: {len(self._delivered) - before} destinatarios ya entregados")
+
+
+class DryRunJournal(SendJournal):
+    """
+    Diario de una simulación (--dry-run / --render-to)
+
+    Lee el diario real para que la reanudación se comporte igual, pero no
+    escribe nada: una simulación nunca marca destinatarios como entregados.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._delivered: Set[str] = set()
+        self._failed: Set[str] = set()  # fallidos que aún no se han entregado
+        # El informe de descartes se guarda junto al diario también en simulación
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            self.load_delivered(self.path)
+
+    def _append(self, entry: Dict):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
@@ -8,9 +8,6 @@ import json
 import os
 import sys
 import getpass
-from email.utils import parseaddr
-import smtplib
-import ssl
 
 def print_banner():
     """Muestra el banner de bienvenida"""
@@ -43,18 +40,30 @@ def get_smtp_config(provider):
 
 def validate_email(email):
     """Valida formato de email"""
+    from email.utils import parseaddr
     parsed = parseaddr(email)
     return '@' in parsed[1] and '.' in parsed[1].split('@')[1]
 
-def test_smtp_connection(config):
-    """Prueba la conexión SMTP"""
+def test_smtp_connection(config, apply_suggestions=False):
+    """
+    Prueba la conexión SMTP con un preflight (preflight.py)
+
+    Resuelve el servidor, abre varias sesiones a la vez midiendo conexión,
+    TLS y autenticación, y guarda la dirección y las extensiones del servidor
+    en la caché que usan después los envíos. Con apply_suggestions se copian
+    a email_settings los ajustes de concurrencia y lote sugeridos.
+    """
+    # smtplib y ssl solo se cargan si se llega a probar la conexión
+    from preflight import print_report, run_preflight
+
     try:
         print("🔍 Probando conexión SMTP...")
-        context = ssl.create_default_context()
-        
-        with smtplib.SMTP(config['smtp_server'], config['smtp_port']) as server:
-            server.starttls(context=context)
-            server.login(config['sender_email'], config['sender_password'])
+        report = run_preflight(config)
+        print_report(report)
+        if report.profile is None:
+            return False
+        if apply_suggestions:
+            config.setdefault('email_settings', {}).update(report.suggestion)
             
         print("✅ Conexión SMTP exitosa!")
         return True
@@ -143,13 +152,71 @@ def setup_configuration():
         "email_settings": {
             "delay_between_emails": 2,
             "max_retries": 3,
-            "batch_size": 50
+            "retry_base_delay": 5,
+            "retry_max_delay": 300,
+            "batch_size": 50,
+            "pool_size": 1,
+            "max_messages_per_session": 100,
+            "health_check_interval": 30,
+            "smtp_timeout": 30,
+            "concurrency": 4,
+            "journal_dir": "journals",
+            "journal_fsync_interval": 1.0,
+            "journal_fsync_batch": 500,
+            "attachment_cache_mb": 64,
+            "attachment_mmap_threshold_mb": 8,
+            "fast_message_path": True,
+            "metrics_file": "metricas_envio.json",
+            "metrics_interval": 30,
+            "dedupe_recipients": True,
+            "group_by_domain": False,
+            "suppression_db": "suppression.sqlite",
+            "template_reload_interval": 2,
+            "template_cache_size": 10000,
+            "template_cache_mb": 64,
+            "plain_text_alternative": True,
+            "inline_images": True,
+            "inline_image_max_width": 1200,
+            "inline_image_quality": 85,
+            "inline_remote_images": False,
+            "scheduler": {
+                "db": "campaigns.sqlite",
+                "daily_quota": 450,
+                "slice_size": 50,
+                "poll_interval": 60
+            },
+            "contact_store": True,
+            "contact_store_dir": "contactos",
+            "bounces": {
+                "mailbox": "",
+                "soft_bounce_limit": 3,
+                "soft_bounce_days": 30
+            },
+            "preflight_cache": "smtp_preflight.json",
+            "preflight_ttl": 86400,
+            "dns_cache_ttl": 3600,
+            "rate_limits": {
+                "global": {"rate": 0.5, "burst": 1},
+                "domains": {
+                    "gmail.com": {"rate": 0.2, "burst": 2},
+                    "outlook.com": {"rate": 0.2, "burst": 2}
+                }
+            }
+        },
+        "logging": {
+            "mode": "queue",
+            "level": "INFO",
+            "file": "email_log.log",
+            "max_bytes": 5242880,
+            "backup_count": 5,
+            "batch_size": 256,
+            "events_file": "email_events.jsonl"
         }
     }
     
     # Probar conexión
     print("\n🔗 PRUEBA DE CONEXIÓN")
-    if test_smtp_connection(config):
+    if test_smtp_connection(config, apply_suggestions=True):
         # Guardar configuración
         with open('config.json', 'w', encoding='utf-8') as f:
             json.dump(config, f, indent=4, ensure_ascii=False)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Envío masivo por shards para el sistema de correos Tavolo Casa
+Reparte la lista entre varios procesos (cada uno con sus sesiones SMTP) con
+límites de envío compartidos, y combina diarios, métricas y resumen al final
+"""
+
+import csv
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from campaign_stats import CampaignStats
+from contact_store import ContactStore
+from email_sender import TavoloCasaEmailSender
+from log_pipeline import configure_logging, configure_worker_logging
+from metrics import MetricsRegistry
+from rate_limiter import RateLimiter
+from send_journal import SendJournal, make_campaign_id
+
+# Estado de cada proceso de trabajo (lo rellena _init_worker)
+_worker: Dict = {}
+
+
+def _init_worker(config_file: str, rate_limiter: RateLimiter, log_queue, log_settings: Optional[Dict]):
+    configure_worker_logging(log_queue, log_settings)
+    _worker['config_file'] = config_file
+    _worker['rate_limiter'] = rate_limiter
+
+
+def _run_shard(shard: int, shards: int, options: Dict) -> Tuple[CampaignStats, Dict]:
+    """Envía la parte de la lista que corresponde a un shard (en el proceso de trabajo)"""
+    sender = TavoloCasaEmailSender(_worker['config_file'])
+    sender.send_bulk_emails(**options, shard=(shard, shards),
+                            rate_limiter=_worker['rate_limiter'], show_summary=False)
+    return sender.last_stats, sender.metrics.to_dict()
+
+
+class ShardedCampaign:
+    """
+    Ejecuta una campaña repartida entre varios procesos
+
+    Cada dirección se asigna a un shard según un hash estable de la dirección
+    normalizada (recipient_index.shard_of) y cada proceso lee la lista y envía
+    solo su parte, con sus propias sesiones SMTP. Los límites global y por
+    dominio se comparten entre procesos (SharedTokenBucket) y el logging se
+    centraliza en el proceso coordinador.
+    """
+
+    def __init__(self, config_file: str = "config.json", workers: int = 2):
+        """
+        Args:
+            config_file: Ruta al archivo de configuración
+            workers: Número de procesos de envío
+        """
+        self.config_file = config_file
+        self.workers = max(1, workers)
+        self.sender = TavoloCasaEmailSender(config_file)
+
+    def run(self, email_list_file: str, template_file: str, subject: str,
+            attachments: Optional[List[str]] = None, delay_seconds: int = 2,
+            concurrency: Optional[int] = None, campaign_id: Optional[str] = None,
+            resume: bool = False, profile: Optional[str] = None,
+            batch_size: Optional[int] = None, dry_run: bool = False,
+            render_to: Optional[str] = None) -> Dict:
+        """
+        Envía la campaña con self.workers procesos (mismos argumentos que send_bulk_emails)
+
+        Returns:
+            Resumen combinado de todos los shards
+        """
+        config = self.sender.config
+        settings = config.get('email_settings', {})
+        campaign_id = campaign_id or make_campaign_id(email_list_file, template_file, subject)
+        shards = self.workers
+
+        context = multiprocessing.get_context('spawn')
+        rate_limiter = RateLimiter.from_settings(settings, delay_seconds, shared=True, context=context)
+        log_queue = context.Queue()
+        configure_logging(config.get('logging')).attach_queue(log_queue)
+
+        if settings.get('dedupe_recipients', True) and settings.get('contact_store', True):
+            # Se importa aquí para que los procesos no lo hagan a la vez
+            ContactStore.for_csv(email_list_file, settings).close()
+
+        if resume and not (dry_run or render_to):
+            # Diarios de shards de una ejecución interrumpida (quizá con otro
+            # número de procesos): se combinan antes de repartir la lista
+            self._merge_journals(campaign_id, settings, shards, email_list_file, template_file, subject)
+
+        logging.info(f"Campaña {campaign_id} repartida en {shards} procesos")
+        started = time.monotonic()
+        options = {
+            'email_list_file': email_list_file,
+            'template_file': template_file,
+            'subject': subject,
+            'attachments': attachments,
+            'delay_seconds': delay_seconds,
+            'concurrency': concurrency,
+            'campaign_id': campaign_id,
+            'resume': resume,
+            'batch_size': batch_size,
+            'dry_run': dry_run,
+            'render_to': render_to,
+        }
+        try:
+            with ProcessPoolExecutor(max_workers=shards, mp_context=context, initializer=_init_worker,
+                                     initargs=(self.config_file, rate_limiter, log_queue,
+                                               config.get('logging'))) as executor:
+                futures = [
+                    executor.submit(_run_shard, shard, shards,
+                                    {**options, 'profile': self._shard_path(profile, shard)})
+                    for shard in range(shards)
+                ]
+                results = [future.result() for future in futures]
+        finally:
+            # También si un shard falla o se interrumpe la campaña: lo ya
+            # entregado queda en el diario principal y --resume lo omite
+            if not (dry_run or render_to):
+                self._merge_journals(campaign_id, settings, shards, email_list_file, template_file, subject)
+
+        stats = CampaignStats.merge([shard_stats for shard_stats, _ in results], started)
+        stats.finish()
+        metrics = MetricsRegistry()
+        for _, shard_metrics in results:
+            metrics.merge(shard_metrics)
+        self.sender.metrics = metrics
+        metrics_file = settings.get('metrics_file')
+        if metrics_file:
+            try:
+                metrics.write(metrics_file)
+            except OSError as e:
+                logging.warning(f"No se pudieron escribir las métricas en {metrics_file}: {e}")
+
+        if dry_run or render_to:
+            print(f"\n🧪 Simulación: no se ha enviado ningún correo"
+                  + (f" (mensajes guardados en {render_to})" if render_to else ""))
+        stats.print_summary()
+        print(f"Procesos: {shards}")
+        self.sender.print_variant_summary(stats)
+        self.sender.print_stage_summary()
+        logging.info(f"{'Simulación completada' if stats.dry_run else 'Envío masivo completado'} "
+                     f"({shards} procesos). {stats.result}")
+        return stats.as_dict()
+
+    @staticmethod
+    def _shard_path(path: Optional[str], shard: int) -> Optional[str]:
+        if not path:
+            return None
+        root, extension = os.path.splitext(path)
+        return f"{root}.shard{shard}{extension}"
+
+    @staticmethod
+    def _merge_journals(campaign_id: str, settings: Dict, shards: int,
+                        email_list_file: str, template_file: str, subject: str):
+        """Vuelca los diarios e informes de descartes de cada shard en los de la campaña"""
+        with SendJournal.for_campaign(campaign_id, settings) as journal:
+            journal.start(campaign_id, email_list_file=email_list_file,
+                          template_file=template_file, subject=subject, shards=shards)
+            # Todos los diarios de shards en disco, no solo los de esta
+            # ejecución: una anterior pudo usar otro número de procesos
+            for shard_journal in SendJournal.shard_paths(campaign_id, settings):
+                journal.merge_from(shard_journal)
+                os.remove(shard_journal)
+            reports = []
+            for shard in range(shards):
+                report = str(journal.path.with_name(f"{campaign_id}.shard{shard}.descartados.csv"))
+                if os.path.exists(report):
+                    reports.append(report)
+            report_file = journal.path.with_name(f"{campaign_id}.descartados.csv")
+
+        if not reports:
+            return
+        with open(report_file, 'w', encoding='utf-8', newline='') as out:
+            writer = csv.writer(out)
+            for number, report in enumerate(reports):
+                with open(report, 'r', encoding='utf-8', newline='') as f:
+                    reader = csv.reader(f)
+                    header = next(reader, None)
+                    if number == 0 and header:
+                        writer.writerow(header)
+                    writer.writerows(reader)
+                os.remove(report)
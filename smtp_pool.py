@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+Pool de sesiones SMTP para el sistema de correos Tavolo Casa
+Mantiene sesiones autenticadas abiertas durante toda la campaña y las reutiliza
+"""
+
+import smtplib
+import ssl
+import logging
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from message_builder import to_wire
+from metrics import MetricsRegistry
+from preflight import cached_profile, open_connection
+
+# Códigos SMTP que indican que el servidor ha cerrado (o va a cerrar) la sesión
+SESSION_CLOSED_CODES = (421,)
+
+# Reserva el turno de envío a un destinatario y devuelve los segundos que hay
+# que esperar antes de enviarle (ver RateLimiter.reserve)
+Reserve = Callable[[str], float]
+
+UNCERTAIN_MESSAGE = "Sesión perdida tras enviar el mensaje, sin respuesta del servidor"
+
+_LEADING_DOT = re.compile(br'(?m)^\.')
+
+_ssl_context: Optional[ssl.SSLContext] = None
+_ssl_lock = threading.Lock()
+
+
+def default_ssl_context() -> ssl.SSLContext:
+    """
+    Contexto SSL del proceso, creado la primera vez que se pide
+
+    Crear un contexto carga los certificados de CA del sistema, así que todos
+    los pools (también los de un solo uso de send_email) comparten el mismo.
+    """
+    global _ssl_context
+    with _ssl_lock:
+        if _ssl_context is None:
+            _ssl_context = ssl.create_default_context()
+        return _ssl_context
+
+
+class DeliveryUncertain(smtplib.SMTPServerDisconnected):
+    """
+    La sesión se perdió entre el final de DATA y la respuesta del servidor
+
+    El servidor puede haber aceptado ya el mensaje, así que el pool no lo
+    reenvía por su cuenta: se devuelve como fallo transitorio y es la cola
+    de reintentos (que lo anota en el diario) quien decide.
+    """
+
+
+def _dot_stuff(msg: bytes) -> bytes:
+    """Duplica los puntos a principio de línea y garantiza el CRLF final (RFC 5321)"""
+    data = _LEADING_DOT.sub(b'..', msg)
+    if not data.endswith(b'\r\n'):
+        data += b'\r\n'
+    return data
+
+
+class PooledSession:
+    """Sesión SMTP autenticada reutilizable entre varios envíos"""
+
+    def __init__(self, config: Dict, context: ssl.SSLContext, timeout: float = 30,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            config: Configuración del sistema (servidor, puerto, credenciales)
+            context: Contexto SSL compartido por todas las sesiones del pool
+            timeout: Timeout de socket en segundos
+            metrics: Registro donde medir connect, starttls, auth y data
+        """
+        self.config = config
+        self.context = context
+        self.timeout = timeout
+        self.metrics = metrics
+        self.server: Optional[smtplib.SMTP] = None
+        self.messages_sent = 0
+        self.last_used = 0.0
+        # Transacción fallida o abortada: enviar RSET antes de reutilizar la sesión
+        self.needs_reset = False
+        # Contenido transmitido sin respuesta todavía: si la sesión cae en este
+        # punto no se sabe si el servidor aceptó el mensaje
+        self.awaiting_reply = False
+
+    @property
+    def connected(self) -> bool:
+        return self.server is not None
+
+    def _timer(self, stage: str):
+        return self.metrics.timer(stage) if self.metrics is not None else nullcontext()
+
+    def connect(self):
+        """
+        Abre la conexión, negocia STARTTLS y se autentica
+
+        Si hay un preflight vigente (preflight.py) se conecta a la dirección
+        ya resuelta, sin consulta DNS ni getfqdn() por sesión.
+        """
+        with self._timer('connect'):
+            server = open_connection(self.config, self.timeout, cached_profile(self.config))
+        try:
+            if self.config.get('smtp_starttls', True):
+                with self._timer('starttls'):
+                    server.starttls(context=self.context)
+            if self.config.get('sender_password'):
+                with self._timer('auth'):
+                    server.login(self.config['sender_email'], self.config['sender_password'])
+        except Exception:
+            self._quit(server)
+            raise
+
+        self.server = server
+        self.messages_sent = 0
+        self.last_used = time.monotonic()
+        logging.debug(f"Sesión SMTP abierta con {self.config['smtp_server']}")
+
+    def close(self):
+        """Cierra la sesión si está abierta"""
+        if self.server is not None:
+            self._quit(self.server)
+            self.server = None
+        self.needs_reset = False
+        self.awaiting_reply = False
+
+    def reconnect(self):
+        """Descarta la sesión actual y abre una nueva"""
+        self.close()
+        self.connect()
+
+    def is_alive(self) -> bool:
+        """Comprueba con NOOP que la sesión sigue aceptando comandos"""
+        if self.server is None:
+            return False
+        try:
+            code, _ = self.server.noop()
+            return code == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def reset(self) -> bool:
+        """Envía RSET para limpiar una transacción a medias"""
+        if self.server is None:
+            return False
+        try:
+            code, _ = self.server.rset()
+        except (smtplib.SMTPException, OSError):
+            return False
+        self.needs_reset = code != 250
+        return not self.needs_reset
+
+    def sendmail(self, from_addr: str, to_addrs: Union[str, List[str]],
+                 msg: Union[str, bytes]) -> Dict:
+        """
+        Envía un mensaje por la sesión actual (debe estar conectada)
+
+        Misma transacción que smtplib.SMTP.sendmail, salvo que si la sesión
+        se pierde entre el final de DATA y la respuesta lanza DeliveryUncertain.
+        """
+        try:
+            with self._timer('data'):
+                refused = self._transaction(from_addr, to_addrs, msg)
+        except Exception as e:
+            self.needs_reset = True
+            if self.awaiting_reply:
+                self.awaiting_reply = False
+                raise DeliveryUncertain(f"{UNCERTAIN_MESSAGE}: {e}") from e
+            raise
+        self.messages_sent += 1
+        self.last_used = time.monotonic()
+        return refused
+
+    def _transaction(self, from_addr: str, to_addrs: Union[str, List[str]],
+                     msg: Union[str, bytes]) -> Dict:
+        server = self.server
+        if isinstance(msg, str):
+            msg = to_wire(msg)
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+        server.ehlo_or_helo_if_needed()
+        options = [f"size={len(msg)}"] if server.does_esmtp and server.has_extn('size') else []
+
+        code, reply = server.mail(from_addr, options)
+        if code != 250:
+            self._close_on_421(code)
+            raise smtplib.SMTPSenderRefused(code, reply, from_addr)
+        refused = {}
+        for to_addr in to_addrs:
+            code, reply = server.rcpt(to_addr)
+            if code not in (250, 251):
+                refused[to_addr] = (code, reply)
+                if code == 421:
+                    self._close_on_421(code)
+                    raise smtplib.SMTPRecipientsRefused(refused)
+        if len(refused) == len(to_addrs):
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+        code, reply = server.docmd('data')
+        if code != 354:
+            self._close_on_421(code)
+            raise smtplib.SMTPDataError(code, reply)
+        self.awaiting_reply = True
+        server.send(_dot_stuff(msg) + b'.\r\n')
+        code, reply = server.getreply()
+        self.awaiting_reply = False
+        if code != 250:
+            self._close_on_421(code)
+            raise smtplib.SMTPDataError(code, reply)
+        return refused
+
+    def _close_on_421(self, code: int):
+        # Como smtplib: tras un 421 el servidor cierra la sesión
+        if code in SESSION_CLOSED_CODES:
+            self.server.close()
+
+    def send_batch(self, from_addr: str, messages: List[Tuple[str, bytes]],
+                   reserve: Optional[Reserve] = None) -> List[Optional[Exception]]:
+        """
+        Envía varios mensajes por la sesión actual
+
+        Si el servidor anuncia PIPELINING, los comandos MAIL/RCPT/DATA de cada
+        mensaje viajan juntos y el contenido de un mensaje se envía en el mismo
+        grupo que los comandos del siguiente (RFC 2920), de modo que cada
+        mensaje cuesta una sola ida y vuelta. Si no, se envían uno a uno.
+
+        Args:
+            from_addr: Remitente del sobre
+            messages: Pares (destinatario, mensaje en bytes con CRLF)
+            reserve: Turno de cada mensaje, pedido justo antes de su MAIL FROM;
+                así el lote respeta los límites de envío mensaje a mensaje
+
+        Returns:
+            Para cada mensaje, None si se aceptó o la excepción SMTP del fallo
+        """
+        self.server.ehlo_or_helo_if_needed()
+        if self.server.has_extn('pipelining'):
+            results = self._send_pipelined(from_addr, messages, reserve)
+        else:
+            results = self._send_sequential(from_addr, messages, reserve)
+        self.last_used = time.monotonic()
+        return results
+
+    def _send_sequential(self, from_addr: str, messages: List[Tuple[str, bytes]],
+                         reserve: Optional[Reserve] = None) -> List[Optional[Exception]]:
+        results: List[Optional[Exception]] = []
+        for to_addr, msg in messages:
+            if self.server is None or self.server.sock is None:
+                results.append(smtplib.SMTPServerDisconnected('Sesión cerrada durante el lote'))
+                continue
+            wait = reserve(to_addr) if reserve is not None else 0.0
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self.sendmail(from_addr, to_addr, msg)
+                results.append(None)
+            except (smtplib.SMTPException, OSError) as e:
+                results.append(e)
+        return results
+
+    def _send_pipelined(self, from_addr: str, messages: List[Tuple[str, bytes]],
+                        reserve: Optional[Reserve] = None) -> List[Optional[Exception]]:
+        server = self.server
+        results: List[Optional[Exception]] = [None] * len(messages)
+        use_size = server.has_extn('size')
+
+        def envelope(index: int) -> bytes:
+            to_addr, msg = messages[index]
+            size = f" SIZE={len(msg)}" if use_size else ""
+            return (f"MAIL FROM:{smtplib.quoteaddr(from_addr)}{size}\r\n"
+                    f"RCPT TO:{smtplib.quoteaddr(to_addr)}\r\n"
+                    f"DATA\r\n").encode(server.command_encoding)
+
+        def turn(position: int) -> float:
+            return reserve(messages[position][0]) if reserve is not None else 0.0
+
+        metrics = self.metrics
+        index = 0
+        # Último mensaje cuyo contenido salió completo y aún no tiene respuesta
+        transmitted = -1
+        try:
+            wait = turn(0)
+            if wait > 0:
+                time.sleep(wait)
+            server.send(envelope(0))
+            started = time.perf_counter()
+            while index < len(messages):
+                to_addr, msg = messages[index]
+                mail_reply = server.getreply()
+                rcpt_reply = server.getreply()
+                data_reply = server.getreply()
+                # El sobre del siguiente solo se encadena si ya tiene turno
+                wait = turn(index + 1) if index + 1 < len(messages) else 0.0
+                following = envelope(index + 1) if index + 1 < len(messages) and wait <= 0 else b''
+
+                error: Optional[Exception] = None
+                if mail_reply[0] != 250:
+                    error = smtplib.SMTPSenderRefused(mail_reply[0], mail_reply[1], from_addr)
+                elif rcpt_reply[0] not in (250, 251):
+                    error = smtplib.SMTPRecipientsRefused({to_addr: rcpt_reply})
+
+                if data_reply[0] == 354:
+                    # Contenido de este mensaje + sobre del siguiente en un solo envío
+                    body = b'' if error else _dot_stuff(msg)
+                    server.send(body + b'.\r\n' + following)
+                    if error is None:
+                        transmitted = index
+                    end_reply = server.getreply()
+                    transmitted = -1
+                    if error is None and end_reply[0] != 250:
+                        error = smtplib.SMTPDataError(*end_reply)
+                else:
+                    if error is None:
+                        error = smtplib.SMTPDataError(*data_reply)
+                    # Limpiar la transacción antes de enviar el siguiente sobre
+                    server.send(b'RSET\r\n' + following)
+                    server.getreply()
+
+                if metrics is not None:
+                    # Tiempo de cada transacción dentro del lote encadenado
+                    finished = time.perf_counter()
+                    metrics.observe('data', finished - started)
+                    started = finished
+
+                results[index] = error
+                if error is not None and getattr(error, 'smtp_code', None) in SESSION_CLOSED_CODES:
+                    raise error
+                if error is None:
+                    self.messages_sent += 1
+                if wait > 0:
+                    # Sin turno para el siguiente: se espera con la transacción ya cerrada
+                    time.sleep(wait)
+                    server.send(envelope(index + 1))
+                    started = time.perf_counter()
+                index += 1
+        except (smtplib.SMTPException, OSError) as e:
+            # Sesión perdida: el mensaje en curso y los restantes quedan sin enviar
+            for pending in range(index, len(messages)):
+                if results[pending] is None:
+                    results[pending] = e
+            if transmitted >= 0:
+                results[transmitted] = DeliveryUncertain(f"{UNCERTAIN_MESSAGE}: {e}")
+            self.close()
+        return results
+
+    @staticmethod
+    def _quit(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+
+class SMTPConnectionPool:
+    """
+    Pool de sesiones SMTP autenticadas
+
+    Las sesiones se abren bajo demanda, se verifican con NOOP cuando han estado
+    inactivas, se reconectan de forma transparente si el servidor las cierra
+    (desconexión o respuesta 421) y se reciclan tras un número de mensajes.
+    Un mensaje cuyo contenido ya se transmitió nunca se reenvía por una
+    sesión nueva: ver DeliveryUncertain.
+    """
+
+    def __init__(self, config: Dict, size: int = 1, max_messages_per_session: int = 100,
+                 health_check_interval: float = 30, timeout: float = 30,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            config: Configuración del sistema
+            size: Número máximo de sesiones abiertas a la vez
+            max_messages_per_session: Mensajes enviados antes de reciclar la sesión (0 = sin límite)
+            health_check_interval: Segundos de inactividad tras los que se verifica la sesión
+            timeout: Timeout de socket en segundos
+            metrics: Registro de métricas compartido por las sesiones (opcional)
+        """
+        self.config = config
+        self.size = max(1, size)
+        self.max_messages_per_session = max_messages_per_session
+        self.health_check_interval = health_check_interval
+        self.context = default_ssl_context()
+        self.reconnections = 0
+
+        self._lock = threading.Lock()
+        self._closed = False
+        self._sessions: List[PooledSession] = [
+            PooledSession(config, self.context, timeout, metrics) for _ in range(self.size)
+        ]
+        self._idle: "queue.LifoQueue[PooledSession]" = queue.LifoQueue()
+        for session in self._sessions:
+            self._idle.put(session)
+
+    @classmethod
+    def from_config(cls, config: Dict, size: Optional[int] = None,
+                    metrics: Optional[MetricsRegistry] = None) -> "SMTPConnectionPool":
+        """Crea un pool con los parámetros de email_settings"""
+        settings = config.get('email_settings', {})
+        return cls(
+            config,
+            size=size if size is not None else settings.get('pool_size', 1),
+            max_messages_per_session=settings.get('max_messages_per_session', 100),
+            health_check_interval=settings.get('health_check_interval', 30),
+            timeout=settings.get('smtp_timeout', 30),
+            metrics=metrics,
+        )
+
+    def use_metrics(self, metrics: Optional[MetricsRegistry]):
+        """Mide las sesiones en otro registro (p. ej. el de cada campaña que reutiliza el pool)"""
+        for session in self._sessions:
+            session.metrics = metrics
+
+    @contextmanager
+    def acquire(self):
+        """Presta una sesión conectada y verificada; la devuelve al pool al salir"""
+        if self._closed:
+            raise RuntimeError("El pool SMTP está cerrado")
+
+        session = self._idle.get()
+        try:
+            self._prepare(session)
+            yield session
+        except Exception as e:
+            # Una sesión rota no se devuelve conectada al pool; si solo se
+            # abortó la transacción se limpia con RSET antes de reutilizarla
+            if self.is_session_error(e):
+                session.close()
+            else:
+                session.needs_reset = True
+            raise
+        finally:
+            self._release(session)
+
+    def sendmail(self, from_addr: str, to_addrs: Union[str, List[str]],
+                 msg: Union[str, bytes]) -> Dict:
+        """
+        Envía un mensaje usando una sesión del pool
+
+        Si la sesión se ha caído (desconexión, reset o 421) antes de enviar el
+        contenido se reconecta una vez y se reintenta el envío. Si cae después
+        del final de DATA el servidor puede haber aceptado el mensaje, así que
+        no se reenvía: se lanza DeliveryUncertain. El resto de errores se propagan.
+        """
+        with self.acquire() as session:
+            try:
+                return session.sendmail(from_addr, to_addrs, msg)
+            except Exception as e:
+                if not self.is_session_error(e) or isinstance(e, DeliveryUncertain):
+                    raise
+                logging.warning(f"Sesión SMTP perdida ({e}), reconectando...")
+                self._reconnect(session)
+                return session.sendmail(from_addr, to_addrs, msg)
+
+    def send_batch(self, from_addr: str, messages: List[Tuple[str, bytes]],
+                   reserve: Optional[Reserve] = None) -> List[Optional[Exception]]:
+        """
+        Envía un lote de mensajes por una sola sesión del pool
+
+        Args:
+            reserve: Turno de cada mensaje según los límites de envío (ver PooledSession.send_batch)
+
+        Returns:
+            Para cada mensaje, None si se aceptó o la excepción del fallo
+        """
+        with self.acquire() as session:
+            return session.send_batch(from_addr, messages, reserve)
+
+    def close(self):
+        """Cierra todas las sesiones del pool"""
+        with self._lock:
+            self._closed = True
+        for session in self._sessions:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def is_session_error(error: Exception) -> bool:
+        """Indica si el error significa que la sesión ya no es utilizable"""
+        if isinstance(error, smtplib.SMTPServerDisconnected):
+            return True
+        if isinstance(error, smtplib.SMTPResponseException):
+            return error.smtp_code in SESSION_CLOSED_CODES
+        return isinstance(error, (ConnectionError, TimeoutError))
+
+    def _prepare(self, session: PooledSession):
+        if not session.connected:
+            session.connect()
+            return
+        if session.needs_reset and not session.reset():
+            logging.info("La sesión SMTP no acepta RSET, reconectando")
+            self._reconnect(session)
+            return
+        idle = time.monotonic() - session.last_used
+        if idle >= self.health_check_interval and not session.is_alive():
+            logging.info("Sesión SMTP inactiva no responde, reconectando")
+            self._reconnect(session)
+
+    def _release(self, session: PooledSession):
+        if session.server is not None and session.server.sock is None:
+            # smtplib cerró el socket (p. ej. tras un 421)
+            session.close()
+        if (self.max_messages_per_session
+                and session.messages_sent >= self.max_messages_per_session):
+            logging.debug(f"Reciclando sesión SMTP tras {session.messages_sent} mensajes")
+            session.close()
+        if self._closed:
+            session.close()
+        self._idle.put(session)
+
+    def _reconnect(self, session: PooledSession):
+        with self._lock:
+            self.reconnections += 1
+        if session.metrics is not None:
+            session.metrics.increment('reconnections')
+        session.reconnect()
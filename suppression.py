@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Lista de supresión para el sistema de correos Tavolo Casa
+Direcciones que no deben recibir más correos (bajas, rebotes y quejas)
+"""
+
+import csv
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from recipient_index import normalize_email
+
+if TYPE_CHECKING:
+    import sqlite3
+
+REASON_UNSUBSCRIBE = 'unsubscribe'
+REASON_BOUNCE = 'bounce'
+REASON_COMPLAINT = 'complaint'
+REASON_MANUAL = 'manual'
+
+# Parámetros por consulta IN (por debajo del límite histórico de SQLite, 999)
+CHUNK_SIZE = 500
+
+
+def _key(email: str) -> str:
+    return normalize_email(email) or email.strip().lower()
+
+
+class SuppressionList:
+    """
+    Lista de supresión almacenada en SQLite
+
+    Las direcciones se guardan normalizadas como clave primaria, así que cada
+    comprobación es una búsqueda en el índice B-tree; los contactos de una
+    campaña se comprueban por bloques con una sola consulta IN por bloque.
+    """
+
+    def __init__(self, path: str = "suppression.sqlite"):
+        self.path = path
+        import sqlite3  # la lista solo se abre si la campaña la usa
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS suppressed ("
+            " email TEXT PRIMARY KEY, reason TEXT NOT NULL, source TEXT, added REAL NOT NULL"
+            ") WITHOUT ROWID")
+        self._conn.commit()
+
+    @classmethod
+    def from_settings(cls, settings: Dict) -> Optional["SuppressionList"]:
+        """Abre la lista indicada en email_settings.suppression_db (None si no hay)"""
+        path = settings.get('suppression_db')
+        return cls(path) if path else None
+
+    def add(self, email: str, reason: str = REASON_MANUAL, source: str = '') -> None:
+        self.add_many([email], reason, source)
+
+    def add_many(self, emails: Iterable[str], reason: str = REASON_MANUAL, source: str = '') -> int:
+        """
+        Añade direcciones a la lista (si ya estaban se actualiza el motivo)
+
+        Returns:
+            Direcciones procesadas
+        """
+        with self._lock:
+            added = self.insert_many(self._conn, emails, reason, source)
+            self._conn.commit()
+        return added
+
+    @staticmethod
+    def insert_many(conn: "sqlite3.Connection", emails: Iterable[str], reason: str = REASON_MANUAL,
+                    source: str = '') -> int:
+        """
+        Como add_many, pero con otra conexión a la misma base de datos y sin
+        confirmar: quien llama decide cuándo hacer commit (p. ej. junto con el
+        estado de los rebotes, en una sola transacción)
+
+        Returns:
+            Direcciones procesadas
+        """
+        now = time.time()
+        rows = ((_key(email), reason, source, now) for email in emails if email and email.strip())
+        cursor = conn.executemany(
+            "INSERT INTO suppressed (email, reason, source, added) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(email) DO UPDATE SET reason = excluded.reason,"
+            " source = excluded.source, added = excluded.added", rows)
+        return cursor.rowcount
+
+    def remove(self, email: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM suppressed WHERE email = ?", (_key(email),))
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def import_csv(self, file_path: str, reason: str = REASON_UNSUBSCRIBE) -> int:
+        """
+        Importa direcciones de un CSV (columna "email", o la primera si no hay cabecera)
+
+        Returns:
+            Direcciones importadas
+        """
+        def emails() -> Iterator[str]:
+            with open(file_path, 'r', encoding='utf-8-sig') as f:
+                reader = csv.reader(f)
+                header = next(reader, None)
+                if header is None:
+                    return
+                column = 0
+                normalized = [name.strip().lower() for name in header]
+                if 'email' in normalized:
+                    column = normalized.index('email')
+                elif '@' in header[0]:
+                    yield header[0]
+                for row in reader:
+                    if len(row) > column:
+                        yield row[column]
+
+        return self.add_many(emails(), reason, source=file_path)
+
+    def __contains__(self, email: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM suppressed WHERE email = ?", (_key(email),)).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM suppressed").fetchone()[0]
+
+    def reason(self, email: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT reason FROM suppressed WHERE email = ?", (_key(email),)).fetchone()
+        return row[0] if row else None
+
+    def suppressed_among(self, emails: List[str]) -> Set[str]:
+        """Claves normalizadas de las direcciones de emails que están suprimidas"""
+        return self._lookup({_key(email) for email in emails})
+
+    def _lookup(self, keys: Set[str]) -> Set[str]:
+        keys = list(keys)
+        found: Set[str] = set()
+        with self._lock:
+            for start in range(0, len(keys), CHUNK_SIZE):
+                chunk = keys[start:start + CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                found.update(row[0] for row in self._conn.execute(
+                    f"SELECT email FROM suppressed WHERE email IN ({placeholders})", chunk))
+        return found
+
+    def filter_contacts(self, contacts: Iterable[Dict[str, str]],
+                        on_suppressed: Optional[Callable[[Dict[str, str]], None]] = None,
+                        chunk_size: int = CHUNK_SIZE) -> Iterator[Dict[str, str]]:
+        """
+        Filtra en streaming los contactos suprimidos
+
+        Los contactos se comprueban por bloques de chunk_size con una sola
+        consulta por bloque; solo un bloque está en memoria a la vez.
+
+        Args:
+            contacts: Contactos de la campaña
+            on_suppressed: Función llamada con cada contacto excluido
+        """
+        iterator = iter(contacts)
+        while True:
+            block: List[Dict[str, str]] = []
+            for contact in iterator:
+                block.append(contact)
+                if len(block) >= chunk_size:
+                    break
+            if not block:
+                return
+            keys = [_key(contact['email']) for contact in block]
+            suppressed = self._lookup(set(keys))
+            for contact, key in zip(block, keys):
+                if suppressed and key in suppressed:
+                    if on_suppressed is not None:
+                        on_suppressed(contact)
+                    continue
+                yield contact
+
+    def entries(self) -> Iterator[Tuple[str, str, str, float]]:
+        """Recorre la lista (email, motivo, origen, fecha de alta)"""
+        return iter(self._conn.execute(
+            "SELECT email, reason, source, added FROM suppressed ORDER BY email"))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    """Gestión de la lista de supresión desde la línea de comandos"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lista de supresión de Tavolo Casa")
+    parser.add_argument('--db', default='suppression.sqlite', help="Archivo de la lista de supresión")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help="Añadir direcciones")
+    add.add_argument('emails', nargs='+')
+    add.add_argument('--reason', default=REASON_UNSUBSCRIBE,
+                     choices=[REASON_UNSUBSCRIBE, REASON_BOUNCE, REASON_COMPLAINT, REASON_MANUAL])
+
+    load = commands.add_parser('import', help="Importar direcciones desde un CSV")
+    load.add_argument('csv_file')
+    load.add_argument('--reason', default=REASON_UNSUBSCRIBE,
+                      choices=[REASON_UNSUBSCRIBE, REASON_BOUNCE, REASON_COMPLAINT, REASON_MANUAL])
+
+    remove = commands.add_parser('remove', help="Quitar direcciones de la lista")
+    remove.add_argument('emails', nargs='+')
+
+    check = commands.add_parser('check', help="Comprobar si una dirección está suprimida")
+    check.add_argument('emails', nargs='+')
+
+    commands.add_parser('count', help="Número de direcciones suprimidas")
+    commands.add_parser('export', help="Volcar la lista en CSV por la salida estándar")
+
+    args = parser.parse_args(argv)
+    with SuppressionList(args.db) as suppression:
+        if args.command == 'add':
+            suppression.add_many(args.emails, args.reason, source='cli')
+            print(f"✅ {len(args.emails)} direcciones añadidas ({args.reason})")
+        elif args.command == 'import':
+            count = suppression.import_csv(args.csv_file, args.reason)
+            print(f"✅ {count} direcciones importadas desde {args.csv_file} ({args.reason})")
+        elif args.command == 'remove':
+            removed = sum(suppression.remove(email) for email in args.emails)
+            print(f"✅ {removed} direcciones quitadas de la lista")
+        elif args.command == 'check':
+            for email in args.emails:
+                reason = suppression.reason(email)
+                print(f"❌ {email}: suprimida ({reason})" if reason else f"✅ {email}: no suprimida")
+        elif args.command == 'count':
+            print(f"📊 {len(suppression)} direcciones suprimidas")
+        elif args.command == 'export':
+            writer = csv.writer(sys.stdout)
+            writer.writerow(['email', 'reason', 'source', 'added'])
+            for row in suppression.entries():
+                writer.writerow(row)
+
+
+if __name__ == "__main__":
+    main()
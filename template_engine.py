@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Motor de plantillas compiladas para el sistema de correos Tavolo Casa
+La plantilla se analiza una sola vez y cada contacto se renderiza con un único join
+"""
+
+import logging
+import re
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+PLACEHOLDER_PATTERN = re.compile(r'\{\{([^{}]*)\}\}')
+
+# Variables que dependen del contacto
+CONTACT_VARIABLES: Dict[str, Callable[[Dict[str, str]], str]] = {
+    'NOMBRE': lambda c: c.get('nombre', 'Estimado/a cliente'),
+    'APELLIDO': lambda c: c.get('apellido', ''),
+    'EMPRESA': lambda c: c.get('empresa', ''),
+    'NOMBRE_COMPLETO': lambda c: f"{c.get('nombre', '')} {c.get('apellido', '')}".strip(),
+}
+
+# Variables constantes durante toda la campaña
+CAMPAIGN_VARIABLES = ('FECHA', 'AÑO')
+
+KNOWN_PLACEHOLDERS = tuple(CONTACT_VARIABLES) + CAMPAIGN_VARIABLES
+
+
+def campaign_variables(now: Optional[datetime] = None) -> Dict[str, str]:
+    """Calcula una sola vez por campaña las variables que no dependen del contacto"""
+    now = now or datetime.now()
+    return {
+        'FECHA': now.strftime('%d de %B de %Y'),
+        'AÑO': str(now.year),
+    }
+
+
+class CompiledTemplate:
+    """
+    Plantilla compilada: segmentos literales intercalados con huecos
+
+    Los marcadores desconocidos se dejan tal cual en el texto (igual que hacía
+    str.replace) y se informan al compilar.
+    """
+
+    def __init__(self, parts: List[str], slots: List[Tuple[int, str]],
+                 unknown: Optional[List[str]] = None):
+        """
+        Args:
+            parts: Segmentos del texto; los huecos ocupan una posición vacía
+            slots: Pares (posición en parts, nombre de la variable)
+            unknown: Marcadores no reconocidos encontrados al compilar
+        """
+        self._parts = parts
+        self._slots = slots
+        self.unknown = unknown or []
+
+    @classmethod
+    def compile(cls, text: str, name: str = "plantilla", warn: bool = True) -> "CompiledTemplate":
+        """
+        Analiza la plantilla y separa literales y marcadores {{...}}
+
+        Args:
+            text: Contenido de la plantilla
+            name: Nombre usado en los avisos (normalmente la ruta del archivo)
+            warn: Avisar de los marcadores desconocidos
+        """
+        parts: List[str] = []
+        slots: List[Tuple[int, str]] = []
+        unknown: List[str] = []
+        literal: List[str] = []
+        position = 0
+
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            literal.append(text[position:match.start()])
+            position = match.end()
+            variable = match.group(1)
+            if variable in KNOWN_PLACEHOLDERS:
+                parts.append(''.join(literal))
+                literal = []
+                slots.append((len(parts), variable))
+                parts.append('')
+            else:
+                # Se conserva como texto literal
+                literal.append(match.group(0))
+                unknown.append(variable)
+        literal.append(text[position:])
+        parts.append(''.join(literal))
+
+        if unknown and warn:
+            import difflib  # solo hace falta para sugerir un marcador parecido
+        for variable in dict.fromkeys(unknown if warn else []):
+            suggestion = difflib.get_close_matches(variable.strip(), KNOWN_PLACEHOLDERS, n=1)
+            hint = f" (¿quisiste decir {{{{{suggestion[0]}}}}}?)" if suggestion else ""
+            logging.warning(f"Marcador desconocido {{{{{variable}}}}} en {name}{hint}")
+
+        return cls(parts, slots, unknown)
+
+    @property
+    def placeholders(self) -> List[str]:
+        """Variables que aún quedan por rellenar"""
+        return [variable for _, variable in self._slots]
+
+    def bind(self, constants: Dict[str, str]) -> "CompiledTemplate":
+        """
+        Fija las variables constantes de la campaña
+
+        Devuelve una nueva plantilla en la que esos huecos se han fusionado con
+        los literales vecinos, de modo que por contacto solo quedan los suyos.
+        """
+        parts: List[str] = []
+        slots: List[Tuple[int, str]] = []
+        literal: List[str] = []
+        slot_map = dict(self._slots)
+
+        for position, part in enumerate(self._parts):
+            variable = slot_map.get(position)
+            if variable is None:
+                literal.append(part)
+            elif variable in constants:
+                literal.append(constants[variable])
+            else:
+                parts.append(''.join(literal))
+                literal = []
+                slots.append((len(parts), variable))
+                parts.append('')
+        parts.append(''.join(literal))
+
+        return CompiledTemplate(parts, slots, self.unknown)
+
+    def values(self, contact: Dict[str, str]) -> Tuple[str, ...]:
+        """
+        Valores de los huecos para un contacto (plantilla ya fijada con bind())
+
+        Dos contactos con los mismos valores producen el mismo texto, así que
+        la tupla sirve como clave de caché del render.
+        """
+        return tuple(CONTACT_VARIABLES[variable](contact) for _, variable in self._slots)
+
+    def fill(self, values: Tuple[str, ...]) -> str:
+        """Renderiza con los valores calculados por values()"""
+        parts = self._parts[:]
+        for (position, _), value in zip(self._slots, values):
+            parts[position] = value
+        return ''.join(parts)
+
+    def render(self, contact: Dict[str, str], constants: Optional[Dict[str, str]] = None) -> str:
+        """
+        Renderiza la plantilla para un contacto
+
+        Args:
+            contact: Datos del contacto
+            constants: Variables de campaña aún no fijadas con bind()
+        """
+        parts = self._parts[:]
+        for position, variable in self._slots:
+            getter = CONTACT_VARIABLES.get(variable)
+            if getter is not None:
+                parts[position] = getter(contact)
+            elif constants is not None:
+                parts[position] = constants[variable]
+            else:
+                parts[position] = campaign_variables()[variable]
+        return ''.join(parts)
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Registro de plantillas y variantes para el sistema de correos Tavolo Casa
+Cada plantilla se compila una sola vez, se recarga solo si cambia en disco y
+los renders de contactos con las mismas variables se reutilizan
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from html_text import html_to_text
+from inline_images import InlineImage, InlineImageStore
+from template_engine import CompiledTemplate, campaign_variables
+
+DEFAULT_VARIANT = 'principal'
+
+# Prefijo de los histogramas por variante en MetricsRegistry
+VARIANT_STAGE_PREFIX = 'variante:'
+
+CONTACT_COLUMNS = ('email', 'nombre', 'apellido', 'empresa')
+
+
+class _RenderCache:
+    """
+    Renders de una plantilla por tupla de valores, con expulsión LRU
+
+    Acotada en número de renders y en bytes: cuando se supera cualquiera de
+    los dos límites se descartan los renders usados hace más tiempo.
+    """
+
+    def __init__(self, max_entries: int = 0, max_bytes: int = 0):
+        """
+        Args:
+            max_entries: Renders guardados como máximo (0 = sin caché)
+            max_bytes: Tamaño máximo en bytes (UTF-8) de los renders guardados
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._items: "OrderedDict[Tuple[str, ...], Tuple[str, int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Tuple[str, ...]) -> Optional[str]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        self._items.move_to_end(key)
+        return item[0]
+
+    def put(self, key: Tuple[str, ...], rendered: str):
+        size = len(rendered) if rendered.isascii() else len(rendered.encode('utf-8'))
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        previous = self._items.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous[1]
+        self._items[key] = (rendered, size)
+        self.bytes += size
+        while len(self._items) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted) = self._items.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+
+class _Entry:
+    """Estado de una plantilla registrada"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.signature: Optional[Tuple[int, int]] = None
+        self.checked = 0.0
+        self.source = ''
+        self.images: Tuple[InlineImage, ...] = ()
+        self.compiled: Optional[CompiledTemplate] = None
+        self.bound: Optional[CompiledTemplate] = None
+        self.cache = _RenderCache()
+        # Alternativa de texto plano: se compila la primera vez que se pide
+        self.text_compiled: Optional[CompiledTemplate] = None
+        self.text_bound: Optional[CompiledTemplate] = None
+        self.text_cache = _RenderCache()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+
+class TemplateRegistry:
+    """
+    Plantillas compiladas por ruta, compartidas por todos los hilos
+
+    Cada plantilla se lee y compila la primera vez que se pide. Después solo
+    se comprueba su fecha de modificación (como mucho cada check_interval
+    segundos) y se recompila si ha cambiado, también en mitad de una campaña.
+    Los renders se guardan por tupla de valores de las variables: los
+    contactos con los mismos datos (p. ej. una plantilla que solo usa
+    {{EMPRESA}}) reutilizan el mismo texto.
+
+    La versión en texto plano de cada plantilla (html_text.html_to_text) se
+    convierte una sola vez y se compila con los mismos huecos que el HTML.
+    Con un InlineImageStore, las imágenes <img src> se incrustan como partes
+    cid: al compilar.
+    """
+
+    def __init__(self, check_interval: float = 2.0, cache_size: int = 10000,
+                 images: Optional[InlineImageStore] = None, cache_mb: float = 64):
+        """
+        Args:
+            check_interval: Segundos entre comprobaciones de cambios en disco
+                (0 = en cada render; negativo = sin recarga)
+            cache_size: Renders guardados como máximo por plantilla (0 = sin caché)
+            images: Almacén de imágenes incrustadas (None = dejar las referencias)
+            cache_mb: Tamaño máximo de los renders guardados por plantilla; al
+                superarlo (o cache_size) se descartan los usados hace más tiempo
+        """
+        self.check_interval = check_interval
+        self.cache_size = cache_size
+        self.cache_bytes = int(cache_mb * 1024 * 1024)
+        self.images = images
+        self._constants: Dict[str, str] = campaign_variables()
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: Dict) -> "TemplateRegistry":
+        return cls(check_interval=settings.get('template_reload_interval', 2.0),
+                   cache_size=settings.get('template_cache_size', 10000),
+                   images=InlineImageStore.from_settings(settings),
+                   cache_mb=settings.get('template_cache_mb', 64))
+
+    def set_constants(self, constants: Dict[str, str]):
+        """Fija las variables de campaña ({{FECHA}}, {{AÑO}}) para los próximos renders"""
+        with self._lock:
+            if constants == self._constants:
+                return
+            self._constants = dict(constants)
+            for entry in self._entries.values():
+                if entry.compiled is not None:
+                    entry.bound = entry.compiled.bind(self._constants)
+                if entry.text_compiled is not None:
+                    entry.text_bound = entry.text_compiled.bind(self._constants)
+                entry.cache = self._new_cache()
+                entry.text_cache = self._new_cache()
+
+    def get(self, path: str) -> CompiledTemplate:
+        """Plantilla compilada y con las variables de campaña fijadas"""
+        with self._lock:
+            return self._entry(path).bound
+
+    def render(self, path: str, contact: Dict[str, str]) -> str:
+        """Renderiza la plantilla de path para un contacto, reutilizando renders idénticos"""
+        return self.render_parts(path, contact)[0]
+
+    def render_text(self, path: str, contact: Dict[str, str]) -> str:
+        """Renderiza la alternativa de texto plano de la plantilla de path"""
+        return self.render_parts(path, contact, text=True)[1]
+
+    def render_parts(self, path: str, contact: Dict[str, str], text: bool = False
+                     ) -> Tuple[str, Optional[str], Tuple[InlineImage, ...]]:
+        """
+        HTML, texto plano (si text) e imágenes incrustadas de un contacto
+
+        Las tres piezas salen de la misma versión de la plantilla aunque se
+        recargue en mitad de la campaña: los cid: del HTML siempre coinciden
+        con las imágenes devueltas.
+        """
+        with self._lock:
+            entry = self._entry(path)
+            templates = [(entry.bound, entry.cache)]
+            if text:
+                if entry.text_bound is None:
+                    entry.text_compiled = CompiledTemplate.compile(
+                        html_to_text(entry.source), f"{path} (texto)", warn=False)
+                    entry.text_bound = entry.text_compiled.bind(self._constants)
+                templates.append((entry.text_bound, entry.text_cache))
+            pending = []
+            for template, cache in templates:
+                values = template.values(contact)
+                rendered = cache.get(values)
+                if rendered is None:
+                    entry.misses += 1
+                else:
+                    entry.hits += 1
+                pending.append((template, cache, values, rendered))
+            images = entry.images
+
+        results = []
+        for template, cache, values, rendered in pending:
+            if rendered is None:
+                rendered = template.fill(values)
+                # Si la plantilla se ha recargado entretanto, cache ya es una caché descartada
+                with self._lock:
+                    cache.put(values, rendered)
+            results.append(rendered)
+        return results[0], results[1] if text else None, images
+
+    def _new_cache(self) -> _RenderCache:
+        return _RenderCache(self.cache_size, self.cache_bytes)
+
+    def _entry(self, path: str) -> _Entry:
+        """Entrada de path, compilada y al día (con el lock tomado)"""
+        entry = self._entries.get(path)
+        if entry is None:
+            entry = self._entries[path] = _Entry(path)
+        self._refresh(entry)
+        return entry
+
+    def _refresh(self, entry: _Entry):
+        """Compila la plantilla la primera vez y cuando cambia en disco (con el lock tomado)"""
+        now = time.monotonic()
+        if entry.compiled is not None and (
+                self.check_interval < 0 or now - entry.checked < self.check_interval):
+            return
+        entry.checked = now
+        stat = os.stat(entry.path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == entry.signature:
+            return
+        with open(entry.path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        if entry.compiled is not None:
+            entry.reloads += 1
+            logging.info(f"Plantilla {entry.path} modificada en disco: recompilada")
+        entry.signature = signature
+        entry.source = text
+        if self.images is not None:
+            text, entry.images = self.images.embed(
+                text, os.path.dirname(os.path.abspath(entry.path)))
+        entry.compiled = CompiledTemplate.compile(text, entry.path)
+        entry.bound = entry.compiled.bind(self._constants)
+        entry.cache = self._new_cache()
+        entry.text_compiled = entry.text_bound = None
+        entry.text_cache = self._new_cache()
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Aciertos, fallos, expulsiones y recargas de cada plantilla"""
+        with self._lock:
+            return {path: {'hits': entry.hits, 'misses': entry.misses, 'reloads': entry.reloads,
+                           'evictions': entry.cache.evictions + entry.text_cache.evictions}
+                    for path, entry in self._entries.items()}
+
+
+class Variant(NamedTuple):
+    """Variante de una campaña: plantilla y asunto"""
+    name: str
+    template_file: str
+    subject: str
+
+
+class VariantSelector:
+    """
+    Asigna a cada contacto una variante de la campaña
+
+    Por orden: la columna del CSV indicada en column (si su valor es una
+    variante conocida), la primera regla que coincida y, por último, un
+    reparto A/B por pesos según un hash estable de la dirección. Sin nada de
+    eso todos los contactos reciben la variante principal (la plantilla y el
+    asunto de la línea de comandos).
+    """
+
+    def __init__(self, variants: Dict[str, Variant], column: Optional[str] = None,
+                 rules: Optional[List[Tuple[str, "re.Pattern", str]]] = None,
+                 split: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            variants: Variantes por nombre (incluida DEFAULT_VARIANT)
+            column: Columna del CSV con el nombre de la variante de cada contacto
+            rules: Tuplas (campo, expresión regular, variante)
+            split: Pesos del reparto A/B por variante
+        """
+        self.variants = variants
+        self.column = column
+        self.rules = rules or []
+        self._split: List[Tuple[int, Variant]] = []
+        if split:
+            total = sum(split.values())
+            cumulative = 0.0
+            for name, weight in split.items():
+                cumulative += weight / total
+                self._split.append((int(cumulative * 10000), variants[name]))
+
+    @classmethod
+    def from_settings(cls, settings: Dict, template_file: str, subject: str) -> "VariantSelector":
+        """
+        Variantes definidas en email_settings.template_variants
+
+        La variante principal usa template_file y subject; las demás pueden
+        omitir "subject" para usar el mismo asunto.
+        """
+        config = settings.get('template_variants') or {}
+        variants = {DEFAULT_VARIANT: Variant(DEFAULT_VARIANT, template_file, subject)}
+        for name, variant in (config.get('variants') or {}).items():
+            variants[name] = Variant(name, variant.get('template', template_file),
+                                     variant.get('subject', subject))
+
+        rules = []
+        for rule in config.get('rules') or []:
+            if rule['variant'] not in variants:
+                raise ValueError(f"La regla sobre {rule['field']} usa la variante desconocida "
+                                 f"{rule['variant']}")
+            rules.append((rule['field'], re.compile(rule['match']), rule['variant']))
+
+        split = config.get('split')
+        if split:
+            unknown = [name for name in split if name not in variants]
+            if unknown:
+                raise ValueError(f"Variantes desconocidas en split: {', '.join(unknown)}")
+        return cls(variants, config.get('column'), rules, split)
+
+    @property
+    def multiple(self) -> bool:
+        return len(self.variants) > 1
+
+    @property
+    def extra_fields(self) -> List[str]:
+        """Columnas del CSV que hay que conservar en cada contacto para elegir la variante"""
+        fields = [self.column] if self.column else []
+        fields += [field for field, _, _ in self.rules]
+        return [field for field in dict.fromkeys(fields)
+                if field not in CONTACT_COLUMNS and field != 'dominio']
+
+    def choose(self, contact: Dict[str, str]) -> Variant:
+        if self.column:
+            variant = self.variants.get((contact.get(self.column) or '').strip())
+            if variant is not None:
+                return variant
+        for field, pattern, name in self.rules:
+            value = (contact['email'].rpartition('@')[2].lower() if field == 'dominio'
+                     else contact.get(field) or '')
+            if pattern.search(value):
+                return self.variants[name]
+        if self._split:
+            point = zlib.crc32(contact['email'].strip().lower().encode('utf-8')) % 10000
+            for limit, variant in self._split:
+                if point < limit:
+                    return variant
+            return self._split[-1][1]
+        return self.variants[DEFAULT_VARIANT]
+
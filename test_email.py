@@ -41,15 +41,15 @@ def send_test_email():
             'empresa': 'Empresa Test'
         }
         
-        # Cargar plantilla
-        template = sender.load_template('plantilla_correo.html')
-        
-        # Personalizar correo
-        personalized_html = sender.personalize_email(template, test_contact)
+        # Personalizar correo (con su alternativa en texto plano y las imágenes incrustadas)
+        plain_text = sender.config.get('email_settings', {}).get('plain_text_alternative', True)
+        personalized_html, personalized_text, images = sender.templates.render_parts(
+            'plantilla_correo.html', test_contact, text=plain_text)
         
         # Crear mensaje
         subject = "🧪 Correo de Prueba - Tavolo Casa"
-        message = sender.create_message(test_email, subject, personalized_html)
+        message = sender.create_message(test_email, subject, personalized_html,
+                                        text_content=personalized_text, inline_images=images)
         
         # Enviar
         print(f"📤 Enviando correo de prueba a {test_email}...")
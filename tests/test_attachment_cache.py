@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la caché de adjuntos
+La codificación por bloques desde mmap da el mismo base64 que MIMEBase +
+encoders.encode_base64, y las entradas se invalidan si el archivo cambia
+"""
+
+import base64
+import os
+import sys
+import tempfile
+import unittest
+from email import encoders
+from email.mime.base import MIMEBase
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import attachment_cache  # noqa: E402
+from attachment_cache import AttachmentCache, build_attachment_part  # noqa: E402
+
+
+class AttachmentCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        self.path = os.path.join(self.workdir.name, 'catalogo.pdf')
+
+    def write(self, data: bytes):
+        Path(self.path).write_bytes(data)
+
+    def test_mmap_chunks_match_encodebytes(self):
+        chunk = attachment_cache._ENCODE_CHUNK
+        for size in (0, 1, 56, 57, 58, chunk - 1, chunk, chunk + 1, 2 * chunk + 100):
+            with self.subTest(size=size):
+                data = os.urandom(size)
+                self.write(data)
+                part = build_attachment_part(self.path, mmap_threshold=1)
+                self.assertEqual(part.get_payload(), base64.encodebytes(data).decode('ascii'))
+
+    def test_same_part_as_encode_base64(self):
+        data = os.urandom(100000)
+        self.write(data)
+        expected = MIMEBase('application', 'octet-stream')
+        expected.set_payload(data)
+        encoders.encode_base64(expected)
+        for threshold in (1, 1 << 30):
+            part = build_attachment_part(self.path, mmap_threshold=threshold)
+            self.assertEqual(part.get_payload(), expected.get_payload())
+
+    def test_cache_hit_and_invalidation(self):
+        cache = AttachmentCache(mmap_threshold=1)
+        self.write(b'version 1')
+        first = cache.get_part(self.path)
+        self.assertIs(cache.get_part(self.path), first)
+        self.write(b'version 2, mas larga')
+        self.assertEqual(base64.b64decode(cache.get_part(self.path).get_payload()), b'version 2, mas larga')
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertIsNone(cache.get_part(os.path.join(self.workdir.name, 'no_existe.pdf')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Pruebas del procesado de rebotes
+Avisos DSN, quejas ARF y avisos de no entrega sin formato estándar (qmail,
+Exim), clasificación de los códigos y ventana de los rebotes blandos
+"""
+
+import mailbox
+import os
+import sys
+import tempfile
+import unittest
+from email.message import EmailMessage, Message
+from email.mime.base import MIMEBase
+from email.mime.message import MIMEMessage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.parser import HeaderParser
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bounce_processor import (KIND_COMPLAINT, KIND_HARD, KIND_SOFT,  # noqa: E402
+                              BounceProcessor, classify, parse_bounces)
+from suppression import REASON_BOUNCE, REASON_COMPLAINT, SuppressionList  # noqa: E402
+
+SENDER = 'info@tavolocasa.com'
+
+
+def dsn(recipient: str, status: str, action: str = 'failed', diagnostic: str = '',
+        date: str = 'Mon, 05 Oct 2026 10:00:00 +0000', message_id: str = '') -> Message:
+    """Aviso de no entrega en formato DSN (RFC 3464)"""
+    message = MIMEMultipart('report', report_type='delivery-status')
+    message['From'] = 'MAILER-DAEMON@mx.example.com'
+    message['To'] = SENDER
+    message['Subject'] = 'Delivery Status Notification (Failure)'
+    message['Date'] = date
+    message['Message-ID'] = message_id or f'<{recipient}.{status}.{date}@mx.example.com>'
+    message.attach(MIMEText(f'No se pudo entregar el mensaje a {recipient}'))
+    report = MIMEBase('message', 'delivery-status')
+    fields = f"Final-Recipient: rfc822; {recipient}\nAction: {action}\nStatus: {status}\n"
+    if diagnostic:
+        fields += f"Diagnostic-Code: smtp; {diagnostic}\n"
+    report.set_payload([HeaderParser().parsestr("Reporting-MTA: dns; mx.example.com\n"),
+                        HeaderParser().parsestr(fields)])
+    message.attach(report)
+    original = MIMEText('Hola')
+    original['From'] = SENDER
+    original['To'] = recipient
+    message.attach(MIMEMessage(original))
+    return message
+
+
+def arf(recipient: str) -> Message:
+    """Queja de un proveedor en formato ARF (RFC 5965)"""
+    message = MIMEMultipart('report', report_type='feedback-report')
+    message['From'] = 'staff@hotmail.com'
+    message['Message-ID'] = f'<arf.{recipient}@hotmail.com>'
+    message.attach(MIMEText('This is an email abuse report'))
+    report = MIMEBase('message', 'feedback-report')
+    report.set_payload('Feedback-Type: abuse\nUser-Agent: Hotmail FBL\nVersion: 1\n')
+    message.attach(report)
+    headers = MIMEBase('text', 'rfc822-headers')
+    headers.set_payload(f'From: {SENDER}\nTo: Cliente <{recipient}>\nSubject: Ofertas\n')
+    message.attach(headers)
+    return message
+
+
+def ndr(body: str, subject: str = 'failure notice', failed: str = '') -> Message:
+    """Aviso de no entrega en texto libre, como los de qmail o Exim"""
+    message = EmailMessage()
+    message['From'] = 'MAILER-DAEMON@mx.example.com'
+    message['To'] = SENDER
+    message['Subject'] = subject
+    message['Message-ID'] = f'<ndr.{abs(hash(body))}@mx.example.com>'
+    if failed:
+        message['X-Failed-Recipients'] = failed
+    message.set_content(body)
+    return message
+
+
+QMAIL = """Hi. This is the qmail-send program at mx.example.com.
+I'm afraid I wasn't able to deliver your message to the following addresses.
+
+<Gone@Example.com>:
+192.0.2.1 does not like recipient.
+Remote host said: 550 sorry, no mailbox here by that name
+Giving up on 192.0.2.1.
+
+--- Below this line is a copy of the message.
+"""
+
+
+class ClassifyTest(unittest.TestCase):
+
+    def test_enhanced_status(self):
+        self.assertEqual(classify('5.1.1', 'failed'), KIND_HARD)
+        self.assertEqual(classify('4.4.1', 'failed'), KIND_SOFT)
+        # Buzón lleno y rechazos por política no indican que la dirección no exista
+        self.assertEqual(classify('5.2.2', 'failed'), KIND_SOFT)
+        self.assertEqual(classify('5.7.1', 'failed'), KIND_SOFT)
+        self.assertIsNone(classify('2.0.0', 'delivered'))
+
+    def test_smtp_reply_code(self):
+        self.assertEqual(classify('550'), KIND_HARD)
+        self.assertEqual(classify('552'), KIND_SOFT)
+        self.assertEqual(classify('451'), KIND_SOFT)
+
+    def test_delayed_is_not_a_failure(self):
+        self.assertIsNone(classify('4.4.7', 'delayed'))
+        self.assertIsNone(classify('', 'Delayed'))
+
+    def test_unknown_status(self):
+        # Un DSN con Action failed es definitivo aunque no traiga código
+        self.assertEqual(classify('', 'failed'), KIND_HARD)
+        # Un aviso que no es DSN y no trae código no se da por definitivo
+        self.assertEqual(classify(''), KIND_SOFT)
+
+
+class ParseBouncesTest(unittest.TestCase):
+
+    def test_dsn(self):
+        [bounce] = parse_bounces(dsn('Ana@Example.com', '5.1.1', diagnostic='550 5.1.1 user unknown'))
+        self.assertEqual((bounce.email, bounce.kind, bounce.status), ('ana@example.com', KIND_HARD, '5.1.1'))
+        self.assertIn('user unknown', bounce.diagnostic)
+
+    def test_dsn_status_from_diagnostic(self):
+        [bounce] = parse_bounces(dsn('ana@example.com', '', diagnostic='452 mailbox full'))
+        self.assertEqual((bounce.kind, bounce.status), (KIND_SOFT, '452'))
+
+    def test_dsn_delayed_and_delivered_are_ignored(self):
+        self.assertEqual(parse_bounces(dsn('ana@example.com', '4.4.7', action='delayed')), [])
+        self.assertEqual(parse_bounces(dsn('ana@example.com', '2.0.0', action='delivered')), [])
+
+    def test_arf_complaint(self):
+        [bounce] = parse_bounces(arf('enfadado@hotmail.com'))
+        self.assertEqual((bounce.email, bounce.kind, bounce.diagnostic),
+                         ('enfadado@hotmail.com', KIND_COMPLAINT, 'abuse'))
+
+    def test_qmail(self):
+        [bounce] = parse_bounces(ndr(QMAIL), ignore=[SENDER])
+        self.assertEqual((bounce.email, bounce.kind, bounce.status), ('gone@example.com', KIND_HARD, '550'))
+
+    def test_exim_failed_recipients(self):
+        body = ("This message was created automatically by mail delivery software.\n\n"
+                "  lleno@example.com\n    host mx.example.com [192.0.2.1]: 452 mailbox full\n")
+        [bounce] = parse_bounces(ndr(body, 'Mail delivery failed: returning message to sender',
+                                     failed='lleno@example.com'))
+        self.assertEqual((bounce.email, bounce.kind, bounce.status), ('lleno@example.com', KIND_SOFT, '452'))
+
+    def test_numbers_in_free_text_are_not_reply_codes(self):
+        body = ("No se pudo entregar el mensaje a pedro@example.com.\n"
+                "Para cualquier duda llame al 555 1234 o escriba a pedro@example.com\n")
+        [bounce] = parse_bounces(ndr(body, 'Error de entrega', failed='pedro@example.com'))
+        # Sin código de respuesta real el aviso no se toma por definitivo
+        self.assertEqual((bounce.kind, bounce.status), (KIND_SOFT, ''))
+
+    def test_ordinary_message_is_not_a_bounce(self):
+        message = EmailMessage()
+        message['From'] = 'cliente@example.com'
+        message['Subject'] = 'Re: Ofertas'
+        message.set_content('Me interesa, llamadme al 555 1234. cliente@example.com')
+        self.assertEqual(parse_bounces(message), [])
+
+
+class BounceProcessorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        self.mailbox_path = os.path.join(self.workdir.name, 'rebotes.mbox')
+        self.suppression = SuppressionList(os.path.join(self.workdir.name, 'suppression.sqlite'))
+        self.processor = BounceProcessor(self.suppression, self.mailbox_path, 'mbox',
+                                         soft_limit=3, soft_days=30, ignore=[SENDER])
+        self.addCleanup(self.processor.close)
+
+    def deliver(self, *messages: Message):
+        box = mailbox.mbox(self.mailbox_path)
+        for message in messages:
+            box.add(message)
+        box.close()
+
+    def test_hard_bounces_and_complaints_are_suppressed(self):
+        self.deliver(dsn('hard@example.com', '5.1.1'), arf('queja@hotmail.com'), ndr(QMAIL),
+                     dsn('retraso@example.com', '4.4.7', action='delayed'))
+        report = self.processor.process()
+        self.assertEqual((report.messages, report.hard, report.soft, report.complaints, report.suppressed),
+                         (4, 2, 0, 1, 3))
+        self.assertEqual(self.suppression.reason('hard@example.com'), REASON_BOUNCE)
+        self.assertEqual(self.suppression.reason('gone@example.com'), REASON_BOUNCE)
+        self.assertEqual(self.suppression.reason('queja@hotmail.com'), REASON_COMPLAINT)
+        self.assertNotIn('retraso@example.com', self.suppression)
+
+    def test_messages_are_processed_once(self):
+        self.deliver(dsn('hard@example.com', '5.1.1'))
+        self.processor.process()
+        report = self.processor.process()
+        self.assertEqual((report.messages, report.skipped, report.hard), (1, 1, 0))
+        self.assertEqual(self.processor.status('hard@example.com')[1], 1)
+
+    def test_soft_bounces_within_window_are_suppressed(self):
+        self.deliver(*(dsn('lleno@example.com', '4.2.2', date=f'{day:02d} Oct 2026 10:00:00 +0000')
+                       for day in (1, 10, 20)))
+        report = self.processor.process()
+        self.assertEqual((report.soft, report.suppressed), (3, 1))
+        self.assertEqual(self.suppression.reason('lleno@example.com'), REASON_BOUNCE)
+
+    def test_spaced_soft_bounces_do_not_chain(self):
+        # Cada aviso está a menos de 30 días del anterior, pero nunca hay 3 en 30 días
+        dates = ('01 Jun 2026', '21 Jun 2026', '11 Jul 2026', '31 Jul 2026', '20 Aug 2026')
+        self.deliver(*(dsn('lleno@example.com', '4.2.2', date=f'{date} 10:00:00 +0000') for date in dates))
+        report = self.processor.process()
+        self.assertEqual((report.soft, report.suppressed), (5, 0))
+        self.assertNotIn('lleno@example.com', self.suppression)
+        self.assertEqual(self.processor.status('lleno@example.com')[0], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Pruebas del planificador de campañas
+Franjas horarias (también las que cruzan la medianoche), cola persistente,
+cuotas diarias, reparto entre campañas y envío por tramos sin repetir
+destinatarios
+"""
+
+import csv
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from campaign_scheduler import (STATUS_DONE, STATUS_QUEUED, CampaignScheduler,  # noqa: E402
+                                JobQueue, SendWindow)
+from log_pipeline import configure_logging  # noqa: E402
+from smtp_sink import SMTPSink  # noqa: E402
+
+# Viernes 16 de octubre de 2026
+FRIDAY = datetime(2026, 10, 16, 10, 0)
+
+
+def setUpModule():
+    stderr, sys.stderr = sys.stderr, sys.__stderr__
+    try:
+        configure_logging({'file': os.path.join(tempfile.gettempdir(), 'test_campaign_scheduler.log'),
+                           'events_file': None})
+    finally:
+        sys.stderr = stderr
+
+
+def at(day: int, hour: int, minute: int = 0) -> datetime:
+    return datetime(2026, 10, day, hour, minute)
+
+
+class SendWindowTest(unittest.TestCase):
+
+    def test_daytime_window(self):
+        window = SendWindow.parse('09:00-18:30', 'lun-vie')
+        self.assertTrue(window.contains(at(16, 9)))
+        self.assertTrue(window.contains(at(16, 18, 29)))
+        self.assertFalse(window.contains(at(16, 18, 30)))
+        self.assertFalse(window.contains(at(16, 8, 59)))
+        self.assertFalse(window.contains(at(17, 10)))  # sábado
+        self.assertEqual(window.next_open(at(16, 8)), at(16, 9))
+        self.assertEqual(window.next_open(at(16, 10)), at(16, 10))
+        # Del viernes por la tarde al lunes por la mañana
+        self.assertEqual(window.next_open(at(16, 19)), at(19, 9))
+        self.assertEqual(str(window), '09:00-18:30 (lun,mar,mie,jue,vie)')
+
+    def test_overnight_window_belongs_to_its_first_day(self):
+        window = SendWindow.parse('22:00-06:00', 'vie')
+        self.assertTrue(window.contains(at(16, 23)))
+        self.assertTrue(window.contains(at(17, 5, 59)))  # madrugada del sábado
+        self.assertFalse(window.contains(at(17, 6)))
+        self.assertFalse(window.contains(at(16, 5)))  # madrugada del viernes: franja del jueves
+        self.assertFalse(window.contains(at(17, 23)))
+        self.assertEqual(window.next_open(at(17, 7)), at(23, 22))
+
+    def test_whole_day_and_day_ranges(self):
+        window = SendWindow.parse()
+        self.assertTrue(window.contains(at(17, 0)) and window.contains(at(18, 23, 59)))
+        self.assertEqual(SendWindow.parse('00:00-24:00', 'vie-lun').days, frozenset({4, 5, 6, 0}))
+        self.assertEqual(SendWindow.parse('00:00-24:00', 'Lun, miércoles, sábado').days, frozenset({0, 2, 5}))
+
+    def test_invalid_windows(self):
+        for window, days in (('09:00', ''), ('09:00-25:00', ''), ('09:00-18:00', 'lunes-xyz')):
+            with self.subTest(window=window, days=days), self.assertRaises(ValueError):
+                SendWindow.parse(window, days)
+
+
+class JobQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        self.path = os.path.join(self.workdir.name, 'campaigns.sqlite')
+
+    def test_add_and_persist(self):
+        with JobQueue(self.path) as queue:
+            job = queue.add('lista.csv', 'plantilla.html', 'Ofertas', ['catalogo.pdf'],
+                            window='09:00-18:00', days='lun-vie', daily_quota=100)
+            self.assertEqual(job.status, STATUS_QUEUED)
+            self.assertEqual(job.attachments, [os.path.abspath('catalogo.pdf')])
+            with self.assertRaises(ValueError):
+                queue.add('lista.csv', 'plantilla.html', 'Ofertas')
+            with self.assertRaises(ValueError):
+                queue.add('lista.csv', 'plantilla.html', 'Otra', window='mañana')
+            queue.add('lista.csv', 'plantilla.html', 'Otra')
+        with JobQueue(self.path) as queue:
+            self.assertEqual([job.subject for job in queue.jobs()], ['Ofertas', 'Otra'])
+            self.assertTrue(queue.set_status(job.id, STATUS_DONE))
+            self.assertEqual([job.subject for job in queue.jobs(STATUS_QUEUED)], ['Otra'])
+            self.assertEqual(queue.get(job.id).window, SendWindow.parse('09:00-18:00', 'lun-vie'))
+
+    def test_record_slice_and_daily_usage(self):
+        with JobQueue(self.path) as queue:
+            first = queue.add('a.csv', 'plantilla.html', 'A')
+            second = queue.add('b.csv', 'plantilla.html', 'B')
+            queue.record_slice(first.id, '2026-10-16', 40, 2, position=42, journal_offset=900, list_key='k')
+            queue.record_slice(first.id, '2026-10-16', 10, 0, position=52, journal_offset=1100, list_key='k')
+            queue.record_slice(second.id, '2026-10-16', 5, 0)
+            queue.record_slice(second.id, '2026-10-17', 7, 0)
+            self.assertEqual(queue.used('2026-10-16'), 57)
+            self.assertEqual(queue.used('2026-10-16', first.id), 52)
+            self.assertEqual(queue.used('2026-10-17'), 7)
+            job = queue.get(first.id)
+            self.assertEqual((job.sent, job.failed, job.position, job.journal_offset, job.list_key),
+                             (50, 2, 52, 1100, 'k'))
+
+    def test_queue_created_before_positions(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            "CREATE TABLE campaigns (id TEXT PRIMARY KEY, email_list_file TEXT NOT NULL,"
+            " template_file TEXT NOT NULL, subject TEXT NOT NULL, attachments TEXT NOT NULL DEFAULT '[]',"
+            " window TEXT NOT NULL, days TEXT NOT NULL DEFAULT '', not_before REAL NOT NULL DEFAULT 0,"
+            " daily_quota INTEGER, status TEXT NOT NULL, created REAL NOT NULL,"
+            " last_run REAL NOT NULL DEFAULT 0, sent INTEGER NOT NULL DEFAULT 0,"
+            " failed INTEGER NOT NULL DEFAULT 0, error TEXT)")
+        conn.execute("INSERT INTO campaigns (id, email_list_file, template_file, subject, window, status,"
+                     " created) VALUES ('antigua', 'a.csv', 'p.html', 'A', '00:00-24:00', 'queued', 1)")
+        conn.commit()
+        conn.close()
+        with JobQueue(self.path) as queue:
+            job = queue.get('antigua')
+            self.assertEqual((job.position, job.journal_offset, job.list_key), (0, 0, None))
+
+
+class CampaignSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        self.work = Path(self.workdir.name)
+        self.template = str(self.work / 'plantilla.html')
+        Path(self.template).write_text('<p>Hola {{NOMBRE}}</p>', encoding='utf-8')
+
+    def scheduler(self, port: int = 25, **scheduler) -> CampaignScheduler:
+        config_file = str(self.work / 'config.json')
+        with open(config_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'sender_email': 'info@tavolocasa.com', 'sender_name': 'Tavolo Casa',
+                'sender_password': '', 'smtp_server': '127.0.0.1', 'smtp_port': port,
+                'smtp_starttls': False,
+                'email_settings': {
+                    'journal_dir': str(self.work / 'journals'),
+                    'contact_store_dir': str(self.work / 'contactos'),
+                    'rate_limits': {},
+                    'scheduler': {'db': str(self.work / 'campaigns.sqlite'), 'delay_seconds': 0, **scheduler},
+                },
+                'logging': {'file': str(self.work / 'email_log.log'), 'events_file': None},
+            }, f)
+        scheduler = CampaignScheduler(config_file)
+        self.addCleanup(scheduler.close)
+        return scheduler
+
+    def write_list(self, name: str, count: int) -> str:
+        path = str(self.work / name)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['email', 'nombre'])
+            for i in range(count):
+                writer.writerow([f'{Path(name).stem}{i}@example.com', f'Cliente {i}'])
+        return path
+
+    def test_daily_quota_is_shared(self):
+        scheduler = self.scheduler(daily_quota=100, slice_size=60)
+        job = scheduler.queue.add('a.csv', self.template, 'A')
+        self.assertEqual(scheduler.next_slice(FRIDAY)[:2], (scheduler.queue.get(job.id), 60))
+        scheduler.queue.record_slice(job.id, '2026-10-16', 60, 0)
+        self.assertEqual(scheduler.next_slice(FRIDAY)[1], 40)
+        scheduler.queue.record_slice(job.id, '2026-10-16', 40, 0)
+        # Cuota agotada: hasta medianoche no hay nada que enviar
+        self.assertEqual(scheduler.next_slice(FRIDAY), (None, 0, 14 * 3600))
+        self.assertEqual(scheduler.next_slice(at(17, 0))[1], 60)
+
+    def test_campaign_quota_window_and_start(self):
+        scheduler = self.scheduler(daily_quota=0, slice_size=50)
+        queue = scheduler.queue
+        limited = queue.add('a.csv', self.template, 'A', daily_quota=30)
+        queue.add('b.csv', self.template, 'B', window='18:00-20:00')
+        queue.add('c.csv', self.template, 'C', not_before=at(16, 12).timestamp())
+        job, size, _ = scheduler.next_slice(FRIDAY)
+        self.assertEqual((job.id, size), (limited.id, 30))
+        queue.record_slice(limited.id, '2026-10-16', 30, 0)
+        # La más próxima: C empieza a las 12:00, B abre a las 18:00
+        self.assertEqual(scheduler.next_slice(FRIDAY), (None, 0, 2 * 3600))
+        self.assertEqual(scheduler.next_slice(at(16, 12))[0].subject, 'C')
+        # Las dos listas: primero la más antigua
+        self.assertEqual(scheduler.next_slice(at(16, 18))[0].subject, 'B')
+        self.assertEqual(scheduler.next_slice(at(16, 20))[0].subject, 'C')
+
+    def test_round_robin(self):
+        scheduler = self.scheduler(daily_quota=0, slice_size=10)
+        first = scheduler.queue.add('a.csv', self.template, 'A')
+        second = scheduler.queue.add('b.csv', self.template, 'B')
+        self.assertEqual(scheduler.next_slice(FRIDAY)[0].id, first.id)
+        scheduler.queue.record_slice(first.id, '2026-10-16', 10, 0)
+        self.assertEqual(scheduler.next_slice(FRIDAY)[0].id, second.id)
+        scheduler.queue.record_slice(second.id, '2026-10-16', 10, 0)
+        self.assertEqual(scheduler.next_slice(FRIDAY)[0].id, first.id)
+
+    def test_slices_send_each_recipient_once(self):
+        with SMTPSink() as sink:
+            scheduler = self.scheduler(sink.port, daily_quota=0, slice_size=3)
+            job = scheduler.queue.add(self.write_list('clientes.csv', 8), self.template, 'Ofertas')
+            scheduler._open_pool()
+            slices = 0
+            while True:
+                job, size, _ = scheduler.next_slice(FRIDAY)
+                if job is None:
+                    break
+                slices += 1
+                done = scheduler.run_slice(job, size, FRIDAY)
+                self.assertEqual(scheduler.queue.get(job.id).position, min(3 * slices, 8))
+                if done:
+                    break
+            scheduler._close_pool()
+            job = scheduler.queue.get(job.id)
+        self.assertEqual(slices, 3)
+        self.assertEqual((job.status, job.sent, job.failed), (STATUS_DONE, 8, 0))
+        self.assertEqual(sorted(sink.recipients.values()), [1] * 8)
+        self.assertEqual(scheduler.queue.used('2026-10-16'), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Pruebas de las estadísticas de campaña
+Latencia por lote en memoria constante y combinación de las estadísticas
+que devuelven los procesos de un envío por shards
+"""
+
+import pickle
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from campaign_stats import CampaignStats  # noqa: E402
+
+
+class CampaignStatsTest(unittest.TestCase):
+
+    def test_batch_latency_is_bounded(self):
+        stats = CampaignStats()
+        for i in range(10000):
+            stats.record_batch(0.001 * (i % 100), 10)
+        stats.record_batch(1.0, 0)  # lote vacío: no cuenta
+        # Solo contadores por cubo, no una muestra por lote
+        self.assertLess(len(pickle.dumps(stats)), 1024)
+        summary = stats.as_dict()
+        self.assertEqual(summary['batches'], 10000)
+        self.assertAlmostEqual(summary['batch_latency_avg'], 0.0495, places=4)
+
+    def test_merge_shards(self):
+        parts = []
+        for shard in range(3):
+            stats = CampaignStats(expected=10)
+            for i in range(10):
+                stats.record(success=i != 0, attempt=i % 2)
+                stats.record_batch(0.01 * (shard + 1), 1)
+            stats.skip()
+            # Los shards devuelven sus estadísticas a través de pickle
+            parts.append(pickle.loads(pickle.dumps(stats)))
+        merged = CampaignStats.merge(parts)
+        self.assertEqual((merged.expected, merged.sent, merged.failed, merged.skipped), (30, 27, 3, 3))
+        self.assertEqual((merged.first_try, merged.retried_success), (12, 15))
+        self.assertEqual(merged.batch_latency.count, 30)
+        self.assertEqual(merged.batch_messages, 30)
+        self.assertAlmostEqual(merged.batch_latency.max, 0.03)
+        self.assertAlmostEqual(merged.as_dict()['batch_latency_avg'], 0.02)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Pruebas del almacén columnar de contactos
+Misma depuración que RecipientIndex, reimportación solo cuando cambia el
+CSV, recorridos por dominio, shard y posición, y load_email_list devolviendo
+las filas del CSV como diccionarios
+"""
+
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from contact_store import BASE_COLUMNS, ContactStore  # noqa: E402
+from email_sender import TavoloCasaEmailSender  # noqa: E402
+from log_pipeline import configure_logging  # noqa: E402
+from recipient_index import REPORT_HEADER, RecipientIndex, shard_of  # noqa: E402
+
+ROWS = [
+    ['email', 'nombre', 'apellido', 'empresa', 'variante'],
+    ['Ana@Example.com', 'Ana', '', '', 'a'],
+    ['luis@gmail.com', 'Luis', 'Pérez', 'ACME', 'b'],
+    ['no-es-un-correo', 'X', '', '', 'a'],
+    [' ana@example.com ', '', 'López', 'Tavolo', 'b'],
+    ['LUIS@GMAIL.COM', 'Luis', '', '', 'a'],
+    ['eva@example.com', 'Eva', '', 'ACME', 'a'],
+    ['josé@correo.es', 'José Ñandú 🛏️', '', 'ACME', 'b'],
+    ['marta@gmail.com', 'Marta'],
+]
+
+
+def setUpModule():
+    stderr, sys.stderr = sys.stderr, sys.__stderr__
+    try:
+        configure_logging({'file': os.path.join(tempfile.gettempdir(), 'test_contact_store.log'),
+                           'events_file': None})
+    finally:
+        sys.stderr = stderr
+
+
+class ContactStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        self.csv_file = os.path.join(self.workdir.name, 'lista.csv')
+        self.write_rows(ROWS)
+        self.settings = {'contact_store_dir': os.path.join(self.workdir.name, 'contactos')}
+
+    def write_rows(self, rows):
+        with open(self.csv_file, 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f).writerows(rows)
+
+    def open_store(self) -> ContactStore:
+        store = ContactStore.for_csv(self.csv_file, self.settings)
+        self.addCleanup(store.close)
+        return store
+
+    def test_same_contacts_as_recipient_index(self):
+        store = self.open_store()
+        with RecipientIndex.build(self.csv_file, extra_fields=['variante']) as index:
+            expected = list(index.iter_contacts())
+            self.assertEqual((store.rows_read, store.duplicates, store.merged, store.invalid),
+                             (index.rows_read, index.duplicates, index.merged, index.invalid))
+        self.assertEqual([dict(contact) for contact in store], expected)
+        self.assertEqual(store.columns, list(BASE_COLUMNS) + ['variante'])
+
+    def test_report(self):
+        store = self.open_store()
+        with open(store.report_file, 'r', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], REPORT_HEADER)
+        self.assertEqual([row[:3] for row in rows[1:]],
+                         [['4', 'no-es-un-correo', 'invalido'], ['5', ' ana@example.com ', 'fusionado'],
+                          ['6', 'LUIS@GMAIL.COM', 'duplicado']])
+
+    def test_contact_behaves_like_a_dict(self):
+        contact = self.open_store()[3]
+        self.assertEqual(contact['email'], 'josé@correo.es')
+        self.assertEqual(contact['nombre'], 'José Ñandú 🛏️')
+        self.assertEqual(contact.get('apellido'), '')
+        self.assertIsNone(contact.get('telefono'))
+        self.assertNotIn('telefono', contact)
+        self.assertEqual(len(contact), 5)
+        with self.assertRaises(KeyError):
+            contact['telefono']
+        with self.assertRaises(IndexError):
+            self.open_store()[5]
+
+    def test_iteration_orders(self):
+        store = self.open_store()
+        emails = [contact['email'] for contact in store.iter_contacts()]
+        self.assertEqual(emails, ['Ana@Example.com', 'luis@gmail.com', 'eva@example.com',
+                                  'josé@correo.es', 'marta@gmail.com'])
+        self.assertEqual([contact['email'] for contact in store.iter_contacts(group_by_domain=True)],
+                         ['josé@correo.es', 'Ana@Example.com', 'eva@example.com',
+                          'luis@gmail.com', 'marta@gmail.com'])
+        self.assertEqual([contact['email'] for contact in store.iter_contacts(start=3)], emails[3:])
+        self.assertEqual([contact['email'] for contact in store.iter_contacts(group_by_domain=True, start=3)],
+                         ['luis@gmail.com', 'marta@gmail.com'])
+        self.assertEqual(list(store.iter_contacts(start=10)), [])
+
+    def test_shards(self):
+        store = self.open_store()
+        seen = []
+        for shard in range(3):
+            emails = [contact['email'] for contact in store.iter_contacts(shard=(shard, 3))]
+            self.assertEqual(len(emails), store.count((shard, 3)))
+            self.assertTrue(all(shard_of(email, 3) == shard for email in emails))
+            seen.extend(emails)
+        self.assertEqual(sorted(seen), sorted(contact['email'] for contact in store))
+
+    def test_reimported_only_when_csv_changes(self):
+        store = self.open_store()
+        built = os.stat(store.path).st_mtime_ns
+        store.close()
+        store = self.open_store()
+        self.assertEqual(os.stat(store.path).st_mtime_ns, built)
+        store.close()
+        time.sleep(0.01)
+        self.write_rows(ROWS + [['nuevo@example.com', 'Nuevo']])
+        store = self.open_store()
+        self.assertEqual(len(store), 6)
+        self.assertEqual(store[5]['nombre'], 'Nuevo')
+
+    def test_unreadable_store_is_rebuilt(self):
+        path = ContactStore.path_for(self.csv_file, self.settings)
+        os.makedirs(os.path.dirname(path))
+        Path(path).write_bytes(b'no es un almacen')
+        self.assertEqual(len(self.open_store()), 5)
+
+    def test_csv_without_email_column(self):
+        self.write_rows([['correo', 'nombre'], ['ana@example.com', 'Ana']])
+        with self.assertRaises(ValueError):
+            ContactStore.for_csv(self.csv_file, self.settings)
+
+
+class LoadEmailListTest(unittest.TestCase):
+
+    def test_returns_csv_rows_as_dicts(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        work = Path(workdir.name)
+        csv_file = str(work / 'lista.csv')
+        with open(csv_file, 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f).writerows(ROWS)
+        config_file = str(work / 'config.json')
+        with open(config_file, 'w', encoding='utf-8') as f:
+            json.dump({'sender_email': 'info@tavolocasa.com', 'sender_name': 'Tavolo Casa',
+                       'sender_password': '', 'smtp_server': '127.0.0.1', 'smtp_port': 25,
+                       'email_settings': {'contact_store': True,
+                                          'contact_store_dir': str(work / 'contactos')}}, f)
+        contacts = TavoloCasaEmailSender(config_file).load_email_list(csv_file)
+        # Todas las filas con "@", sin deduplicar, como diccionarios que se pueden modificar
+        self.assertEqual([contact['email'] for contact in contacts],
+                         ['Ana@Example.com', 'luis@gmail.com', 'ana@example.com', 'LUIS@GMAIL.COM',
+                          'eva@example.com', 'josé@correo.es', 'marta@gmail.com'])
+        self.assertTrue(all(type(contact) is dict for contact in contacts))
+        self.assertEqual(contacts[-1], {'email': 'marta@gmail.com', 'nombre': 'Marta',
+                                        'apellido': '', 'empresa': ''})
+        contacts[0]['nombre'] = 'Ana María'
+        # Sin efectos en disco
+        self.assertFalse((work / 'contactos').exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la ruta rápida de construcción de mensajes
+Comprueba que MessageSkeleton produce exactamente los mismos bytes que
+create_message() + as_string() con los mismos boundaries
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from email_sender import TavoloCasaEmailSender  # noqa: E402
+from html_text import html_to_text  # noqa: E402
+from inline_images import InlineImageStore  # noqa: E402
+from log_pipeline import configure_logging  # noqa: E402
+from message_builder import MessageSkeleton, to_wire  # noqa: E402
+
+SUBJECT = "🛏️ Descubre el mejor descanso con Tavolo Casa - Ofertas especiales"
+CONFIG = {
+    "sender_email": "info@tavolocasa.com",
+    "sender_name": "Tavolo Casa",
+    "sender_password": "",
+    "smtp_server": "127.0.0.1",
+    "smtp_port": 25,
+    "email_settings": {},
+}
+CONTACTS = [
+    {'email': 'ana@example.com', 'nombre': 'Ana', 'apellido': 'López', 'empresa': 'ACME'},
+    {'email': 'x' * 120 + '@example.com', 'nombre': 'José Ñandú 🛏️', 'apellido': '', 'empresa': ''},
+    # Una línea que empieza por punto no debe romper el final de DATA
+    {'email': 'b@example.com', 'nombre': '.\r\nlínea', 'apellido': '', 'empresa': ''},
+]
+
+
+def setUpModule():
+    # El logging del proceso se instala una sola vez: se hace aquí, con la
+    # consola real y sin archivos en el repositorio, antes de crear el enviador
+    stderr, sys.stderr = sys.stderr, sys.__stderr__
+    try:
+        configure_logging({'file': os.path.join(tempfile.gettempdir(), 'test_message_builder.log'),
+                           'events_file': None})
+    finally:
+        sys.stderr = stderr
+
+
+class MessageSkeletonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        config_file = os.path.join(self.workdir.name, 'config.json')
+        with open(config_file, 'w', encoding='utf-8') as f:
+            json.dump(CONFIG, f)
+        self.sender = TavoloCasaEmailSender(config_file)
+        self.template = self.sender.compile_template(
+            (ROOT / "plantilla_correo.html").read_text(encoding='utf-8'))
+
+    def write_file(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.workdir.name, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def assert_identical(self, template, attachments=(), plain_text=False, images=()):
+        """Compara la ruta rápida con la ruta MIME completa para cada contacto de prueba"""
+        attachments = list(attachments)
+        skeleton = MessageSkeleton.build(self.sender.create_message, SUBJECT, attachments,
+                                         plain_text=plain_text, inline_images=images)
+        for contact in CONTACTS:
+            with self.subTest(email=contact['email'][:20]):
+                html = self.sender.personalize_email(template, contact)
+                text = html_to_text(html) if plain_text else None
+                message = self.sender.create_message(contact['email'], SUBJECT, html, attachments,
+                                                     text, list(images) or None)
+                multiparts = [part for part in message.walk() if part.is_multipart()]
+                self.assertEqual(len(multiparts), len(skeleton.boundaries))
+                for part, boundary in zip(multiparts, skeleton.boundaries):
+                    part.set_boundary(boundary)
+                self.assertEqual(skeleton.render(contact['email'], html, text),
+                                 to_wire(message.as_string()))
+
+    def test_html_only(self):
+        self.assert_identical(self.template)
+
+    def test_text_and_html(self):
+        self.assert_identical(self.template, plain_text=True)
+
+    def test_attachments(self):
+        pdf = self.write_file('catalogo.pdf', b'%PDF-1.4\n' + bytes(range(256)) * 40)
+        notes = self.write_file('condiciones.txt', 'Envío gratuito en pedidos superiores a 50 €\n'.encode('utf-8'))
+        self.assert_identical(self.template, [pdf, notes])
+        self.assert_identical(self.template, [pdf, notes], plain_text=True)
+
+    def test_inline_images(self):
+        self.write_file('producto.jpg', b'\xff\xd8\xff\xe0' + bytes(range(256)) * 20)
+        self.write_file('logo.png', b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 4)
+        source = ('<p>Hola {{NOMBRE}}</p><img src="logo.png" alt="Tavolo Casa">'
+                  '<img src="producto.jpg" alt="Producto">')
+        html, images = InlineImageStore(max_width=0, quality=0).embed(source, self.workdir.name)
+        self.assertEqual(len(images), 2)
+        template = self.sender.compile_template(html)
+        self.assert_identical(template, images=images)
+        self.assert_identical(template, plain_text=True, images=images)
+
+    def test_inline_images_with_attachment(self):
+        self.write_file('producto.jpg', b'\xff\xd8\xff\xe0' + bytes(range(256)) * 20)
+        pdf = self.write_file('catalogo.pdf', b'%PDF-1.4\n' + bytes(range(256)) * 40)
+        html, images = InlineImageStore(max_width=0, quality=0).embed(
+            '<p>Hola {{NOMBRE}}</p><img src="producto.jpg">', self.workdir.name)
+        self.assert_identical(self.sender.compile_template(html), [pdf],
+                              plain_text=True, images=images)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la instrumentación del envío
+Perfilado con cProfile desde varios hilos, que en Python 3.12+ solo admite
+un perfil activo por proceso
+"""
+
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from metrics import ProfileHook  # noqa: E402
+
+
+def main_thread_work():
+    return sum(range(1000))
+
+
+def worker_work():
+    return sum(range(1000))
+
+
+class ProfileHookTest(unittest.TestCase):
+
+    def test_workers_under_a_profiled_main_thread(self):
+        hook = ProfileHook()
+        errors = []
+
+        def worker():
+            try:
+                hook.wrap(worker_work)()
+            except Exception as e:
+                errors.append(e)
+
+        def dispatch():
+            main_thread_work()
+            # Los hilos de trabajo se perfilan mientras el principal sigue perfilado
+            threads = [threading.Thread(target=worker) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        hook.wrap(dispatch)()
+        self.assertEqual(errors, [])
+
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        path = os.path.join(workdir.name, 'envio.prof')
+        hook.dump(path)
+        functions = {name for _, _, name in pstats.Stats(path).stats}
+        self.assertIn('main_thread_work', functions)
+        if ProfileHook.PER_THREAD:
+            self.assertIn('worker_work', functions)
+
+
+if __name__ == '__main__':
+    unittest.main()
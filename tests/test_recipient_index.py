@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Pruebas del índice de destinatarios
+Normalización, deduplicación con fusión de datos, informe de descartes,
+agrupación por dominio y reparto estable en shards
+"""
+
+import csv
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from recipient_index import (REASON_DUPLICATE, REASON_INVALID, REASON_MERGED,  # noqa: E402
+                             REPORT_HEADER, RecipientIndex, normalize_email, shard_of)
+
+ROWS = [
+    ['email', 'nombre', 'apellido', 'empresa', 'variante'],
+    ['Ana@Example.com', 'Ana', '', '', 'a'],                      # fila 2
+    ['luis@gmail.com', 'Luis', 'Pérez', 'ACME', 'b'],              # fila 3
+    ['no-es-un-correo', 'X', '', '', 'a'],                         # fila 4
+    [' ana@example.com ', '', 'López', 'Tavolo', 'b'],             # fila 5: fusiona
+    ['LUIS@GMAIL.COM', 'Luis', '', '', 'a'],                       # fila 6: duplicado
+    ['eva@example.com', 'Eva', '', '', 'a'],                       # fila 7
+    ['', '', '', '', ''],                                          # fila 8
+    ['marta@gmail.com', 'Marta', '', '', 'b'],                     # fila 9
+]
+
+
+class RecipientIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        self.csv_file = os.path.join(self.workdir.name, 'lista.csv')
+        with open(self.csv_file, 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f).writerows(ROWS)
+        self.report_file = os.path.join(self.workdir.name, 'descartados.csv')
+
+    def build(self, **kwargs) -> RecipientIndex:
+        index = RecipientIndex.build(self.csv_file, **kwargs)
+        self.addCleanup(index.close)
+        return index
+
+    def test_normalize_email(self):
+        self.assertEqual(normalize_email('  Ana@Example.COM '), 'ana@example.com')
+        for raw in (None, '', 'ana', 'ana@example', 'a b@example.com', 'a@b@example.com'):
+            self.assertIsNone(normalize_email(raw))
+
+    def test_deduplicates_and_merges(self):
+        index = self.build(report_file=self.report_file)
+        self.assertEqual((index.rows_read, index.invalid, index.duplicates, index.merged), (8, 2, 2, 1))
+        contacts = list(index.iter_contacts())
+        self.assertEqual([contact['email'] for contact in contacts],
+                         ['Ana@Example.com', 'luis@gmail.com', 'eva@example.com', 'marta@gmail.com'])
+        # El duplicado completa los campos vacíos de la fila conservada, sin pisar los demás
+        self.assertEqual(contacts[0], {'email': 'Ana@Example.com', 'nombre': 'Ana',
+                                       'apellido': 'López', 'empresa': 'Tavolo'})
+        self.assertEqual(contacts[1]['apellido'], 'Pérez')
+
+    def test_report(self):
+        self.build(report_file=self.report_file)
+        with open(self.report_file, 'r', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], REPORT_HEADER)
+        self.assertEqual(rows[1:], [
+            ['4', 'no-es-un-correo', REASON_INVALID, '', ''],
+            ['5', ' ana@example.com ', REASON_MERGED, 'ana@example.com', '2'],
+            ['6', 'LUIS@GMAIL.COM', REASON_DUPLICATE, 'luis@gmail.com', '3'],
+            ['8', '', REASON_INVALID, '', ''],
+        ])
+
+    def test_group_by_domain(self):
+        index = self.build()
+        self.assertEqual(index.domains(), [('example.com', 2), ('gmail.com', 2)])
+        self.assertEqual([contact['email'] for contact in index.iter_contacts(group_by_domain=True, fetch_size=1)],
+                         ['Ana@Example.com', 'eva@example.com', 'luis@gmail.com', 'marta@gmail.com'])
+
+    def test_extra_fields(self):
+        index = self.build(extra_fields=['variante'])
+        self.assertEqual([contact['variante'] for contact in index.iter_contacts()], ['a', 'b', 'a', 'b'])
+
+    def test_shards_split_the_list(self):
+        emails = set()
+        for shard in range(3):
+            index = self.build(shard=(shard, 3))
+            shard_emails = [contact['email'] for contact in index.iter_contacts()]
+            self.assertTrue(all(shard_of(email, 3) == shard for email in shard_emails))
+            # Las filas inválidas solo se cuentan en el primer shard
+            self.assertEqual(index.invalid, 2 if shard == 0 else 0)
+            emails.update(shard_emails)
+        self.assertEqual(len(emails), 4)
+        # Las variantes de una misma dirección caen en el mismo shard
+        self.assertEqual(shard_of('Ana@Example.com', 3), shard_of(' ana@example.com', 3))
+
+    def test_temporary_index_is_removed(self):
+        index = RecipientIndex.build(self.csv_file)
+        path = index.path
+        self.assertTrue(os.path.exists(path))
+        index.close()
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
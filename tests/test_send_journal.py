@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Pruebas del diario de envíos
+Carga de entregados al reabrir (también desde un offset), volcado por
+bloques, combinación de diarios de shards y diario de simulación
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from send_journal import (STATUS_FAILED, STATUS_SENT, DryRunJournal,  # noqa: E402
+                          SendJournal, make_campaign_id)
+
+
+class SendJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        self.path = os.path.join(self.workdir.name, 'journals', 'campana.jsonl')
+
+    def entries(self, path=None):
+        with open(path or self.path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_reopen_loads_delivered(self):
+        with SendJournal(self.path) as journal:
+            journal.start('campana')
+            journal.record('Ana@Example.com', STATUS_SENT)
+            journal.record('luis@example.com', STATUS_FAILED, error='timeout')
+            journal.record('eva@example.com', STATUS_FAILED)
+            journal.record('eva@example.com', STATUS_SENT)
+        with SendJournal(self.path) as journal:
+            self.assertEqual(journal.delivered_count, 2)
+            self.assertTrue(journal.is_delivered(' ana@example.com '))
+            self.assertTrue(journal.is_delivered('eva@example.com'))
+            self.assertFalse(journal.is_delivered('luis@example.com'))
+            self.assertTrue(journal.is_failed('luis@example.com'))
+            # Un fallo posterior no anula una entrega
+            journal.record('ana@example.com', STATUS_FAILED)
+            self.assertFalse(journal.is_failed('ana@example.com'))
+            self.assertTrue(journal.is_delivered('ana@example.com'))
+
+    def test_records_are_buffered_until_batch_or_flush(self):
+        journal = SendJournal(self.path, fsync_interval=3600, fsync_batch=3)
+        self.addCleanup(journal.close)
+        journal.record('a@example.com', STATUS_SENT)
+        journal.record('b@example.com', STATUS_SENT)
+        self.assertEqual(self.entries(), [])
+        journal.record('c@example.com', STATUS_SENT)
+        self.assertEqual([entry['email'] for entry in self.entries()],
+                         ['a@example.com', 'b@example.com', 'c@example.com'])
+        journal.record('d@example.com', STATUS_FAILED, error='550')
+        journal.flush()
+        self.assertEqual(self.entries()[-1]['error'], '550')
+
+    def test_truncated_last_line_is_ignored(self):
+        with SendJournal(self.path) as journal:
+            journal.record('a@example.com', STATUS_SENT)
+        # Caída a mitad de escritura
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('{"email": "b@example.com", "sta')
+        with SendJournal(self.path) as journal:
+            self.assertEqual(journal.delivered_count, 1)
+            journal.record('c@example.com', STATUS_SENT)
+        with SendJournal(self.path) as journal:
+            self.assertTrue(journal.is_delivered('c@example.com'))
+            self.assertFalse(journal.is_delivered('b@example.com'))
+
+    def test_offset_skips_earlier_records(self):
+        with SendJournal(self.path) as journal:
+            journal.record('a@example.com', STATUS_SENT)
+        offset = os.path.getsize(self.path)
+        with SendJournal(self.path) as journal:
+            journal.record('b@example.com', STATUS_SENT)
+        with SendJournal(self.path, offset=offset) as journal:
+            self.assertFalse(journal.is_delivered('a@example.com'))
+            self.assertTrue(journal.is_delivered('b@example.com'))
+
+    def test_merge_from_shard(self):
+        shard = os.path.join(self.workdir.name, 'journals', 'campana.shard1.jsonl')
+        with SendJournal(shard) as journal:
+            journal.start('campana', shard=1)
+            journal.record('a@example.com', STATUS_SENT)
+            journal.record('b@example.com', STATUS_FAILED)
+        with open(shard, 'a', encoding='utf-8') as f:
+            f.write('{"email": "c@exa')
+        with SendJournal(self.path) as journal:
+            journal.record('z@example.com', STATUS_SENT)
+            self.assertEqual(journal.merge_from(shard), 3)
+            self.assertTrue(journal.is_delivered('a@example.com'))
+            self.assertTrue(journal.is_failed('b@example.com'))
+        self.assertEqual([entry.get('email') for entry in self.entries()],
+                         ['z@example.com', None, 'a@example.com', 'b@example.com'])
+        with SendJournal(self.path) as journal:
+            self.assertEqual(journal.delivered_count, 2)
+
+    def test_paths_for_campaign(self):
+        settings = {'journal_dir': os.path.join(self.workdir.name, 'journals'), 'journal_fsync_batch': 1}
+        campaign_id = make_campaign_id('lista_correos.csv', 'plantilla_correo.html', 'Ofertas')
+        self.assertEqual(campaign_id, make_campaign_id('lista_correos.csv', 'plantilla_correo.html', 'Ofertas'))
+        self.assertNotEqual(campaign_id, make_campaign_id('lista_correos.csv', 'plantilla_correo.html', 'Otra'))
+        self.assertTrue(campaign_id.startswith('lista_correos-'))
+        with SendJournal.for_campaign(campaign_id, settings) as journal:
+            journal.record('a@example.com', STATUS_SENT)
+            self.assertEqual(len(self.entries(journal.path)), 1)
+        for shard in (1, 0):
+            SendJournal(os.path.join(settings['journal_dir'], f'{campaign_id}.shard{shard}.jsonl')).close()
+        self.assertEqual([os.path.basename(path) for path in SendJournal.shard_paths(campaign_id, settings)],
+                         [f'{campaign_id}.shard0.jsonl', f'{campaign_id}.shard1.jsonl'])
+
+    def test_dry_run_reads_but_never_writes(self):
+        with SendJournal(self.path) as journal:
+            journal.record('a@example.com', STATUS_SENT)
+        before = Path(self.path).read_bytes()
+        journal = DryRunJournal(self.path)
+        self.assertTrue(journal.is_delivered('a@example.com'))
+        journal.start('campana', dry_run=True)
+        journal.record('b@example.com', STATUS_SENT)
+        journal.flush()
+        journal.close()
+        self.assertEqual(Path(self.path).read_bytes(), before)
+        # Sin diario previo tampoco crea el archivo
+        missing = os.path.join(self.workdir.name, 'journals', 'nueva.jsonl')
+        DryRunJournal(missing).record('a@example.com', STATUS_SENT)
+        self.assertFalse(os.path.exists(missing))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la reanudación de campañas repartidas en procesos
+Si un shard (o el coordinador) muere a mitad de campaña, --resume no debe
+volver a enviar a quien ya recibió el correo
+"""
+
+import csv
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from email_sender import TavoloCasaEmailSender  # noqa: E402
+from log_pipeline import configure_logging  # noqa: E402
+from send_journal import SendJournal, make_campaign_id  # noqa: E402
+from smtp_sink import SMTPSink  # noqa: E402
+
+CONTACTS = 40
+HOLD_AFTER = 12
+
+# Coordinador en un proceso aparte, para poder matar sus procesos de trabajo
+COORDINATOR = """
+import sys
+sys.path.insert(0, {root!r})
+from sharded_runner import ShardedCampaign
+ShardedCampaign({config!r}, workers=2).run({csv!r}, {template!r}, 'Prueba', delay_seconds=0)
+"""
+
+
+def setUpModule():
+    stderr, sys.stderr = sys.stderr, sys.__stderr__
+    try:
+        configure_logging({'file': os.path.join(tempfile.gettempdir(), 'test_sharded_runner.log'),
+                           'events_file': None})
+    finally:
+        sys.stderr = stderr
+
+
+class HoldingSink(SMTPSink):
+    """Sumidero que, tras hold_after mensajes, deja de confirmar el final de DATA"""
+
+    def __init__(self, hold_after: int, **kwargs):
+        super().__init__(**kwargs)
+        self.hold_after = hold_after
+        self.holding = threading.Event()
+        self.admitted = 0
+
+    async def _data(self, reader, writer, envelope):
+        # Se cuenta antes de leer el mensaje: dos conexiones no pueden pasar a la vez del límite
+        if self.admitted < self.hold_after:
+            self.admitted += 1
+            return await super()._data(reader, writer, envelope)
+        # El mensaje no se confirma: el cliente espera la respuesta hasta que lo matan
+        self.holding.set()
+        while await reader.readline():
+            pass
+        return False
+
+
+def children(pid: int):
+    """Procesos hijos de pid (Linux, a partir de /proc)"""
+    found = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                parent = int(f.read().rsplit(b')', 1)[1].split()[1])
+            with open(f'/proc/{entry}/cmdline', 'rb') as f:
+                cmdline = f.read()
+        except (OSError, ValueError, IndexError):
+            continue
+        if parent == pid:
+            found.append((int(entry), cmdline))
+    return found
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "usa /proc para encontrar los procesos de trabajo")
+class ShardedResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        work = Path(self.workdir.name)
+        self.csv_file = str(work / 'contactos.csv')
+        with open(self.csv_file, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['email', 'nombre'])
+            for i in range(CONTACTS):
+                writer.writerow([f'cliente{i}@example.com', f'Cliente {i}'])
+        self.template = str(work / 'plantilla.html')
+        Path(self.template).write_text('<p>Hola {{NOMBRE}}</p>', encoding='utf-8')
+        self.settings = {
+            'journal_dir': str(work / 'journals'),
+            'contact_store_dir': str(work / 'contactos'),
+            # Cada resultado llega al diario en cuanto se conoce
+            'journal_fsync_batch': 1,
+            'batch_size': 1,
+            'concurrency': 1,
+            'rate_limits': {},
+        }
+        self.campaign_id = make_campaign_id(self.csv_file, self.template, 'Prueba')
+
+    def write_config(self, port: int) -> str:
+        config_file = str(Path(self.workdir.name) / 'config.json')
+        with open(config_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'sender_email': 'info@tavolocasa.com', 'sender_name': 'Tavolo Casa',
+                'sender_password': '', 'smtp_server': '127.0.0.1', 'smtp_port': port,
+                'smtp_starttls': False, 'email_settings': self.settings,
+                'logging': {'file': str(Path(self.workdir.name) / 'email_log.log'), 'events_file': None},
+            }, f)
+        return config_file
+
+    def interrupted_run(self, kill_coordinator: bool) -> SMTPSink:
+        """Lanza la campaña con 2 procesos y la interrumpe con envíos a medias"""
+        sink = HoldingSink(HOLD_AFTER)
+        sink.start()
+        self.addCleanup(sink.stop)
+        config_file = self.write_config(sink.port)
+        script = COORDINATOR.format(root=str(ROOT), config=config_file,
+                                    csv=self.csv_file, template=self.template)
+        coordinator = subprocess.Popen([sys.executable, '-c', script], cwd=self.workdir.name,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.addCleanup(coordinator.kill)
+        self.assertTrue(sink.holding.wait(60), "la campaña no llegó a enviar")
+        # Los dos procesos quedan esperando la confirmación de su siguiente mensaje
+        time.sleep(1)
+        workers = [pid for pid, cmdline in children(coordinator.pid)
+                   if b'spawn_main' in cmdline and b'resource_tracker' not in cmdline]
+        self.assertEqual(len(workers), 2)
+        if kill_coordinator:
+            os.kill(coordinator.pid, signal.SIGKILL)
+            for pid in workers:
+                os.kill(pid, signal.SIGKILL)
+        else:
+            os.kill(workers[0], signal.SIGKILL)
+        self.assertNotEqual(coordinator.wait(60), 0)
+        return sink
+
+    def resume(self) -> SMTPSink:
+        """Reanuda la campaña en un solo proceso"""
+        sink = SMTPSink()
+        sink.start()
+        self.addCleanup(sink.stop)
+        sender = TavoloCasaEmailSender(self.write_config(sink.port))
+        sender.send_bulk_emails(self.csv_file, self.template, 'Prueba', delay_seconds=0,
+                                resume=True, show_summary=False)
+        return sink
+
+    def assert_each_once(self, first: SMTPSink, second: SMTPSink):
+        delivered = first.recipients + second.recipients
+        self.assertEqual(first.messages, HOLD_AFTER)
+        self.assertEqual(second.messages, CONTACTS - HOLD_AFTER)
+        self.assertEqual([email for email, count in delivered.items() if count > 1], [])
+        self.assertEqual(len(delivered), CONTACTS)
+
+    def test_killed_shard_is_merged_and_not_resent(self):
+        first = self.interrupted_run(kill_coordinator=False)
+        # El coordinador combina los diarios aunque un shard haya fallado
+        self.assertEqual(SendJournal.shard_paths(self.campaign_id, self.settings), [])
+        self.assert_each_once(first, self.resume())
+
+    def test_leftover_shard_journals_are_read_on_resume(self):
+        first = self.interrupted_run(kill_coordinator=True)
+        self.assertTrue(SendJournal.shard_paths(self.campaign_id, self.settings))
+        self.assert_each_once(first, self.resume())
+        self.assertEqual(SendJournal.shard_paths(self.campaign_id, self.settings), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Pruebas del pool de sesiones SMTP
+Reconexión transparente cuando la sesión cae antes de enviar el contenido, y
+ningún reenvío cuando cae después del final de DATA (el servidor puede haber
+aceptado ya el mensaje)
+"""
+
+import csv
+import json
+import os
+import socket
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from email_sender import TavoloCasaEmailSender  # noqa: E402
+from log_pipeline import configure_logging  # noqa: E402
+from retry_queue import TRANSIENT, classify_error  # noqa: E402
+from smtp_pool import DeliveryUncertain, SMTPConnectionPool  # noqa: E402
+from smtp_sink import SMTPSink  # noqa: E402
+
+MESSAGE = b"Subject: Prueba\r\n\r\n.linea con punto\r\nHola\r\n"
+
+
+def setUpModule():
+    stderr, sys.stderr = sys.stderr, sys.__stderr__
+    try:
+        configure_logging({'file': os.path.join(tempfile.gettempdir(), 'test_smtp_pool.log'),
+                           'events_file': None})
+    finally:
+        sys.stderr = stderr
+
+
+class SilentSink(SMTPSink):
+    """
+    Sumidero que recibe entero el contenido de los primeros mensajes pero no
+    responde al final de DATA: los acepta en silencio y corta (o deja colgada)
+    la conexión
+    """
+
+    def __init__(self, silent: int = 1, hang: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.silent = silent
+        self.hang = hang
+        self.received = 0
+
+    async def _data(self, reader, writer, envelope):
+        if self.received >= self.silent:
+            self.received += 1
+            return await super()._data(reader, writer, envelope)
+        self.received += 1
+        while await reader.readline() != b'.\r\n':
+            pass
+        # Aceptado, pero la respuesta no llega nunca
+        self.messages += 1
+        self.recipients.update(envelope)
+        if self.hang:
+            # Hasta que el cliente se canse de esperar
+            await reader.read()
+        return False
+
+
+def pool_config(port: int) -> dict:
+    return {'sender_email': 'info@tavolocasa.com', 'sender_password': '',
+            'smtp_server': '127.0.0.1', 'smtp_port': port, 'smtp_starttls': False}
+
+
+class PoolSendmailTest(unittest.TestCase):
+
+    def test_reconnects_when_session_drops_before_data(self):
+        with SMTPSink() as sink, SMTPConnectionPool(pool_config(sink.port)) as pool:
+            pool.sendmail('info@tavolocasa.com', 'ana@example.com', MESSAGE)
+            # La sesión inactiva se cae sin que el pool lo sepa
+            pool._sessions[0].server.sock.shutdown(socket.SHUT_RDWR)
+            pool.sendmail('info@tavolocasa.com', 'luis@example.com', MESSAGE.decode('ascii'))
+        self.assertEqual(pool.reconnections, 1)
+        self.assertEqual(dict(sink.recipients), {'ana@example.com': 1, 'luis@example.com': 1})
+
+    def test_disconnect_after_data_is_not_resent(self):
+        with SilentSink() as sink, SMTPConnectionPool(pool_config(sink.port)) as pool:
+            with self.assertRaises(DeliveryUncertain) as raised:
+                pool.sendmail('info@tavolocasa.com', 'ana@example.com', MESSAGE)
+            self.assertEqual(classify_error(raised.exception), TRANSIENT)
+            # La sesión se descarta y la siguiente va por una conexión nueva
+            pool.sendmail('info@tavolocasa.com', 'luis@example.com', MESSAGE)
+        self.assertEqual(sink.received, 2)
+        self.assertEqual(dict(sink.recipients), {'ana@example.com': 1, 'luis@example.com': 1})
+
+    def test_timeout_after_data_is_not_resent(self):
+        with SilentSink(hang=True) as sink, SMTPConnectionPool(pool_config(sink.port), timeout=0.3) as pool:
+            with self.assertRaises(DeliveryUncertain) as raised:
+                pool.sendmail('info@tavolocasa.com', 'ana@example.com', MESSAGE)
+            self.assertIn('timed out', str(raised.exception))
+        self.assertEqual(sink.received, 1)
+        self.assertEqual(sink.connections, 1)
+
+    def test_refusals_are_not_session_errors(self):
+        with SMTPSink(error_rate=1.0) as sink, SMTPConnectionPool(pool_config(sink.port)) as pool:
+            with self.assertRaises(Exception) as raised:
+                pool.sendmail('info@tavolocasa.com', 'ana@example.com', MESSAGE)
+        self.assertEqual(getattr(raised.exception, 'smtp_code', None), 451)
+        self.assertEqual(pool.reconnections, 0)
+
+
+class PoolSendBatchTest(unittest.TestCase):
+
+    def send_batch(self, sink: SMTPSink) -> list:
+        messages = [(f'cliente{i}@example.com', MESSAGE) for i in range(3)]
+        with SMTPConnectionPool(pool_config(sink.port)) as pool:
+            return pool.send_batch('info@tavolocasa.com', messages)
+
+    def test_pipelined_message_without_reply_is_uncertain(self):
+        with SilentSink(silent=2) as sink:
+            results = self.send_batch(sink)
+            self.assertEqual(sink.received, 1)
+        self.assertIsInstance(results[0], DeliveryUncertain)
+        # Los siguientes no llegaron a enviarse
+        self.assertNotIsInstance(results[1], DeliveryUncertain)
+        self.assertTrue(all(classify_error(error) == TRANSIENT for error in results))
+
+    def test_sequential_message_without_reply_is_uncertain(self):
+        with SilentSink(pipelining=False) as sink:
+            results = self.send_batch(sink)
+        self.assertIsInstance(results[0], DeliveryUncertain)
+        self.assertNotIsInstance(results[1], DeliveryUncertain)
+        self.assertEqual(sink.received, 1)
+
+
+class CampaignRetryTest(unittest.TestCase):
+
+    def test_uncertain_delivery_goes_through_the_retry_queue(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        work = Path(workdir.name)
+        csv_file = str(work / 'lista.csv')
+        with open(csv_file, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['email', 'nombre'])
+            for i in range(4):
+                writer.writerow([f'cliente{i}@example.com', f'Cliente {i}'])
+        template = str(work / 'plantilla.html')
+        Path(template).write_text('<p>Hola {{NOMBRE}}</p>', encoding='utf-8')
+        with SilentSink(pipelining=False) as sink:
+            config_file = str(work / 'config.json')
+            with open(config_file, 'w', encoding='utf-8') as f:
+                json.dump({**pool_config(sink.port), 'sender_name': 'Tavolo Casa',
+                           'email_settings': {'journal_dir': str(work / 'journals'), 'rate_limits': {},
+                                              'retry_base_delay': 0.05}}, f)
+            sender = TavoloCasaEmailSender(config_file)
+            result = sender.send_bulk_emails(csv_file, template, 'Prueba', delay_seconds=0,
+                                             show_summary=False)
+        # El mensaje sin respuesta se reintenta desde la cola, no desde el pool
+        self.assertEqual(result['sent'], 4)
+        self.assertEqual(sender.metrics.counters.get('retries'), 1)
+        self.assertEqual(sink.received, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la lista de supresión
+Altas, bajas e importación, filtrado por bloques de los contactos de una
+campaña y exclusión de los suprimidos en un envío simulado
+"""
+
+import csv
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from email_sender import TavoloCasaEmailSender  # noqa: E402
+from log_pipeline import configure_logging  # noqa: E402
+from suppression import REASON_BOUNCE, REASON_MANUAL, REASON_UNSUBSCRIBE, SuppressionList  # noqa: E402
+
+
+def setUpModule():
+    stderr, sys.stderr = sys.stderr, sys.__stderr__
+    try:
+        configure_logging({'file': os.path.join(tempfile.gettempdir(), 'test_suppression.log'),
+                           'events_file': None})
+    finally:
+        sys.stderr = stderr
+
+
+class SuppressionListTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        self.path = os.path.join(self.workdir.name, 'suppression.sqlite')
+        self.suppression = SuppressionList(self.path)
+        self.addCleanup(self.suppression.close)
+
+    def write_csv(self, name: str, rows) -> str:
+        path = os.path.join(self.workdir.name, name)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f).writerows(rows)
+        return path
+
+    def test_add_and_remove(self):
+        self.suppression.add(' Ana@Example.com ', REASON_UNSUBSCRIBE, 'web')
+        self.assertIn('ana@example.com', self.suppression)
+        self.assertIn('ANA@example.com', self.suppression)
+        self.assertEqual(self.suppression.reason('ana@example.com'), REASON_UNSUBSCRIBE)
+        # Volver a añadirla actualiza el motivo
+        self.suppression.add('ana@example.com', REASON_BOUNCE, 'rebote 5.1.1')
+        self.assertEqual(len(self.suppression), 1)
+        self.assertEqual([entry[:3] for entry in self.suppression.entries()],
+                         [('ana@example.com', REASON_BOUNCE, 'rebote 5.1.1')])
+        self.assertTrue(self.suppression.remove('Ana@example.com'))
+        self.assertFalse(self.suppression.remove('ana@example.com'))
+        self.assertNotIn('ana@example.com', self.suppression)
+        self.assertIsNone(self.suppression.reason('ana@example.com'))
+
+    def test_persists_across_connections(self):
+        self.suppression.add_many(['a@example.com', '', '  ', 'b@example.com'])
+        with SuppressionList(self.path) as other:
+            self.assertEqual(len(other), 2)
+            self.assertEqual(other.reason('b@example.com'), REASON_MANUAL)
+
+    def test_import_csv(self):
+        with_header = self.write_csv('bajas.csv', [['nombre', 'Email'], ['Ana', 'ana@example.com'],
+                                                   ['Luis'], ['Eva', 'EVA@example.com']])
+        self.assertEqual(self.suppression.import_csv(with_header), 2)
+        without_header = self.write_csv('sin_cabecera.csv', [['luis@example.com'], ['marta@example.com']])
+        self.assertEqual(self.suppression.import_csv(without_header, REASON_BOUNCE), 2)
+        self.assertEqual(self.suppression.suppressed_among(
+            ['ana@example.com', 'Eva@Example.com', 'luis@example.com', 'otro@example.com']),
+            {'ana@example.com', 'eva@example.com', 'luis@example.com'})
+        self.assertEqual(self.suppression.reason('luis@example.com'), REASON_BOUNCE)
+
+    def test_filter_contacts_in_blocks(self):
+        contacts = [{'email': f'cliente{i}@example.com'} for i in range(25)]
+        self.suppression.add_many([f'CLIENTE{i}@example.com' for i in range(0, 25, 4)])
+        excluded = []
+        kept = list(self.suppression.filter_contacts(iter(contacts), on_suppressed=excluded.append,
+                                                     chunk_size=6))
+        self.assertEqual([contact['email'] for contact in excluded],
+                         [f'cliente{i}@example.com' for i in range(0, 25, 4)])
+        # Se conserva el orden original
+        self.assertEqual(kept, [contact for i, contact in enumerate(contacts) if i % 4])
+
+    def test_lookup_larger_than_one_query(self):
+        emails = [f'c{i}@example.com' for i in range(1200)]
+        self.suppression.add_many(emails[::2])
+        self.assertEqual(len(self.suppression.suppressed_among(emails)), 600)
+
+
+class CampaignSuppressionTest(unittest.TestCase):
+
+    def test_suppressed_contacts_are_not_sent(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        work = Path(workdir.name)
+        csv_file = str(work / 'lista.csv')
+        with open(csv_file, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['email', 'nombre'])
+            for i in range(10):
+                writer.writerow([f'cliente{i}@example.com', f'Cliente {i}'])
+        template = str(work / 'plantilla.html')
+        Path(template).write_text('<p>Hola {{NOMBRE}}</p>', encoding='utf-8')
+        settings = {'suppression_db': str(work / 'suppression.sqlite'),
+                    'journal_dir': str(work / 'journals'), 'rate_limits': {}}
+        with SuppressionList(settings['suppression_db']) as suppression:
+            suppression.add_many(['Cliente3@example.com', 'cliente7@example.com'], REASON_UNSUBSCRIBE)
+        config_file = str(work / 'config.json')
+        with open(config_file, 'w', encoding='utf-8') as f:
+            json.dump({'sender_email': 'info@tavolocasa.com', 'sender_name': 'Tavolo Casa',
+                       'sender_password': '', 'smtp_server': '127.0.0.1', 'smtp_port': 25,
+                       'email_settings': settings}, f)
+        rendered = work / 'salida'
+        result = TavoloCasaEmailSender(config_file).send_bulk_emails(
+            csv_file, template, 'Prueba', delay_seconds=0, render_to=str(rendered), show_summary=False)
+        self.assertEqual(result['suppressed'], 2)
+        recipients = {path.read_text(encoding='utf-8').split('To: ', 1)[1].split('\n', 1)[0].strip()
+                      for path in rendered.iterdir()}
+        self.assertEqual(len(recipients), 8)
+        self.assertFalse(recipients & {'cliente3@example.com', 'cliente7@example.com'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Pruebas del registro de plantillas
+Reutilización de renders, caché LRU acotada en número y en bytes, y
+recompilación cuando la plantilla cambia en disco
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from template_registry import TemplateRegistry  # noqa: E402
+
+
+def contact(name: str, company: str = '') -> dict:
+    return {'email': f'{name.lower()}@example.com', 'nombre': name, 'apellido': '', 'empresa': company}
+
+
+class TemplateRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        self.path = os.path.join(self.workdir.name, 'plantilla.html')
+        Path(self.path).write_text('<p>Hola {{NOMBRE}}</p>', encoding='utf-8')
+
+    def stats(self, registry: TemplateRegistry) -> dict:
+        return registry.cache_stats()[self.path]
+
+    def test_identical_contacts_reuse_the_render(self):
+        registry = TemplateRegistry(check_interval=-1)
+        self.assertEqual(registry.render(self.path, contact('Ana')), '<p>Hola Ana</p>')
+        self.assertEqual(registry.render(self.path, contact('Ana', 'ACME')), '<p>Hola Ana</p>')
+        self.assertEqual(registry.render(self.path, contact('Luis')), '<p>Hola Luis</p>')
+        self.assertEqual({key: self.stats(registry)[key] for key in ('hits', 'misses')},
+                         {'hits': 1, 'misses': 2})
+
+    def test_least_recently_used_is_evicted(self):
+        registry = TemplateRegistry(check_interval=-1, cache_size=2)
+        registry.render(self.path, contact('Ana'))
+        registry.render(self.path, contact('Luis'))
+        registry.render(self.path, contact('Ana'))   # Ana pasa a ser la más reciente
+        registry.render(self.path, contact('Eva'))   # expulsa a Luis
+        registry.render(self.path, contact('Ana'))
+        self.assertEqual(self.stats(registry)['evictions'], 1)
+        self.assertEqual(self.stats(registry)['hits'], 2)
+        registry.render(self.path, contact('Luis'))
+        self.assertEqual(self.stats(registry)['misses'], 4)
+
+    def test_cache_is_bounded_in_bytes(self):
+        Path(self.path).write_text('<p>{{NOMBRE}}</p>' + 'x' * 1000, encoding='utf-8')
+        # Caben tres renders de ~1 KB
+        registry = TemplateRegistry(check_interval=-1, cache_size=1000, cache_mb=3.5 / 1024)
+        for i in range(10):
+            registry.render(self.path, contact(f'Cliente{i}'))
+        self.assertEqual(self.stats(registry)['evictions'], 7)
+        registry.render(self.path, contact('Cliente9'))
+        registry.render(self.path, contact('Cliente0'))
+        self.assertEqual(self.stats(registry)['hits'], 1)
+
+    def test_no_cache(self):
+        registry = TemplateRegistry(check_interval=-1, cache_size=0)
+        for _ in range(3):
+            registry.render(self.path, contact('Ana'))
+        self.assertEqual(self.stats(registry)['hits'], 0)
+
+    def test_reload_discards_cached_renders(self):
+        registry = TemplateRegistry(check_interval=0)
+        self.assertEqual(registry.render(self.path, contact('Ana')), '<p>Hola Ana</p>')
+        Path(self.path).write_text('<p>Buenos días {{NOMBRE}}</p>', encoding='utf-8')
+        os.utime(self.path, ns=(0, 10 ** 18))
+        self.assertEqual(registry.render(self.path, contact('Ana')), '<p>Buenos días Ana</p>')
+        self.assertEqual(self.stats(registry)['reloads'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()